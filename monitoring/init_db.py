@@ -41,11 +41,31 @@ def create_table():
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     );
     """)
+
+    # One row per pipeline stage (embed, vector_search, rerank, answer_cache, llm, ingest_*) of a sampled request
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS request_spans (
+        id SERIAL PRIMARY KEY,
+        trace_id TEXT NOT NULL,
+        span_id TEXT NOT NULL,
+        parent_id TEXT,
+        stage TEXT NOT NULL,
+        started_at TIMESTAMPTZ NOT NULL,
+        duration_ms FLOAT NOT NULL,
+        queue_ms FLOAT,
+        tokens_in INTEGER,
+        tokens_out INTEGER,
+        cache_hit BOOLEAN,
+        status TEXT,
+        attributes JSONB
+    );
+    CREATE INDEX IF NOT EXISTS request_spans_stage_started_at ON request_spans (stage, started_at);
+    """)
     
     conn.commit()
     cursor.close()
     conn.close()
-    print("Table created successfully.")
+    print("Tables created successfully.")
 
 if __name__ == '__main__':
     wait_for_postgres()
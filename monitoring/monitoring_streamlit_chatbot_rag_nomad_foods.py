@@ -1,79 +1,73 @@
-import json
-import numpy as np
-import faiss
-from sentence_transformers import SentenceTransformer
-import mistralai
-from mistralai import Mistral
 import os
-import psycopg2
+import sys
 import streamlit as st
 from PIL import Image
 import time
 
-# Function to insert feedback into PostgreSQL
+# The shared RAG helpers live in the repository root, one level up
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from rag_nomad_foods_batching_encoder import get_query_encoder
+from rag_nomad_foods_doc_store import MissingDocumentsError, attach_documents
+from rag_nomad_foods_embedding_cache import EmbeddingCache
+from rag_nomad_foods_encoder import embedding_dimension, encoder_name
+from rag_nomad_foods_ingestion import ingest_faq
+from rag_nomad_foods_llm_client import get_llm_client
+from rag_nomad_foods_session import (
+    init_request_state, submit_query, next_pending, complete_request, fail_request,
+    completed_requests, record_feedback
+)
+from rag_nomad_foods_telemetry import MONITORING_BACKEND, get_telemetry_writer
+from rag_nomad_foods_tracing import enable_span_export, span, start_span
+from rag_nomad_foods_vector_store import EncoderMismatchError, check_index_encoder, open_local_vector_store
+
+# Per-stage spans go to the request_spans table, next to the feedback
+enable_span_export(os.getenv("TRACE_BACKEND") or MONITORING_BACKEND)
+
+# Queue feedback for the background writer (pooled connections, batched inserts) instead of blocking the UI
 def insert_feedback(user_query, thumbs_up, thumbs_down, relevant, model_used, response_time):
-    conn = psycopg2.connect(
-        dbname='monitoring_db',
-        user='postgres',
-        password='example',
-        host='localhost',  
-        port='5432'
-    )
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO feedback (user_query, thumbs_up, thumbs_down, relevant, model_used, response_time)
-        VALUES (%s, %s, %s, %s, %s, %s)
-    """, (user_query, thumbs_up, thumbs_down, relevant, model_used, response_time))
-    conn.commit()
-    cursor.close()
-    conn.close()
-
-# 1. Read Data from JSON File
-with open('../faq_data.json', 'r') as file:
-    qa_data = json.load(file)
-
-# 2. Load the embedding model
-model = SentenceTransformer("all-mpnet-base-v2")
-
-# 3. Create FAISS index
-embedding_dim = 768  # Dimensionality of embeddings from the model
-faiss_index = faiss.IndexFlatL2(embedding_dim)  # L2 distance for similarity search
-
-# Store questions and embeddings
-questions = []
-embeddings = []
-
-# 4. Generate embeddings and add them to the FAISS index
-for category in qa_data['faq_data']:  # Iterate over categories
-    for qa in category['questions']:  # Iterate over questions in each category
-        question = qa['question']
-        embedding = model.encode(question)  # Generate vector embedding
-        
-        questions.append({"question": question, "answer": qa['answer']})
-        embeddings.append(embedding)
+    return get_telemetry_writer('feedback').submit((user_query, thumbs_up, thumbs_down, relevant, model_used, response_time))
 
-# Convert embeddings to numpy array and add to FAISS index
-embedding_matrix = np.array(embeddings)
-faiss_index.add(embedding_matrix)
+# 1. Load the embedding model, once per process and on first use rather than at import; concurrent sessions' queries are micro-batched
+@st.cache_resource(show_spinner=False)
+def get_model():
+    return get_query_encoder()
 
-# 5. Function to search for the most similar question using FAISS
-def search_similar_question(prompt):
-    query_vector = model.encode(prompt)  # Convert user prompt to vector
-    query_vector = np.array([query_vector]).astype('float32')
+# 2. Open the FAISS index persisted on disk (memory-mapped), seeding it from the FAQ file on the first run
+@st.cache_resource(show_spinner=False)
+def get_faiss_store():
+    directory = os.getenv("VECTOR_STORE_DIR", "vector_store")
+    faiss_store = open_local_vector_store("faiss", directory)
+    try:
+        check_index_encoder(faiss_store, encoder_name(), embedding_dimension())
+    except EncoderMismatchError as e:
+        # Written by another encoder: re-embed it rather than compare vectors from two embedding spaces
+        print(f"{e}; rebuilding it")
+        faiss_store.delete(delete_all=True)
+    if faiss_store.describe_index_stats()["total_vector_count"] == 0:
+        ingest_faq(faiss_store, EmbeddingCache(get_model(), encoder_name()), '../faq_data.json')
+    # Attached once the vectors are final: only a document store covering all of their ids is used
+    return attach_documents(faiss_store, directory, '../faq_data.json')
 
-    # Search in FAISS
-    _, indices = faiss_index.search(query_vector, 2)  # Search for 2 closest matches
-    result_index = indices[0][0]  # Get the index of the best match
-    
-    # Return the question and answer corresponding to the matched index
-    return questions[result_index]
+# 3. Function to search for the most similar question using FAISS
+def search_similar_question(prompt):
+    with span("retrieve"):
+        with span("embed"):
+            query_vector = get_model().encode(prompt).tolist()  # Convert user prompt to vector
+        with span("vector_search", backend="FaissVectorStore", top_k=1):
+            faiss_store = get_faiss_store()
+            match = faiss_store.query(vector=query_vector, top_k=1, include_metadata=True)["matches"][0]
+    # The vectors only carry ids and the text is read from the memory-mapped document store,
+    # except in indexes written before it, which carry the text in their metadata
+    documents = faiss_store.documents
+    document = (documents.get(match["id"]) if documents is not None else None) or match.get("metadata")
+    if not document:
+        raise MissingDocumentsError([match["id"]])
+    return {"question": document["question"], "answer": document["answer"]}
 
-# 6. Enhance response generation with MISTRAL AI
+# 4. Enhance response generation with MISTRAL AI
 api_key = os.getenv('MISTRAL_API_KEY')
 
-def generate_enhanced_answer(prompt, context, api_key):
-    client = Mistral(api_key=api_key)
-    
+def build_messages(prompt, context):
     # Define a more conversational system prompt
     system_prompt = """You are a friendly and helpful customer service representative at NomadFoods company. 
     Your responses should be warm, natural, and conversational while being informative.
@@ -94,28 +88,56 @@ def generate_enhanced_answer(prompt, context, api_key):
     4. End with an offer to help further if needed
     """
     
-    response = client.chat.complete(
-        model="mistral-large-latest",
-        messages=[
-            {"role": "system", "content": system_prompt.format(context=context)},
-            {"role": "user", "content": enhanced_user_prompt}
-        ],
-        max_tokens=500,
-        temperature=0.7  # Slightly increased temperature for more natural responses
-    )
-    
-    return response.choices[0].message.content.strip()
+    return [
+        {"role": "system", "content": system_prompt.format(context=context)},
+        {"role": "user", "content": enhanced_user_prompt}
+    ]
+
+def generate_enhanced_answer(prompt, context, api_key):
+    client = get_llm_client("mistral", api_key)
+    with span("llm", model="mistral-large-latest") as llm_span:
+        usage = {}
+        answer = client.chat(build_messages(prompt, context), model="mistral-large-latest", max_tokens=500, temperature=0.7, usage=usage)
+        llm_span.set(**usage)
+    return answer
+
+def stream_enhanced_answer(prompt, context, api_key):
+    # Yields text deltas from the Mistral streaming API as they arrive
+    client = get_llm_client("mistral", api_key)
+    llm_span = start_span("llm", model="mistral-large-latest", stream=True)
+    usage = {}
+    try:
+        for i, delta in enumerate(client.stream_chat(build_messages(prompt, context), model="mistral-large-latest", max_tokens=500, temperature=0.7, usage=usage)):
+            if i == 0:
+                llm_span.set(first_token_ms=llm_span.elapsed_ms())
+            yield delta
+    except Exception as e:
+        llm_span.set(status="error", error=repr(e))
+        raise
+    finally:
+        llm_span.set(**usage).finish()
 
 # Function to handle the chatbot logic
 def chatbot(prompt):
+    with span("request", app="monitoring"):
+        return answer_with_stream(prompt)
+
+def answer_with_stream(prompt):
     api_key = os.environ.get("MISTRAL_API_KEY")
+    start = time.perf_counter()
     with st.spinner("🔍 Searching for relevant information..."):
         faq = search_similar_question(prompt)
-        time.sleep(0.5)  # Add a small delay for UX
-    with st.spinner("🤔 Generating enhanced response..."):
-        enhanced_answer = generate_enhanced_answer(prompt, faq['answer'], api_key=api_key)
-        time.sleep(0.5)  # Add a small delay for UX
-    return enhanced_answer
+    # Render tokens as they arrive and note when the first one shows up
+    timings = {}
+    def timed_stream():
+        for delta in stream_enhanced_answer(prompt, faq['answer'], api_key=api_key):
+            timings.setdefault("time_to_first_token", time.perf_counter() - start)
+            yield delta
+    placeholder = st.empty()
+    with placeholder.container():
+        enhanced_answer = st.write_stream(timed_stream())
+    placeholder.empty()
+    return enhanced_answer, timings.get("time_to_first_token", time.perf_counter() - start)
 
 def load_assets():
     try:
@@ -126,10 +148,7 @@ def load_assets():
         return None
 
 def initialize_session_state():
-    if "history" not in st.session_state:
-        st.session_state.history = []
-    if "feedback" not in st.session_state:
-        st.session_state.feedback = {}
+    init_request_state(st.session_state)
     if "user_query" not in st.session_state:
         st.session_state.user_query = ""  # Track the user query
 
@@ -181,7 +200,7 @@ def app():
         
         st.sidebar.markdown("---")
         st.sidebar.header("📊 Statistics")
-        st.sidebar.metric("Questions Asked", len(st.session_state.history))
+        st.sidebar.metric("Questions Asked", len(completed_requests(st.session_state)))
         
         st.sidebar.markdown("---")
         st.sidebar.header("ℹ️ About")
@@ -221,28 +240,41 @@ def app():
         # Update text input value based on the selected sample question
         user_query = st.text_input("", placeholder="Type your question here please...", value=st.session_state.user_query, key="user_input")
 
-        if user_query:
-            response_time_start = time.time()
-            response = chatbot(user_query)
-            response_time = time.time() - response_time_start
-            
-            st.session_state.history.append({"query": user_query, "response": response})
+        # Only a newly submitted query runs the pipeline; other reruns reuse the stored results
+        submit_query(st.session_state, user_query)
+        query_id = next_pending(st.session_state)
+        if query_id:
+            try:
+                response_time_start = time.time()
+                response, time_to_first_token = chatbot(st.session_state.requests[query_id]["query"])
+                complete_request(
+                    st.session_state, query_id,
+                    response=response,
+                    response_time=time.time() - response_time_start,
+                    time_to_first_token=time_to_first_token
+                )
+            except Exception as e:
+                fail_request(st.session_state, query_id, e)
+                st.error(f"Sorry, something went wrong while answering: {e}. Press Enter to try again.")
 
         # Display conversation history
-        if st.session_state.history:
+        history = completed_requests(st.session_state)
+        if history:
             st.markdown("### 💬 Conversation History")
-            for i, interaction in enumerate(reversed(st.session_state.history)):
+            for interaction in reversed(history):
+                query_id = interaction['query_id']
                 st.markdown(f"<div class='chat-message user-message'>{interaction['query']}</div>", unsafe_allow_html=True)
                 st.markdown(f"<div class='chat-message bot-message'>{interaction['response']}</div>", unsafe_allow_html=True)
 
-                # Feedback buttons
-                if st.button("👍", key=f"up_{i}"):
-                    insert_feedback(interaction['query'], True, False, True, "Mistral", response_time)
-                    st.success("Thanks for your feedback!")
+                # Feedback buttons, written once per answer
+                if interaction['feedback'] is None:
+                    if st.button("👍", key=f"up_{query_id}") and record_feedback(st.session_state, query_id, "up"):
+                        insert_feedback(interaction['query'], True, False, True, "Mistral", interaction['response_time'])
+                        st.success("Thanks for your feedback!")
 
-                if st.button("👎", key=f"down_{i}"):
-                    insert_feedback(interaction['query'], False, True, False, "Mistral", response_time)
-                    st.error("Sorry for the inconvenience. We'll improve!")
+                    if st.button("👎", key=f"down_{query_id}") and record_feedback(st.session_state, query_id, "down"):
+                        insert_feedback(interaction['query'], False, True, False, "Mistral", interaction['response_time'])
+                        st.error("Sorry for the inconvenience. We'll improve!")
 
 if __name__ == "__main__":
     app()
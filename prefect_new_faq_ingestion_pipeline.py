@@ -1,5 +1,20 @@
 import json
-from prefect import task, flow
+import os
+import threading
+import time
+from datetime import timedelta
+from prefect import task, flow, unmapped
+from prefect.cache_policies import INPUTS
+from rag_nomad_foods_ann_index import ground_truth_query_vectors
+from rag_nomad_foods_answer_cache import ANSWER_CACHE_BACKEND, cache_key
+from rag_nomad_foods_chatbot import get_answer_cache, init_vector_store, load_model, ENCODER_NAME, VECTOR_STORE_DIR
+from rag_nomad_foods_doc_store import build_document_store_from_file
+from rag_nomad_foods_embedding_cache import EmbeddingCache
+from rag_nomad_foods_evaluation import evaluate_retrieval
+from rag_nomad_foods_faq_data import generate_document_id, iter_faq_records, load_faq_data
+from rag_nomad_foods_hot_reload import FAQ_VERSION_FILE
+from rag_nomad_foods_ingestion import UPSERT_CHUNK_SIZE, batched, build_vectors, upsert_with_retry
+from rag_nomad_foods_tenants import save_tenant_info, tenant_directory, tenant_id
 
 @task(name="Reading_The_New_Entries" , log_prints=True)
 def read_new_faq_entries(file_path="new_faq_data.json"):
@@ -23,6 +38,9 @@ def update_faq_file(new_faq_entries, source_file="faq_data.json"):
     Args:
         new_faq_entries (list): List of FAQ entries with 'category', 'question', and 'answer'.
         source_file (str): Path to the existing JSON file containing FAQ data.
+    Returns:
+        bool: True if the file changed. Entries that are already present are skipped,
+        so running the flow twice on the same input leaves the file untouched.
     """
     print(f"Updating existing FAQ file '{source_file}' with new entries...")
     # Load existing FAQ data
@@ -30,6 +48,7 @@ def update_faq_file(new_faq_entries, source_file="faq_data.json"):
         existing_data = json.load(file)
 
     # Process each new FAQ entry
+    changed = False
     for entry in new_faq_entries:
         category_found = False
         print(f"Processing entry: Category '{entry['category']}', Question '{entry['question']}'")
@@ -37,13 +56,25 @@ def update_faq_file(new_faq_entries, source_file="faq_data.json"):
         # Check if the category exists in the existing data
         for existing_category in existing_data["faq_data"]:
             if existing_category["category"] == entry["category"]:
-                # Append the new question and answer to the existing category
-                existing_category["questions"].append({
-                    "question": entry["question"],
-                    "answer": entry["answer"]
-                })
-                print(f"Added to existing category '{entry['category']}'.")
                 category_found = True
+                existing_qa = next(
+                    (qa for qa in existing_category["questions"] if qa["question"] == entry["question"]),
+                    None
+                )
+                if existing_qa is None:
+                    # Append the new question and answer to the existing category
+                    existing_category["questions"].append({
+                        "question": entry["question"],
+                        "answer": entry["answer"]
+                    })
+                    print(f"Added to existing category '{entry['category']}'.")
+                    changed = True
+                elif existing_qa["answer"] != entry["answer"]:
+                    existing_qa["answer"] = entry["answer"]
+                    print(f"Updated the answer in category '{entry['category']}'.")
+                    changed = True
+                else:
+                    print("Entry already present, skipping.")
                 break
         
         # If category is not found, add a new category entry
@@ -56,18 +87,225 @@ def update_faq_file(new_faq_entries, source_file="faq_data.json"):
                 }]
             })
             print(f"Created new category '{entry['category']}' and added the question.")
+            changed = True
 
-    # Save the updated FAQ data back to the source file
-    with open(source_file, 'w') as file:
+    if not changed:
+        print(f"'{source_file}' is already up to date.")
+        return False
+
+    # Save the updated FAQ data back to the source file; replaced atomically so serving processes never read half a file
+    tmp_file = source_file + ".tmp"
+    with open(tmp_file, 'w') as file:
         json.dump(existing_data, file, indent=4)
+    os.replace(tmp_file, source_file)
     print(f"Successfully updated '{source_file}' with new FAQ entries.")
+    return True
+
+# The original chatbot seeded Pinecone with positional ids (faq_<category>_<question>);
+# none of them can be matched to a document id, so such an index is rebuilt once
+LEGACY_ID_PROBE = "faq_0_0"
+
+# Snapshot of the FAQ file the index was last synced with; a tenant's lives in its own directory
+INDEXED_FILE = "faq_data_with_ids.json"
+
+def has_legacy_ids(index):
+    return LEGACY_ID_PROBE in index.fetch([LEGACY_ID_PROBE])["vectors"]
+
+@task(name="Computing_Index_Delta", log_prints=True)
+def compute_index_delta(source_file="faq_data.json", indexed_file="faq_data_with_ids.json", tenant=None):
+    """
+    Compares the FAQ file with the document IDs that are already in the vector index.
+    Args:
+        source_file (str): Path to the (updated) FAQ JSON file.
+        indexed_file (str): Path to the FAQ snapshot with IDs that matches the index.
+        tenant (str): Tenant whose namespace / local index is compared; None for the default index.
+    Returns:
+        dict: 'upserts' (added or changed records), 'deletes' (document IDs to remove) and
+        'reseed' (True if the index still holds legacy ids and has to be emptied first).
+    """
+    current = {record["id"]: record for record in iter_faq_records(load_faq_data(source_file))}
+    indexed = {}
+    reseed = has_legacy_ids(init_vector_store(tenant=tenant))
+    if reseed:
+        print("The index still holds positional faq_<i>_<j> ids from the original ingestion, reseeding it.")
+    elif os.path.exists(indexed_file):
+        indexed = {record["id"]: record for record in iter_faq_records(load_faq_data(indexed_file))}
+
+    upserts = [
+        record for doc_id, record in current.items()
+        if doc_id not in indexed
+        or (indexed[doc_id]["question"], indexed[doc_id]["answer"]) != (record["question"], record["answer"])
+    ]
+    deletes = [doc_id for doc_id in indexed if doc_id not in current]
+    print(f"Index delta: {len(upserts)} to upsert, {len(deletes)} to delete.")
+    return {"upserts": upserts, "deletes": deletes, "reseed": reseed}
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+def get_encoder():
+    # One model per worker process, shared by the mapped embedding tasks
+    global _encoder
+    with _encoder_lock:
+        if _encoder is None:
+            _encoder = EmbeddingCache(load_model(), ENCODER_NAME)
+    return _encoder
+
+@task(name="Embedding_Faq_Batch", log_prints=True,
+      cache_policy=INPUTS, cache_expiration=timedelta(days=30), persist_result=True)
+def embed_faq_batch(records, encoder_name=ENCODER_NAME):
+    """
+    Embeds a batch of FAQ records. Results are cached on the task inputs, so a
+    re-run with the same records and encoder does not encode anything.
+    Args:
+        records (list): FAQ records with 'id', 'category', 'question' and 'answer'.
+        encoder_name (str): Encoder the vectors come from; part of the cache key, so switching
+            ENCODER_BACKEND or EMBEDDING_DIM never reuses vectors of the previous encoder.
+    Returns:
+        list: Pinecone upsert payload for the batch.
+    """
+    if encoder_name != ENCODER_NAME:
+        raise ValueError(f"This worker encodes with {ENCODER_NAME!r}, not {encoder_name!r}")
+    embeddings = get_encoder().encode([record["question"] for record in records])
+    print(f"Embedded {len(records)} FAQ entries.")
+    return build_vectors(records, embeddings)
+
+@task(name="Syncing_Vector_Index", log_prints=True)
+def sync_vector_index(vector_batches, deletes, ground_truth_file="ground-truth-data.csv", tenant=None, reseed=False):
+    """
+    Upserts the embedded entries and deletes removed document IDs from the index.
+    Args:
+        vector_batches (list): Upsert payloads returned by embed_faq_batch.
+        deletes (list): Document IDs that are no longer in the FAQ file.
+        ground_truth_file (str): Questions an approximate FAISS index is recall-checked on before it is deployed;
+            None (or a missing file) deploys it without the check.
+        tenant (str): Tenant whose namespace / local index is synced; None for the default index.
+        reseed (bool): Empty the index first (vector_batches then hold the whole FAQ file).
+    """
+    index = init_vector_store(tenant=tenant)
+    index.encoder = ENCODER_NAME
+    if reseed:
+        index.delete(delete_all=True)
+        print("Emptied the index before reseeding it.")
+    if getattr(index, "index_type", "flat") != "flat" and ground_truth_file and os.path.exists(ground_truth_file):
+        index.guardrail_queries = ground_truth_query_vectors(get_encoder(), ground_truth_file)
+    upserted = 0
+    for vectors in vector_batches:
+        for chunk in batched(vectors, UPSERT_CHUNK_SIZE):
+            upsert_with_retry(index, chunk)
+            upserted += len(chunk)
+    for chunk in batched(deletes, UPSERT_CHUNK_SIZE):
+        index.delete(ids=chunk)
+    index.flush()
+    print(f"Upserted {upserted} vectors and deleted {len(deletes)} vectors.")
+    if hasattr(index, "index_report"):
+        print(f"Deployed index: {index.index_report()}")
+
+@task(name="Invalidating_Cached_Answers", log_prints=True)
+def invalidate_cached_answers(doc_ids, tenant=None):
+    """
+    Drops cached LLM answers generated from FAQ entries that changed or were removed.
+    Only the shared SQLite cache can be reached from here; the in-process one lives in each serving process.
+    Args:
+        doc_ids (list): Document IDs whose answer changed or that were deleted.
+        tenant (str): Tenant whose cached answers are dropped; None for the default index.
+    """
+    if ANSWER_CACHE_BACKEND != "sqlite":
+        print(f"ANSWER_CACHE_BACKEND={ANSWER_CACHE_BACKEND}: the serving processes' caches can't be invalidated from "
+              f"this flow. Their entries for edited answers are dropped on lookup, removed ones expire with the TTL.")
+        return
+    cache = get_answer_cache()
+    for doc_id in doc_ids:
+        cache.invalidate(cache_key(doc_id, tenant))
+    print(f"Invalidated cached answers for {len(doc_ids)} FAQ entries.")
+
+@task(name="Saving_Indexed_Snapshot", log_prints=True)
+def save_indexed_snapshot(source_file="faq_data.json", indexed_file="faq_data_with_ids.json", tenant=None):
+    """
+    Writes the FAQ file with document IDs once the index matches it, and the document store built from it.
+    Args:
+        source_file (str): Path to the FAQ JSON file.
+        indexed_file (str): Path to the FAQ snapshot with IDs.
+        tenant (str): Tenant whose document store is written; None for the default one.
+    """
+    data = load_faq_data(source_file)
+    for category_data in data["faq_data"]:
+        for question_data in category_data["questions"]:
+            question_data["id"] = generate_document_id({
+                "category": category_data["category"],
+                "question": question_data["question"],
+                "answer": question_data["answer"]
+            })
+    os.makedirs(os.path.dirname(indexed_file) or ".", exist_ok=True)
+    with open(indexed_file, 'w') as file:
+        json.dump(data, file, indent=4)
+    print(f"Saved indexed snapshot to '{indexed_file}'.")
+    # The vectors only carry ids; retrieval reads the text from this memory-mapped store
+    documents = build_document_store_from_file(indexed_file, tenant_directory(VECTOR_STORE_DIR, tenant) if tenant else VECTOR_STORE_DIR)
+    print(f"Saved {len(documents)} documents to '{documents.path}'.")
+    if tenant:
+        # The brand this tenant's answers are written for
+        save_tenant_info(VECTOR_STORE_DIR, tenant, data)
+    # Serving processes watching FAQ_VERSION_FILE reload only now, after the shared index is synced
+    if FAQ_VERSION_FILE:
+        tmp_file = FAQ_VERSION_FILE + ".tmp"
+        with open(tmp_file, 'w') as file:
+            file.write(f"{time.time_ns()}\n")
+        os.replace(tmp_file, FAQ_VERSION_FILE)
+
+@task(name="Evaluating_Retrieval", log_prints=True)
+def evaluate_retrieval_quality(indexed_file="faq_data_with_ids.json", ground_truth_file="ground-truth-data.csv", k=5,
+                               tenant=None):
+    """
+    Re-computes hit-rate@k and MRR on the ground-truth questions against the updated index.
+    Args:
+        indexed_file (str): Path to the FAQ snapshot with IDs.
+        ground_truth_file (str): CSV with 'question' and 'document' columns; None skips the evaluation.
+        k (int): Number of retrieved documents per question.
+        tenant (str): Tenant whose index is evaluated; None for the default index.
+    Returns:
+        dict: hit_rate and mrr per retriever.
+    """
+    if not ground_truth_file:
+        print("No ground-truth questions for this index, skipping the retrieval evaluation.")
+        return {}
+    if not os.path.exists(ground_truth_file):
+        print(f"'{ground_truth_file}' not found, skipping the retrieval evaluation.")
+        return {}
+    results = evaluate_retrieval(get_encoder(), indexed_file, ground_truth_file, k, {"index": init_vector_store(tenant=tenant)})
+    print(f"Evaluation timings: {results.pop('timings')}")
+    metrics = {name: {"hit_rate": value["hit_rate"], "mrr": value["mrr"]} for name, value in results.items()}
+    for name, value in metrics.items():
+        print(f"{name}: hit_rate@{k}={value['hit_rate']:.4f} mrr={value['mrr']:.4f}")
+    return metrics
 
 @flow(name="New_Faq_Ingestion_Flow", log_prints=True)
-def faq_update_flow():
+def faq_update_flow(embed_batch_size=32, new_entries_file="new_faq_data.json", source_file="faq_data.json",
+                    indexed_file=None, tenant=None, ground_truth_file=None):
+    # One run per tenant: its own FAQ files, ground-truth questions and namespace / local index
+    # ("auto" = from the file's company_name)
+    if tenant == "auto":
+        tenant = tenant_id(load_faq_data(source_file))
+    # The snapshot the delta is computed against belongs to the index it describes
+    if indexed_file is None:
+        indexed_file = os.path.join(tenant_directory(VECTOR_STORE_DIR, tenant), INDEXED_FILE) if tenant else INDEXED_FILE
+    # ground-truth-data.csv asks about the default FAQ; a tenant without its own file skips the recall check and the evaluation
+    if ground_truth_file is None and tenant is None:
+        ground_truth_file = "ground-truth-data.csv"
     # Read new entries from a JSON file
-    new_faq_entries = read_new_faq_entries()
+    new_faq_entries = read_new_faq_entries(new_entries_file)
     # Update the main FAQ file with these entries
-    update_faq_file(new_faq_entries)
+    update_faq_file(new_faq_entries, source_file)
+    # Only embed and sync what differs from the indexed snapshot
+    delta = compute_index_delta(source_file, indexed_file, tenant)
+    if not delta["upserts"] and not delta["deletes"]:
+        print("Vector index is already up to date.")
+        return
+    vector_batches = embed_faq_batch.map(list(batched(delta["upserts"], embed_batch_size)), unmapped(ENCODER_NAME))
+    sync_vector_index(vector_batches, delta["deletes"], ground_truth_file, tenant=tenant, reseed=delta["reseed"])
+    invalidate_cached_answers([record["id"] for record in delta["upserts"]] + delta["deletes"], tenant)
+    save_indexed_snapshot(source_file, indexed_file, tenant)
+    evaluate_retrieval_quality(indexed_file, ground_truth_file, tenant=tenant)
 
 # Run the flow
 if __name__ == "__main__":
@@ -0,0 +1,175 @@
+import argparse
+import math
+import os
+import sys
+import time
+import numpy as np
+import faiss
+
+# Approximate-nearest-neighbour options for the FAISS vector store. A non-flat
+# index only replaces the exact one after its recall@k against the exact index
+# passed the floor:
+#   python rag_nomad_foods_ann_index.py --index-type ivfpq --ground-truth ground-truth-data.csv
+
+INDEX_TYPES = ("flat", "hnsw", "ivfpq")
+# "flat" (exact), "hnsw" or "ivfpq"
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+# HNSW graph degree and build/search beam widths
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_HNSW_EF_CONSTRUCTION = int(os.getenv("FAISS_HNSW_EF_CONSTRUCTION", "200"))
+FAISS_HNSW_EF_SEARCH = int(os.getenv("FAISS_HNSW_EF_SEARCH", "128"))
+# IVF lists (0 = about 4 * sqrt(n)) and lists scanned per query
+FAISS_IVF_NLIST = int(os.getenv("FAISS_IVF_NLIST", "0"))
+FAISS_IVF_NPROBE = int(os.getenv("FAISS_IVF_NPROBE", "16"))
+# PQ sub-quantizers (must divide the dimension) and bits per code: 96 x 8 bits is 96 bytes per 768-d vector
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "96"))
+FAISS_PQ_NBITS = int(os.getenv("FAISS_PQ_NBITS", "8"))
+# PQ candidates fetched per result and re-scored exactly from the memory-mapped vectors (1 = off)
+FAISS_PQ_REFINE = int(os.getenv("FAISS_PQ_REFINE", "10"))
+ANN_RECALL_K = int(os.getenv("ANN_RECALL_K", "5"))
+ANN_RECALL_FLOOR = float(os.getenv("ANN_RECALL_FLOOR", "0.95"))
+# Stored vectors used as guardrail queries when no ground-truth queries are given
+GUARDRAIL_SAMPLE_SIZE = 1000
+
+
+class RecallBelowFloorError(Exception):
+    def __init__(self, report):
+        super().__init__(
+            f"{report['index_type']} recall@{report['k']} is {report['recall']:.4f}, "
+            f"below the floor of {report['recall_floor']}"
+        )
+        self.report = report
+
+
+def ivf_nlist(n_vectors, nlist=None):
+    """Configured (or ~4 * sqrt(n)) list count, capped so k-means gets 39 training points per list"""
+    nlist = nlist or FAISS_IVF_NLIST or int(4 * math.sqrt(n_vectors))
+    return max(1, min(nlist, n_vectors // 39))
+
+
+def build_index(vectors, index_type=None):
+    """Inner-product index of `index_type` over L2-normalised float32 vectors, trained if needed"""
+    index_type = index_type or FAISS_INDEX_TYPE
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n_vectors, dimension = vectors.shape
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dimension)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+    elif index_type == "ivfpq":
+        if dimension % FAISS_PQ_M:
+            raise ValueError(f"FAISS_PQ_M={FAISS_PQ_M} does not divide the dimension {dimension}")
+        if n_vectors < 2 ** FAISS_PQ_NBITS:
+            raise ValueError(f"ivfpq needs at least {2 ** FAISS_PQ_NBITS} vectors to train, got {n_vectors}")
+        quantizer = faiss.IndexFlatIP(dimension)
+        index = faiss.IndexIVFPQ(quantizer, dimension, ivf_nlist(n_vectors), FAISS_PQ_M, FAISS_PQ_NBITS,
+                                 faiss.METRIC_INNER_PRODUCT)
+        # PQ codebooks train fine from a few hundred vectors; don't warn for every sub-quantizer below 39 per centroid
+        index.pq.cp.min_points_per_centroid = 1
+        index.train(vectors)
+    else:
+        raise ValueError(f"Unknown FAISS index type '{index_type}', expected one of {INDEX_TYPES}")
+    if n_vectors:
+        index.add(vectors)
+    return set_search_params(index)
+
+
+def set_search_params(index):
+    """Apply the query-time knobs (nprobe, efSearch), which are not stored in index.faiss"""
+    if hasattr(index, "nprobe"):
+        index.nprobe = FAISS_IVF_NPROBE
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+    return index
+
+
+def search(index, queries, top_k, vectors=None):
+    """
+    (n, top_k) scores and rows. For PQ indexes, FAISS_PQ_REFINE * top_k
+    candidates are re-scored with the exact `vectors` when they are given.
+    """
+    queries = np.ascontiguousarray(queries, dtype="float32")
+    if vectors is None or not hasattr(index, "pq") or FAISS_PQ_REFINE <= 1:
+        return index.search(queries, top_k)
+    _, candidates = index.search(queries, top_k * FAISS_PQ_REFINE)
+    exact = np.einsum("nkd,nd->nk", np.asarray(vectors)[np.maximum(candidates, 0)], queries)
+    exact[candidates < 0] = -np.inf
+    order = np.argsort(-exact, axis=1)[:, :top_k]
+    scores, rows = np.take_along_axis(exact, order, axis=1), np.take_along_axis(candidates, order, axis=1)
+    rows[np.isneginf(scores)] = -1
+    return scores, rows
+
+
+def recall_at_k(ann_rows, exact_rows):
+    """Mean fraction of the exact top-k rows the approximate search also returned"""
+    hits = [len(set(ann[ann >= 0]) & set(exact[exact >= 0])) / max(1, (exact >= 0).sum())
+            for ann, exact in zip(ann_rows, exact_rows)]
+    return float(np.mean(hits)) if hits else 1.0
+
+
+def index_bytes(index):
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def sample_queries(vectors, size=GUARDRAIL_SAMPLE_SIZE, seed=0):
+    rows = np.random.default_rng(seed).choice(len(vectors), size=min(size, len(vectors)), replace=False)
+    return np.asarray(vectors)[np.sort(rows)]
+
+
+def build_checked_index(vectors, queries, index_type=None, k=None, recall_floor=None, flat_index=None):
+    """
+    Build `index_type` and measure its recall@k against the exact index on
+    `queries`. Returns (index, report); raises RecallBelowFloorError instead
+    of returning an index below `recall_floor`.
+    """
+    index_type = index_type or FAISS_INDEX_TYPE
+    k = min(k or ANN_RECALL_K, len(vectors))
+    recall_floor = ANN_RECALL_FLOOR if recall_floor is None else recall_floor
+    flat_index = flat_index if flat_index is not None else build_index(vectors, "flat")
+    start = time.perf_counter()
+    index = build_index(vectors, index_type)
+    build_s = time.perf_counter() - start
+    _, exact_rows = flat_index.search(np.ascontiguousarray(queries, dtype="float32"), k)
+    _, ann_rows = search(index, queries, k, vectors)
+    report = {
+        "index_type": index_type,
+        "k": k,
+        "recall": recall_at_k(ann_rows, exact_rows),
+        "recall_floor": recall_floor,
+        "queries": len(queries),
+        "vectors": len(vectors),
+        "build_s": build_s,
+        "index_bytes": index_bytes(index),
+        "flat_index_bytes": index_bytes(flat_index)
+    }
+    report["compression"] = report["flat_index_bytes"] / max(1, report["index_bytes"])
+    if report["recall"] < recall_floor:
+        raise RecallBelowFloorError(report)
+    return index, report
+
+
+def ground_truth_query_vectors(encoder, ground_truth_file="ground-truth-data.csv"):
+    """Encoded ground-truth questions, the guardrail queries of a deployed index"""
+    from rag_nomad_foods_evaluation import encode_texts, load_ground_truth
+    questions, _ = load_ground_truth(ground_truth_file)
+    return encode_texts(encoder, questions)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the local FAISS index with a recall guardrail")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=FAISS_INDEX_TYPE)
+    parser.add_argument("--ground-truth", default="ground-truth-data.csv",
+                        help="Guardrail queries (default: a sample of the stored vectors if the file is missing)")
+    args = parser.parse_args()
+
+    from rag_nomad_foods_chatbot import ENCODER_NAME, init_vector_store, load_model
+    from rag_nomad_foods_embedding_cache import EmbeddingCache
+    store = init_vector_store("faiss")
+    store.index_type = args.index_type
+    if os.path.exists(args.ground_truth):
+        store.guardrail_queries = ground_truth_query_vectors(EmbeddingCache(load_model(), ENCODER_NAME),
+                                                             args.ground_truth)
+    report = store.rebuild_index()
+    print(report)
+    sys.exit(0 if report.get("index_type") == args.index_type else 1)
@@ -0,0 +1,232 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+import numpy as np
+
+ANSWER_CACHE_BACKEND = os.getenv("ANSWER_CACHE_BACKEND", "memory")
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "answer_cache.sqlite")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "10000"))
+
+
+def cache_key(doc_id, tenant=None):
+    """Answers are cached per tenant: the same FAQ entry is answered in each tenant's brand"""
+    return f"{tenant}/{doc_id}" if tenant else doc_id
+
+
+def _context_hash(context):
+    return hashlib.md5(context.encode()).hexdigest()
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype="float32").ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class InProcessAnswerStore:
+    """
+    Cache entries kept in a dict, private to this process. The dict is kept in
+    least recently used order, and a doc_id -> keys index means a lookup only
+    reads the entries of its own document.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._keys_by_doc = {}
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    def entries(self, doc_id):
+        with self._lock:
+            return [(key, *self._entries[key]) for key in self._keys_by_doc.get(doc_id, ())]
+
+    def put(self, doc_id, query_vector, answer, context_hash, now):
+        with self._lock:
+            self._next_key += 1
+            self._entries[self._next_key] = [doc_id, query_vector, answer, context_hash, now, now]
+            self._keys_by_doc.setdefault(doc_id, set()).add(self._next_key)
+
+    def touch(self, key, now):
+        with self._lock:
+            if key in self._entries:
+                self._entries[key][5] = now
+                self._entries.move_to_end(key)
+
+    def _remove(self, key):
+        # Caller holds the lock
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._keys_by_doc[entry[0]]
+        keys.discard(key)
+        if not keys:
+            del self._keys_by_doc[entry[0]]
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+
+    def delete_doc(self, doc_id):
+        with self._lock:
+            for key in self._keys_by_doc.pop(doc_id, ()):
+                self._entries.pop(key, None)
+
+    def count(self):
+        return len(self._entries)
+
+    def evict_least_recently_used(self, n):
+        with self._lock:
+            for key in list(islice(self._entries, n)):
+                self._remove(key)
+
+
+class SQLiteAnswerStore:
+    """Cache entries in a SQLite file (WAL mode) that several processes or pods on a shared volume can use"""
+
+    def __init__(self, path=ANSWER_CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS answer_cache (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                doc_id TEXT NOT NULL,
+                query_vector BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                context_hash TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS answer_cache_doc_id ON answer_cache (doc_id)")
+        conn.commit()
+
+    def _conn(self):
+        # One connection per thread; sqlite3 connections must not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def entries(self, doc_id):
+        rows = self._conn().execute(
+            "SELECT id, doc_id, query_vector, answer, context_hash, created_at, last_used "
+            "FROM answer_cache WHERE doc_id = ?", (doc_id,)
+        ).fetchall()
+        return [
+            (key, doc, np.frombuffer(blob, dtype="float32"), answer, context_hash, created_at, last_used)
+            for key, doc, blob, answer, context_hash, created_at, last_used in rows
+        ]
+
+    def put(self, doc_id, query_vector, answer, context_hash, now):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO answer_cache (doc_id, query_vector, answer, context_hash, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (doc_id, query_vector.astype("float32").tobytes(), answer, context_hash, now, now)
+            )
+
+    def touch(self, key, now):
+        with self._conn() as conn:
+            conn.execute("UPDATE answer_cache SET last_used = ? WHERE id = ?", (now, key))
+
+    def delete(self, keys):
+        with self._conn() as conn:
+            conn.executemany("DELETE FROM answer_cache WHERE id = ?", [(key,) for key in keys])
+
+    def delete_doc(self, doc_id):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM answer_cache WHERE doc_id = ?", (doc_id,))
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM answer_cache").fetchone()[0]
+
+    def evict_least_recently_used(self, n):
+        with self._conn() as conn:
+            conn.execute(
+                "DELETE FROM answer_cache WHERE id IN "
+                "(SELECT id FROM answer_cache ORDER BY last_used LIMIT ?)", (n,)
+            )
+
+
+class SemanticAnswerCache:
+    """
+    Generated answers keyed by the retrieved FAQ document id plus the query
+    embedding. A query is served from the cache when a cached query for the
+    same document is within `threshold` cosine similarity. Entries expire after
+    `ttl_seconds`, the least recently used ones are evicted past `max_entries`,
+    and entries generated from a different version of the FAQ answer are
+    dropped on lookup.
+    """
+
+    def __init__(self, store=None, threshold=ANSWER_CACHE_THRESHOLD,
+                 ttl_seconds=ANSWER_CACHE_TTL_SECONDS, max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        self.store = store if store is not None else InProcessAnswerStore()
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._counter_lock = threading.Lock()
+
+    def lookup(self, doc_id, query_vector, context):
+        now = time.time()
+        query_vector = _normalize(query_vector)
+        context_hash = _context_hash(context)
+        best_key, best_answer, best_score = None, None, self.threshold
+        stale = []
+        for key, _, cached_vector, answer, cached_hash, created_at, _ in self.store.entries(doc_id):
+            if cached_hash != context_hash or now - created_at > self.ttl_seconds:
+                stale.append(key)
+                continue
+            score = float(np.dot(query_vector, cached_vector))
+            if score >= best_score:
+                best_key, best_answer, best_score = key, answer, score
+        if stale:
+            self.store.delete(stale)
+        with self._counter_lock:
+            if best_key is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if best_key is None:
+            return None
+        self.store.touch(best_key, now)
+        return best_answer
+
+    def store_answer(self, doc_id, query_vector, context, answer):
+        self.store.put(doc_id, _normalize(query_vector), answer, _context_hash(context), time.time())
+        overflow = self.store.count() - self.max_entries
+        if overflow > 0:
+            self.store.evict_least_recently_used(overflow)
+
+    def invalidate(self, doc_id):
+        self.store.delete_doc(doc_id)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self.store.count()
+        }
+
+
+def create_answer_cache(backend=None):
+    """SemanticAnswerCache on the configured store ("memory" or "sqlite")"""
+    backend = backend or ANSWER_CACHE_BACKEND
+    if backend == "sqlite":
+        return SemanticAnswerCache(SQLiteAnswerStore(ANSWER_CACHE_PATH))
+    if backend == "memory":
+        return SemanticAnswerCache(InProcessAnswerStore())
+    raise ValueError(f"Unknown answer cache backend '{backend}', expected 'memory' or 'sqlite'")
@@ -0,0 +1,109 @@
+import asyncio
+from rag_nomad_foods_answer_cache import cache_key
+from rag_nomad_foods_chatbot import (
+    NO_MATCH_ANSWER, OPENROUTER_MODEL, build_messages, company_name_for, get_answer_cache, retrieve_faq
+)
+from rag_nomad_foods_llm_client import AsyncLLMClient
+from rag_nomad_foods_tracing import span
+
+MAX_CONCURRENT_ANSWERS = 16
+
+
+class AsyncAnswerPipeline:
+    """
+    asyncio answer pipeline: retrieval -> answer cache -> LLM completion.
+
+    `retrieve` is an async callable returning the FAQ match for a query and a
+    tenant (with "id" and "answer", plus "query_vector" when the answer cache
+    should be used and "tenant" when it isn't the default one), or None when
+    nothing matched. `build_messages` gets the query, the FAQ answer and the
+    company_name_for() the match's tenant. CPU-bound and blocking work runs in threads, the LLM call is a
+    native async request, so one worker keeps many queries in flight. The
+    pipeline owns `llm`: use it as `async with pipeline:` inside the event loop
+    it runs on, so the client's connections are closed with it.
+    """
+
+    def __init__(self, retrieve, build_messages, llm, model, answer_cache=None,
+                 max_concurrency=MAX_CONCURRENT_ANSWERS, max_tokens=500, temperature=0.7,
+                 company_name_for=company_name_for):
+        self.retrieve = retrieve
+        self.company_name_for = company_name_for
+        self.build_messages = build_messages
+        self.llm = llm
+        self.model = model
+        self.answer_cache = answer_cache
+        self.max_concurrency = max_concurrency
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.llm.aclose()
+
+    async def answer(self, query, tenant=None):
+        with span("request", pipeline="async", tenant=tenant):
+            return await self._answer(query, tenant)
+
+    async def _answer(self, query, tenant):
+        faq = await self.retrieve(query, tenant)
+        if faq is None:
+            return {"query": query, "answer": NO_MATCH_ANSWER, "faq_id": None, "cached": False}
+        use_cache = self.answer_cache is not None and "query_vector" in faq
+        key = cache_key(faq["id"], faq.get("tenant"))
+        if use_cache:
+            with span("answer_cache") as cache_span:
+                cached = await asyncio.to_thread(self.answer_cache.lookup, key, faq["query_vector"], faq["answer"])
+                cache_span.set(cache_hit=cached is not None)
+            if cached is not None:
+                return {"query": query, "answer": cached, "faq_id": faq["id"], "cached": True}
+        with span("llm", model=self.model) as llm_span:
+            usage = {}
+            answer = await self.llm.chat(
+                self.build_messages(query, faq["answer"], self.company_name_for(faq.get("tenant"))),
+                model=self.model,
+                max_tokens=self.max_tokens,
+                temperature=self.temperature,
+                usage=usage
+            )
+            llm_span.set(**usage)
+        if use_cache:
+            await asyncio.to_thread(self.answer_cache.store_answer, key, faq["query_vector"], faq["answer"], answer)
+        return {"query": query, "answer": answer, "faq_id": faq["id"], "cached": False}
+
+    async def answer_many(self, queries, max_concurrency=None, tenant=None):
+        """
+        Answer every query (of one tenant) with at most `max_concurrency` of them in flight; results keep the input order.
+        A query that fails gets {"query", "answer": None, "error"} instead of failing the whole batch.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or self.max_concurrency)
+
+        async def bounded_answer(query):
+            async with semaphore:
+                return await self.answer(query, tenant)
+
+        results = await asyncio.gather(*(bounded_answer(query) for query in queries), return_exceptions=True)
+        return [
+            {"query": query, "answer": None, "error": repr(result)} if isinstance(result, Exception) else result
+            for query, result in zip(queries, results)
+        ]
+
+
+async def retrieve_faq_async(prompt, tenant=None):
+    return await asyncio.to_thread(retrieve_faq, prompt, tenant)
+
+
+def create_answer_pipeline(api_key=None, max_concurrency=MAX_CONCURRENT_ANSWERS):
+    """
+    Async version of the production path (configured vector store + OpenRouter + answer cache).
+    Create it inside the running event loop and close it there: `async with create_answer_pipeline() as pipeline:`
+    """
+    return AsyncAnswerPipeline(
+        retrieve_faq_async,
+        build_messages,
+        AsyncLLMClient("openrouter", api_key=api_key),
+        OPENROUTER_MODEL,
+        answer_cache=get_answer_cache(),
+        max_concurrency=max_concurrency
+    )
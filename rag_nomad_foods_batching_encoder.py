@@ -0,0 +1,224 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import requests
+from rag_nomad_foods_tracing import set_attributes
+
+# Micro-batching for query encoding: single queries from concurrent sessions are
+# collected for up to ENCODER_BATCH_WAIT_MS and encoded in one forward pass.
+# In-process by default; as a sidecar, several app processes on a node share
+# one model copy:
+#   python rag_nomad_foods_batching_encoder.py --port 8090
+#   ENCODER_SIDECAR_URL=http://127.0.0.1:8090 streamlit run streamlit_chatbot_rag_nomad_foods.py
+
+# "1" batches single-query encodes in-process; "0" calls the model directly
+ENCODER_BATCHING = os.getenv("ENCODER_BATCHING", "1") == "1"
+ENCODER_BATCH_WAIT_MS = float(os.getenv("ENCODER_BATCH_WAIT_MS", "2"))
+ENCODER_MAX_BATCH = int(os.getenv("ENCODER_MAX_BATCH", "32"))
+# Use the sidecar instead of loading a model in this process
+ENCODER_SIDECAR_URL = os.getenv("ENCODER_SIDECAR_URL")
+ENCODER_SIDECAR_TIMEOUT = (1.0, float(os.getenv("ENCODER_SIDECAR_TIMEOUT", "10")))
+
+
+class _Request:
+    __slots__ = ("text", "future", "enqueued", "batch_size", "queue_ms")
+
+    def __init__(self, text):
+        self.text = text
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+        self.batch_size = None
+        self.queue_ms = None
+
+
+class BatchingEncoder:
+    """
+    Wraps an encoder (SentenceTransformer, OnnxEncoder, ...) behind a
+    background worker. A single-query encode() is queued and waits on a
+    future; the worker takes the first queued query, gathers whatever else
+    arrives within `max_wait_ms` (up to `max_batch_size`) and encodes the
+    lot in one call. Multi-text encodes (ingestion) are already batched and
+    go straight to the model.
+    """
+
+    def __init__(self, encoder, max_batch_size=ENCODER_MAX_BATCH, max_wait_ms=ENCODER_BATCH_WAIT_MS,
+                 name="encoder-batcher"):
+        self.encoder = encoder
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.counters = {"queries": 0, "batches": 0, "largest_batch": 0}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, text):
+        """Queue one text; the future resolves to its vector"""
+        request = _Request(text)
+        self.queue.put(request)
+        return request
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        if isinstance(texts, str):
+            request = self.submit(texts)
+            vector = request.future.result()
+            # Attached to the caller's "embed" span
+            set_attributes(batch_size=request.batch_size, queue_ms=request.queue_ms)
+            return vector
+        texts = list(texts)
+        if len(texts) == 1:
+            return self.encode(texts[0])[None, :]
+        return self.encoder.encode(texts, batch_size=batch_size, **kwargs)
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            try:
+                vectors = np.asarray(self.encoder.encode([r.text for r in batch], batch_size=len(batch)),
+                                     dtype="float32")
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            with self._lock:
+                self.counters["queries"] += len(batch)
+                self.counters["batches"] += 1
+                self.counters["largest_batch"] = max(self.counters["largest_batch"], len(batch))
+            for request, vector in zip(batch, vectors):
+                request.batch_size = len(batch)
+                request.queue_ms = (started - request.enqueued) * 1000
+                request.future.set_result(vector)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats["mean_batch"] = stats["queries"] / stats["batches"] if stats["batches"] else 0.0
+        stats["queued"] = self.queue.qsize()
+        return stats
+
+
+class RemoteEncoder:
+    """encode() over HTTP to the sidecar; vectors travel as raw float32"""
+
+    def __init__(self, base_url=None):
+        self.base_url = (base_url or ENCODER_SIDECAR_URL).rstrip("/")
+        self._session = requests.Session()
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        single = isinstance(texts, str)
+        response = self._session.post(f"{self.base_url}/encode", json={"texts": [texts] if single else list(texts)},
+                                      timeout=ENCODER_SIDECAR_TIMEOUT)
+        response.raise_for_status()
+        rows, dim = int(response.headers["X-Rows"]), int(response.headers["X-Dim"])
+        vectors = np.frombuffer(response.content, dtype="float32").reshape(rows, dim)
+        return vectors[0] if single else vectors
+
+    def stats(self):
+        response = self._session.get(f"{self.base_url}/stats", timeout=ENCODER_SIDECAR_TIMEOUT)
+        response.raise_for_status()
+        return response.json()
+
+
+def load_query_encoder():
+    """Encoder for the query path: the sidecar if configured, else the local model, micro-batched unless disabled"""
+    if ENCODER_SIDECAR_URL:
+        return RemoteEncoder()
+    from rag_nomad_foods_encoder import load_encoder
+    encoder = load_encoder()
+    return BatchingEncoder(encoder) if ENCODER_BATCHING else encoder
+
+_query_encoder = None
+_query_encoder_lock = threading.Lock()
+
+def get_query_encoder():
+    """One query encoder per process, so every retriever feeds the same batcher"""
+    global _query_encoder
+    if _query_encoder is None:
+        with _query_encoder_lock:
+            if _query_encoder is None:
+                _query_encoder = load_query_encoder()
+    return _query_encoder
+
+
+class EncoderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    encoder = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, data, content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/healthz":
+            self._send(200, b'{"status": "ok"}')
+        elif self.path == "/stats":
+            self._send(200, json.dumps(self.encoder.stats()).encode())
+        else:
+            self._send(404, json.dumps({"error": f"Unknown path {self.path}"}).encode())
+
+    def do_POST(self):
+        if self.path != "/encode":
+            self._send(404, json.dumps({"error": f"Unknown path {self.path}"}).encode())
+            return
+        try:
+            texts = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))["texts"]
+            if not isinstance(texts, list) or not texts or not all(isinstance(text, str) for text in texts):
+                raise ValueError("'texts' must be a non-empty list of strings")
+        except (KeyError, TypeError, ValueError) as e:
+            self._send(400, json.dumps({"error": f"Bad request: {e!r}"}).encode())
+            return
+        try:
+            # Each request runs on its own thread, so single queries from every client process meet in the batcher
+            vectors = np.ascontiguousarray(self.encoder.encode(texts), dtype="float32").reshape(len(texts), -1)
+        except Exception as e:
+            print(f"Encoding {len(texts)} texts failed: {e!r}")
+            self._send(500, json.dumps({"error": f"Encoding failed: {e!r}"}).encode())
+            return
+        self._send(200, vectors.tobytes(), "application/octet-stream",
+                   {"X-Rows": str(vectors.shape[0]), "X-Dim": str(vectors.shape[1])})
+
+
+def serve(host="127.0.0.1", port=8090, encoder=None):
+    if encoder is None:
+        from rag_nomad_foods_encoder import load_encoder
+        encoder = BatchingEncoder(load_encoder())
+    handler = type("BoundEncoderHandler", (EncoderHandler,), {"encoder": encoder})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-batching query encoder sidecar")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    args = parser.parse_args()
+    server = serve(args.host, args.port)
+    print(f"Encoding on http://{args.host}:{args.port}/encode")
+    server.serve_forever()
@@ -0,0 +1,272 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import numpy as np
+from rag_nomad_foods_ann_index import INDEX_TYPES, build_index, index_bytes, recall_at_k, sample_queries, search
+from rag_nomad_foods_faq_data import iter_faq_records, load_faq_data
+from rag_nomad_foods_ingestion import InMemoryIndex, ingest_records
+
+# Component micro-benchmarks on a synthetic corpus scaled up from faq_data.json:
+#   python rag_nomad_foods_benchmark.py --output benchmark_results.json --save-baseline benchmark_baseline.json
+#   python rag_nomad_foods_benchmark.py --output benchmark_results.json --baseline benchmark_baseline.json
+# Metric names end in their unit: *_ms / *_s / *_mb are lower-is-better, *_per_s is higher-is-better.
+
+CORPUS_SIZES = (1_000, 10_000, 100_000)
+SEARCH_BATCH_SIZES = (1, 8, 32, 128)
+ENCODE_BATCH_SIZES = (1, 8, 32, 64)
+DIMENSION = 768
+COMPONENTS = ("load", "encode", "search", "upsert")
+# Time metrics that moved by less than this are noise, whatever the relative change
+MIN_TIME_CHANGE_S = 0.001
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _measured(fn, args):
+    result = fn(*args)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def isolated(fn, *args):
+    """
+    fn(*args) in a freshly spawned process, with that process's peak RSS added
+    as "peak_rss_mb". ru_maxrss only ever grows, so measured in one process it
+    would report the largest component run so far rather than this one.
+    """
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(_measured, (fn, args))
+
+
+def synthetic_faq_data(source, size):
+    """faq_data.json-shaped dict with `size` questions, cycling through the real ones with numbered variants"""
+    records = list(iter_faq_records(source))
+    categories = {}
+    for i in range(size):
+        record = records[i % len(records)]
+        variant = i // len(records)
+        question = record["question"] if variant == 0 else f"{record['question']} (variant {variant})"
+        categories.setdefault(record["category"], []).append({"question": question, "answer": record["answer"]})
+    return {
+        "company_name": source.get("company_name", ""),
+        "faq_data": [{"category": name, "questions": questions} for name, questions in categories.items()]
+    }
+
+
+def timed(fn, repeat=1, budget_s=None):
+    """Best wall-clock time of `repeat` runs, in seconds, and the last result; stops early once `budget_s` is spent"""
+    best, result, total = float("inf"), None, 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best, total = min(best, elapsed), total + elapsed
+        if budget_s is not None and total >= budget_s:
+            break
+    return best, result
+
+
+def bench_load(data, repeat=3):
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump(data, f)
+        path = f.name
+    try:
+        seconds, records = timed(lambda: list(iter_faq_records(load_faq_data(path))), repeat)
+        return {"load_parse_s": seconds, "records": len(records), "file_mb": os.path.getsize(path) / 2 ** 20}
+    finally:
+        os.remove(path)
+
+
+def bench_encode(model, texts, batch_sizes=ENCODE_BATCH_SIZES, single_queries=32):
+    """Query-style single encodes and batched encode throughput over `texts`"""
+    model.encode(texts[:8])  # warm-up
+    single_s, _ = timed(lambda: [model.encode(text) for text in texts[:single_queries]])
+    results = {"single_query_ms": single_s / single_queries * 1000}
+    for batch_size in batch_sizes:
+        seconds, _ = timed(lambda: model.encode(texts, batch_size=batch_size))
+        results[f"batch_{batch_size}_texts_per_s"] = len(texts) / seconds
+    return results
+
+
+def bench_search(vectors, index_type="flat", batch_sizes=SEARCH_BATCH_SIZES, top_k=5, repeat=5, seed=0,
+                 build_repeat=7, build_budget_s=5.0):
+    # Small flat builds take well under a millisecond, so one sample is mostly noise
+    build_s, index = timed(lambda: build_index(vectors, index_type), build_repeat, build_budget_s)
+    rng = np.random.default_rng(seed)
+    results = {"index_build_s": build_s, "index_mb": index_bytes(index) / 2 ** 20}
+    for batch_size in batch_sizes:
+        queries = rng.standard_normal((batch_size, vectors.shape[1])).astype("float32")
+        seconds, _ = timed(lambda: search(index, queries, top_k, vectors), repeat)
+        results[f"batch_{batch_size}_search_ms"] = seconds * 1000
+        results[f"batch_{batch_size}_per_query_ms"] = seconds * 1000 / batch_size
+    if index_type != "flat":
+        queries = sample_queries(vectors, 256, seed)
+        _, exact_rows = build_index(vectors, "flat").search(queries, top_k)
+        results[f"recall_at_{top_k}"] = recall_at_k(search(index, queries, top_k, vectors)[1], exact_rows)
+    return results
+
+
+class PrecomputedEncoder:
+    """Hands out pre-generated vectors so the upsert benchmark measures ingestion, not the model"""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.offset = 0
+
+    def encode(self, texts, batch_size=32):
+        batch = self.vectors[self.offset:self.offset + len(texts)]
+        self.offset += len(texts)
+        return batch
+
+
+def bench_upsert(records, vectors):
+    index = InMemoryIndex()
+    stats = ingest_records(index, PrecomputedEncoder(vectors), records)
+    return {"upsert_s": stats["seconds"], "upsert_vectors_per_s": stats["vectors_per_second"]}
+
+
+def synthetic_vectors(count, seed=0):
+    """Random unit vectors standing in for embeddings; search and upsert cost don't depend on their content"""
+    vectors = np.random.default_rng([seed, count]).standard_normal((count, DIMENSION)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def bench_model_encode(model_name, encoder_backend, texts):
+    if model_name:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(model_name)
+    else:
+        from rag_nomad_foods_encoder import build_encoder
+        model = build_encoder(encoder_backend)
+    return bench_encode(model, texts)
+
+
+def bench_corpus(faq_file, size, component, index_type="flat", seed=0):
+    """One component on one corpus size; builds its own corpus so it can run in a separate process"""
+    data = synthetic_faq_data(load_faq_data(faq_file), size)
+    if component == "load":
+        return bench_load(data)
+    records = list(iter_faq_records(data))
+    vectors = synthetic_vectors(len(records), seed)
+    if component == "search":
+        return bench_search(vectors, index_type, seed=seed)
+    return bench_upsert(records, vectors)
+
+
+def run_benchmarks(faq_file="faq_data.json", sizes=CORPUS_SIZES, components=COMPONENTS,
+                   encode_samples=512, model_name=None, seed=0, index_types=("flat",), encoder_backend=None):
+    """Every component runs in its own process, so each one reports its own peak_rss_mb"""
+    source = load_faq_data(faq_file)
+    results = {"meta": {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "sizes": list(sizes),
+        "components": list(components),
+        "index_types": list(index_types),
+        "encoder_backend": encoder_backend
+    }}
+
+    if "encode" in components:
+        # Encode throughput doesn't depend on corpus size, so it runs once on a sample
+        texts = [r["question"] for r in iter_faq_records(synthetic_faq_data(source, encode_samples))]
+        results["encode"] = isolated(bench_model_encode, model_name, encoder_backend, texts)
+        print(f"encode: {results['encode']}")
+
+    for size in sizes:
+        section = {}
+        if "load" in components:
+            section["load"] = isolated(bench_corpus, faq_file, size, "load", "flat", seed)
+        if "search" in components:
+            for index_type in index_types:
+                # The exact index keeps the "search" key so older baselines still compare
+                key = "search" if index_type == "flat" else f"search_{index_type}"
+                section[key] = isolated(bench_corpus, faq_file, size, "search", index_type, seed)
+        if "upsert" in components:
+            section["upsert"] = isolated(bench_corpus, faq_file, size, "upsert", "flat", seed)
+        results[f"corpus_{size}"] = section
+        print(f"corpus_{size}: {section}")
+    return results
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        if key == "meta":
+            continue
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare_to_baseline(results, baseline, tolerance=0.2):
+    """Metrics that got worse than the baseline by more than `tolerance` (relative)"""
+    current, previous = flatten(results), flatten(baseline)
+    regressions = []
+    for name, value in sorted(current.items()):
+        base = previous.get(name)
+        if not base:
+            continue
+        if name.endswith("_per_s"):
+            change = (base - value) / base
+        elif name.endswith(("_ms", "_s")):
+            seconds = (value - base) / 1000 if name.endswith("_ms") else value - base
+            if seconds < MIN_TIME_CHANGE_S:
+                continue
+            change = (value - base) / base
+        elif name.endswith("_mb"):
+            change = (value - base) / base
+        else:
+            continue
+        if change > tolerance:
+            regressions.append({"metric": name, "baseline": base, "current": value, "worse_by": change})
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Nomad Foods RAG component micro-benchmarks")
+    parser.add_argument("--faq-file", default="faq_data.json")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(CORPUS_SIZES))
+    parser.add_argument("--components", nargs="+", choices=COMPONENTS, default=list(COMPONENTS))
+    parser.add_argument("--index-types", nargs="+", choices=INDEX_TYPES, default=["flat"],
+                        help="FAISS index types measured by the search benchmark")
+    parser.add_argument("--encode-samples", type=int, default=512, help="Texts used for the encode benchmark")
+    parser.add_argument("--model", default=None, help="SentenceTransformer model (default: the app's encoder)")
+    parser.add_argument("--encoder-backend", choices=["sentence-transformers", "onnx"], default=None,
+                        help="Encoder backend measured by the encode benchmark (default: ENCODER_BACKEND)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Compare against this results file")
+    parser.add_argument("--save-baseline", help="Also write the results to this baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.faq_file, args.sizes, args.components, args.encode_samples, args.model,
+                              index_types=args.index_types, encoder_backend=args.encoder_backend)
+    if args.baseline:
+        with open(args.baseline) as f:
+            results["regressions"] = compare_to_baseline(results, json.load(f), args.tolerance)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({k: v for k, v in results.items() if k != "regressions"}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    for regression in results.get("regressions", []):
+        print(f"REGRESSION {regression['metric']}: {regression['baseline']:.4g} -> "
+              f"{regression['current']:.4g} ({regression['worse_by']:+.0%})")
+    sys.exit(1 if results.get("regressions") else 0)
@@ -0,0 +1,64 @@
+import argparse
+import os
+import sys
+from rag_nomad_foods_encoder import ENCODER_BACKEND, EMBEDDING_DIM, MODEL_NAME, embedding_dimension, run_check
+
+# Build step of the Docker image: everything a new pod would otherwise download
+# or compute before answering its first query is written into the image.
+#   python rag_nomad_foods_build_artifacts.py --models   # encoder and cross-encoder weights (HF_HOME)
+#   python rag_nomad_foods_build_artifacts.py --index    # ONNX encoder, embedding cache, local FAISS index and document store
+
+
+def download_models():
+    from sentence_transformers import CrossEncoder, SentenceTransformer
+    from rag_nomad_foods_reranker import RERANKER_MODEL
+    SentenceTransformer(MODEL_NAME)
+    CrossEncoder(RERANKER_MODEL)
+    print(f"Downloaded {MODEL_NAME} and {RERANKER_MODEL}")
+
+
+def prepare_encoder(faq_file="faq_data_with_ids.json", ground_truth_file="ground-truth-data.csv"):
+    """Export the ONNX encoder if it is configured; a non-reference encoder must pass its agreement check"""
+    if ENCODER_BACKEND == "onnx":
+        from rag_nomad_foods_encoder import export_onnx_model
+        export_onnx_model()
+    if ENCODER_BACKEND != "sentence-transformers" or EMBEDDING_DIM:
+        return run_check(ENCODER_BACKEND, embedding_dimension(), faq_file, ground_truth_file)
+    return True
+
+
+def build_local_index(faq_file="faq_data.json", ground_truth_file="ground-truth-data.csv", backend="faiss"):
+    """Embed the FAQ through the embedding cache and write the local index, as the app would on its first start"""
+    from rag_nomad_foods_ann_index import ground_truth_query_vectors
+    from rag_nomad_foods_chatbot import ENCODER_NAME, VECTOR_STORE_DIR, load_model
+    from rag_nomad_foods_doc_store import build_document_store_from_file
+    from rag_nomad_foods_embedding_cache import EmbeddingCache
+    from rag_nomad_foods_ingestion import ingest_faq
+    from rag_nomad_foods_vector_store import open_local_vector_store
+    encoder = EmbeddingCache(load_model(), ENCODER_NAME)
+    store = open_local_vector_store(backend, VECTOR_STORE_DIR)
+    if getattr(store, "index_type", "flat") != "flat" and os.path.exists(ground_truth_file):
+        store.guardrail_queries = ground_truth_query_vectors(encoder, ground_truth_file)
+    store.delete(delete_all=True)
+    ingest_faq(store, encoder, faq_file)
+    documents = build_document_store_from_file(faq_file, VECTOR_STORE_DIR)
+    print(f"Wrote {len(documents)} documents to {documents.path}")
+    print(f"Built the {backend} index in {VECTOR_STORE_DIR}: {store.describe_index_stats()}")
+    if hasattr(store, "index_report"):
+        print(f"Deployed index: {store.index_report()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bake model weights and the vector index into the image")
+    parser.add_argument("--models", action="store_true", help="Download the model weights")
+    parser.add_argument("--index", action="store_true", help="Prepare the encoder and build the local index")
+    parser.add_argument("--faq-file", default="faq_data.json")
+    parser.add_argument("--backend", default="faiss", choices=["faiss", "numpy"])
+    args = parser.parse_args()
+
+    if args.models or not args.index:
+        download_models()
+    if args.index or not args.models:
+        if not prepare_encoder():
+            sys.exit(1)
+        build_local_index(args.faq_file, backend=args.backend)
@@ -1,9 +1,22 @@
 import os
-import json
-import requests
+import threading
+import time
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone, ServerlessSpec, CloudProvider, VectorType
+from rag_nomad_foods_answer_cache import cache_key, create_answer_cache
+from rag_nomad_foods_batching_encoder import get_query_encoder
+from rag_nomad_foods_doc_store import MissingDocumentsError, attach_documents
+from rag_nomad_foods_embedding_cache import EmbeddingCache
+from rag_nomad_foods_encoder import embedding_dimension, encoder_name, load_encoder
+from rag_nomad_foods_hot_reload import IndexReloader
+from rag_nomad_foods_ingestion import ingest_faq
+from rag_nomad_foods_llm_client import LLMError, get_llm_client
+from rag_nomad_foods_tenants import (
+    UnknownTenantError, open_tenant_indexes, tenant_company_name, tenant_directory, validate_tenant
+)
+from rag_nomad_foods_tracing import span, start_span
+from rag_nomad_foods_vector_store import (
+    EncoderMismatchError, PineconeVectorStore, check_index_encoder, open_local_vector_store
+)
 
 load_dotenv()
 
@@ -11,64 +24,226 @@ PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_REGION = os.getenv("PINECONE_ENV")
 PINECONE_INDEX = os.getenv("PINECONE_INDEX")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+# Embedding cache key of the configured encoder (ENCODER_BACKEND / EMBEDDING_DIM)
+ENCODER_NAME = encoder_name()
+# "pinecone", "faiss" or "numpy"; the local backends persist under VECTOR_STORE_DIR
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "vector_store")
+# Touched once warm_up() has finished, for exec readiness probes
+READY_FILE = os.getenv("READY_FILE")
 
 # Don't decorate this with @st.cache_* here
 def init_pinecone():
+    # Imported here so importing this module stays cheap for the UI and local backends
+    from pinecone import Pinecone, ServerlessSpec, CloudProvider, VectorType
     pc = Pinecone(api_key=PINECONE_API_KEY)
     existing = [idx["name"] for idx in pc.list_indexes()]
     if PINECONE_INDEX not in existing:
         pc.create_index(
             name=PINECONE_INDEX,
-            dimension=768,
+            dimension=embedding_dimension(),
             metric="cosine",
             spec=ServerlessSpec(cloud=CloudProvider.AWS, region=PINECONE_REGION),
-            vector_type=VectorType.DENSE
+            vector_type=VectorType.DENSE,
+            tags={"encoder": ENCODER_NAME}
         )
-    return pc.Index(name=PINECONE_INDEX)
+    # The encoder that writes the index is recorded in its tags; untagged indexes predate them
+    tags = pc.describe_index(name=PINECONE_INDEX).tags or {}
+    return pc.Index(name=PINECONE_INDEX), tags.get("encoder")
+
+def init_vector_store(backend=None, tenant=None, check_encoder=True):
+    # A tenant gets its own Pinecone namespace / local index (rag_nomad_foods_tenants.py);
+    # check_encoder=False skips the encoder check for callers that are about to re-index it anyway
+    backend = backend or VECTOR_BACKEND
+    directory = tenant_directory(VECTOR_STORE_DIR, tenant) if tenant else VECTOR_STORE_DIR
+    if backend == "pinecone":
+        index, encoder = init_pinecone()
+        store = PineconeVectorStore(index, namespace=validate_tenant(tenant) if tenant else None)
+        store.encoder = encoder
+    else:
+        store = open_local_vector_store(backend, directory)
+    try:
+        if check_encoder:
+            check_index_encoder(store, ENCODER_NAME, embedding_dimension())
+    except EncoderMismatchError as e:
+        # Only the default local index can be rebuilt here: it is this process's own copy of faq_data.json.
+        # A Pinecone index is shared by every pod; delete it and the app recreates and reseeds it.
+        if backend == "pinecone" or tenant:
+            raise
+        print(f"{e}; rebuilding it from faq_data.json")
+        store.delete(delete_all=True)
+        ingest_faq(store, EmbeddingCache(load_model(), ENCODER_NAME), "faq_data.json")
+    # Vectors only carry ids; the text comes from the corpus' memory-mapped document store
+    return attach_documents(store, directory, None if tenant else "faq_data.json")
 
 def load_model():
-    return SentenceTransformer("all-mpnet-base-v2")
+    return load_encoder()
 
 def upsert_faq(index, model):
-    with open("faq_data.json", "r") as f:
-        qa_data = json.load(f)
-
     stats = index.describe_index_stats()
     if stats["total_vector_count"] == 0:
-        batch = []
-        for i, cat in enumerate(qa_data["faq_data"]):
-            for j, qa in enumerate(cat["questions"]):
-                vec = model.encode(qa["question"]).tolist()
-                batch.append({
-                    "id": f"faq_{i}_{j}",
-                    "values": vec,
-                    "metadata": {"question": qa["question"], "answer": qa["answer"]}
-                })
-        index.upsert(vectors=batch)
+        ingest_faq(index, EmbeddingCache(model, ENCODER_NAME), "faq_data.json")
+
+# Built once per process and shared by every Streamlit session: the model stays
+# warm, the index handle stays open and the "is the index populated" check
+# (describe_index_stats) only runs the first time. Concurrent single-query
+# encodes are micro-batched (or sent to the encoder sidecar) by get_query_encoder().
+# A `tenant` routes a query to that tenant's namespace / local index instead of the default one.
+class FaqRetriever:
+    def __init__(self, index=None, model=None, tenants=None):
+        self.index = index if index is not None else init_vector_store()
+        self.model = model if model is not None else get_query_encoder()
+        self.tenants = tenants if tenants is not None else open_tenant_indexes(
+            self.index, VECTOR_STORE_DIR, ENCODER_NAME, embedding_dimension()
+        )
+        upsert_faq(self.index, self.model)
+
+    def encode(self, query):
+        with span("embed"):
+            return self.model.encode(query)
+
+    def search(self, query, top_k=1, tenant=None):
+        return self.search_by_vector(self.encode(query), top_k, tenant)
+
+    def search_by_vector(self, q_vec, top_k=1, tenant=None):
+        # One read: a hot reload swaps the index and its documents together
+        index = self.index if tenant is None else self.tenants.get(tenant)
+        documents = index.documents
+        with span("vector_search", backend=type(index).__name__, top_k=top_k, tenant=tenant):
+            resp = index.query(
+                vector=q_vec.tolist(),
+                top_k=top_k,
+                # Only indexes written before the document store carry the text in their metadata
+                include_metadata=documents is None
+            )
+        matches = resp["matches"]
+        if tenant is not None and not matches:
+            # An empty Pinecone namespace answers with no matches
+            raise UnknownTenantError(tenant)
+        if documents is None:
+            texts = {match["id"]: match.get("metadata") for match in matches}
+        else:
+            texts = {match["id"]: documents.get(match["id"]) for match in matches}
+            missing = [doc_id for doc_id, document in texts.items() if document is None]
+            if missing:
+                # Not in the document store (yet): vectors written before it carry their text in their metadata
+                fetched = index.fetch(missing)["vectors"]
+                texts.update({doc_id: fetched[doc_id].get("metadata") for doc_id in missing if doc_id in fetched})
+        results = [
+            {
+                "id": match["id"],
+                "score": match["score"],
+                "question": texts[match["id"]]["question"],
+                "answer": texts[match["id"]]["answer"]
+            }
+            for match in matches if texts[match["id"]]
+        ]
+        if matches and not results:
+            raise MissingDocumentsError([match["id"] for match in matches])
+        return results
+
+_retriever = None
+_retriever_lock = threading.Lock()
+
+def get_retriever():
+    global _retriever
+    if _retriever is None:
+        with _retriever_lock:
+            if _retriever is None:
+                _retriever = FaqRetriever()
+    return _retriever
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+def get_answer_cache():
+    global _answer_cache
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = create_answer_cache()
+    return _answer_cache
+
+_index_reloader = None
+_index_reloader_lock = threading.Lock()
+
+def get_index_reloader():
+    # Swaps a fresh index into get_retriever() whenever faq_data.json changes (FAQ_RELOAD_INTERVAL_S)
+    global _index_reloader
+    if _index_reloader is None:
+        with _index_reloader_lock:
+            if _index_reloader is None:
+                _index_reloader = IndexReloader(get_retriever(), ENCODER_NAME, directory=VECTOR_STORE_DIR).start()
+    return _index_reloader
+
+_ready = threading.Event()
+
+def warm_up():
+    # Model, index, answer cache and one throwaway encode (the first inference pays for lazy init)
+    get_retriever().encode("warm up")
+    get_answer_cache()
+    get_index_reloader()
+    _ready.set()
+    if READY_FILE:
+        with open(READY_FILE, "w") as f:
+            f.write("ready\n")
+
+def is_ready():
+    return _ready.is_set()
 
 # These are the ones you expose
-def search_similar_question(prompt):
-    index = init_pinecone()
-    model = load_model()
-    upsert_faq(index, model)
-    q_vec = model.encode(prompt).tolist()
-    resp = index.query(
-        vector=q_vec,
-        top_k=1,
-        include_metadata=True
-    )
-    match = resp["matches"][0]
-    return {"question": match["metadata"]["question"], "answer": match["metadata"]["answer"]}
-
-def generate_enhanced_answer(prompt, context, api_key):
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "HTTP-Referer": "https://github.com/ZiedTrikiDataScience/Nomad_Foods_RAG_LLM",
-        "X-Title": "NomadFoods FAQ Assistant"
-    }
+def search_similar_question(prompt, tenant=None):
+    # None when the index has no entry to match
+    with span("retrieve"):
+        matches = get_retriever().search(prompt, top_k=1, tenant=tenant)
+    if not matches:
+        return None
+    return {"question": matches[0]["question"], "answer": matches[0]["answer"]}
+
+def retrieve_faq(prompt, tenant=None):
+    # Best FAQ match plus the query embedding, so the answer cache can reuse it, and the tenant it belongs to;
+    # None when the index has no entry to match
+    with span("retrieve"):
+        retriever = get_retriever()
+        q_vec = retriever.encode(prompt)
+        matches = retriever.search_by_vector(q_vec, top_k=1, tenant=tenant)
+    if not matches:
+        return None
+    return {**matches[0], "query_vector": q_vec, "tenant": tenant}
+
+def lookup_cached_answer(faq):
+    with span("answer_cache") as cache_span:
+        cached = get_answer_cache().lookup(cache_key(faq["id"], faq.get("tenant")), faq["query_vector"], faq["answer"])
+        cache_span.set(cache_hit=cached is not None)
+    return cached
+
+def generate_cached_answer(prompt, faq, api_key):
+    # Paraphrases of an already answered question for the same FAQ skip the LLM call
+    if faq is None:
+        return NO_MATCH_ANSWER
+    cache = get_answer_cache()
+    cached = lookup_cached_answer(faq)
+    if cached is not None:
+        return cached
+    ans = generate_enhanced_answer(prompt, faq["answer"], api_key, company_name_for(faq.get("tenant")))
+    if not ans.startswith("❌"):
+        cache.store_answer(cache_key(faq["id"], faq.get("tenant")), faq["query_vector"], faq["answer"], ans)
+    return ans
+
+OPENROUTER_MODEL = "deepseek/deepseek-chat-v3-0324:free"
+# Returned instead of an LLM answer when retrieval finds no FAQ entry at all
+NO_MATCH_ANSWER = "Sorry, I couldn't find anything about that in our FAQ. Could you rephrase your question?"
+# The brand the default index answers for; a tenant's is recorded when it is indexed
+DEFAULT_COMPANY_NAME = "NomadFoods"
+
+def company_name_for(tenant=None):
+    if tenant is None:
+        return DEFAULT_COMPANY_NAME
+    return tenant_company_name(VECTOR_STORE_DIR, tenant) or "the company"
+
+def build_messages(prompt, context, company_name=DEFAULT_COMPANY_NAME):
     system_prompt = f"""
-    You are a friendly and helpful customer service representative at NomadFoods company.
+    You are a friendly and helpful customer service representative at {company_name}.
     Your responses should be warm, natural, and conversational while being informative.
     Context: {context}
     """
@@ -79,16 +254,64 @@ def generate_enhanced_answer(prompt, context, api_key):
     - Use bullet points
     - Offer to help more at the end
     """
-    payload = {
-        "model": "deepseek/deepseek-chat-v3-0324:free",
-        "messages": [
-            {"role": "system", "content": system_prompt.strip()},
-            {"role": "user", "content": enhanced_user_prompt.strip()}
-        ],
-        "max_tokens": 500,
-        "temperature": 0.7
-    }
-    r = requests.post(url, headers=headers, json=payload)
-    if r.status_code != 200:
-        return f"❌ OpenRouter error {r.status_code}: {r.text}"
-    return r.json()["choices"][0]["message"]["content"].strip()
+    return [
+        {"role": "system", "content": system_prompt.strip()},
+        {"role": "user", "content": enhanced_user_prompt.strip()}
+    ]
+
+def generate_enhanced_answer(prompt, context, api_key, company_name=DEFAULT_COMPANY_NAME):
+    client = get_llm_client("openrouter", api_key)
+    with span("llm", model=OPENROUTER_MODEL) as llm_span:
+        usage = {}
+        try:
+            return client.chat(build_messages(prompt, context, company_name), model=OPENROUTER_MODEL, max_tokens=500, temperature=0.7, usage=usage)
+        except LLMError as e:
+            llm_span.set(status="error", status_code=e.status_code)
+            return f"❌ OpenRouter error {e.status_code}: {e.body}"
+        finally:
+            llm_span.set(**usage)
+
+def stream_enhanced_answer(prompt, context, api_key, company_name=DEFAULT_COMPANY_NAME):
+    # Yields text deltas from the OpenRouter SSE stream as they arrive
+    client = get_llm_client("openrouter", api_key)
+    # Not a `with span(...)`: the generator is suspended between deltas
+    llm_span = start_span("llm", model=OPENROUTER_MODEL, stream=True)
+    usage = {}
+    chunks = 0
+    try:
+        for delta in client.stream_chat(build_messages(prompt, context, company_name), model=OPENROUTER_MODEL, max_tokens=500, temperature=0.7, usage=usage):
+            if not chunks:
+                llm_span.set(first_token_ms=llm_span.elapsed_ms())
+            chunks += 1
+            yield delta
+    except LLMError as e:
+        llm_span.set(status="error", status_code=e.status_code)
+        yield f"❌ OpenRouter error {e.status_code}: {e.body}"
+    finally:
+        llm_span.set(chunks=chunks, **usage).finish()
+
+def stream_cached_answer(prompt, faq, api_key, timings=None):
+    # Streaming counterpart of generate_cached_answer. `timings` receives the
+    # time to first token and the total time, in seconds.
+    timings = timings if timings is not None else {}
+    start = time.perf_counter()
+    if faq is None:
+        timings["first_token_s"] = timings["total_s"] = time.perf_counter() - start
+        yield NO_MATCH_ANSWER
+        return
+    cache = get_answer_cache()
+    cached = lookup_cached_answer(faq)
+    if cached is not None:
+        timings["first_token_s"] = timings["total_s"] = time.perf_counter() - start
+        yield cached
+        return
+    parts = []
+    for delta in stream_enhanced_answer(prompt, faq["answer"], api_key, company_name_for(faq.get("tenant"))):
+        if not parts:
+            timings["first_token_s"] = time.perf_counter() - start
+        parts.append(delta)
+        yield delta
+    timings["total_s"] = time.perf_counter() - start
+    ans = "".join(parts).strip()
+    if ans and not ans.startswith("❌"):
+        cache.store_answer(cache_key(faq["id"], faq.get("tenant")), faq["query_vector"], faq["answer"], ans)
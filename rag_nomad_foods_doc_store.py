@@ -0,0 +1,142 @@
+import argparse
+import os
+import numpy as np
+from rag_nomad_foods_faq_data import iter_faq_records, load_faq_data
+
+# FAQ text lives in one file per corpus (the default index, a tenant or a reload
+# snapshot) instead of in every vector's metadata:
+#   [n, id length]            two uint64
+#   offsets table             n rows (id, offset, category/question/answer byte lengths), sorted by id
+#   text blob                 utf-8 category + question + answer of every document
+# The file is memory-mapped read-only, so all worker processes on a node share one
+# page cache copy and a lookup only decodes the document it returns.
+#   python rag_nomad_foods_doc_store.py --faq-file faq_data_with_ids.json --directory vector_store
+
+DOCUMENT_STORE_FILE = "documents.bin"
+FIELDS = ("category", "question", "answer")
+
+
+class MissingDocumentsError(LookupError):
+    """Vectors matched, but neither the document store nor their metadata has their text"""
+
+    def __init__(self, ids):
+        super().__init__(f"No text for {', '.join(ids)}: rebuild documents.bin from the FAQ file the index was built from")
+        self.ids = ids
+
+
+def document_store_path(directory):
+    return os.path.join(directory, DOCUMENT_STORE_FILE)
+
+
+def _table_dtype(id_length):
+    return np.dtype([("id", f"S{id_length}"), ("offset", "<u8"), ("lengths", "<u4", len(FIELDS))])
+
+
+def build_document_store(records, directory):
+    """Write records (id, category, question, answer) to directory/documents.bin, replacing it atomically"""
+    encoded = {}
+    for record in records:
+        encoded[record["id"].encode()] = [record[field].encode() for field in FIELDS]
+    ids = sorted(encoded)
+    id_length = max((len(doc_id) for doc_id in ids), default=1)
+    table = np.zeros(len(ids), dtype=_table_dtype(id_length))
+    offset = 0
+    for row, doc_id in enumerate(ids):
+        lengths = [len(part) for part in encoded[doc_id]]
+        table[row] = (doc_id, offset, lengths)
+        offset += sum(lengths)
+    os.makedirs(directory, exist_ok=True)
+    path = document_store_path(directory)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(np.array([len(ids), id_length], dtype="<u8").tobytes())
+        f.write(table.tobytes())
+        for doc_id in ids:
+            f.write(b"".join(encoded[doc_id]))
+    os.replace(tmp_path, path)
+    return DocumentStore(path)
+
+
+def build_document_store_from_file(faq_file, directory):
+    return build_document_store(iter_faq_records(load_faq_data(faq_file)), directory)
+
+
+class DocumentStore:
+    """Read-only, memory-mapped id -> {"id", "category", "question", "answer"} lookup"""
+
+    def __init__(self, path):
+        self.path = path
+        self._map = np.memmap(path, dtype="uint8", mode="r")
+        count, id_length = self._map[:16].view("<u8")
+        dtype = _table_dtype(int(id_length))
+        table_end = 16 + int(count) * dtype.itemsize
+        self._table = self._map[16:table_end].view(dtype)
+        self._blob = self._map[table_end:]
+
+    def __len__(self):
+        return len(self._table)
+
+    def __contains__(self, doc_id):
+        return self._row(doc_id) is not None
+
+    def _row(self, doc_id):
+        key = doc_id.encode()
+        if len(key) > self._table.dtype["id"].itemsize:
+            return None
+        row = int(np.searchsorted(self._table["id"], key))
+        if row < len(self._table) and self._table["id"][row] == key:
+            return row
+        return None
+
+    def get(self, doc_id):
+        """The document with this id, or None"""
+        row = self._row(doc_id)
+        if row is None:
+            return None
+        entry = self._table[row]
+        start = int(entry["offset"])
+        document = {"id": doc_id}
+        for field, length in zip(FIELDS, entry["lengths"]):
+            end = start + int(length)
+            document[field] = self._blob[start:end].tobytes().decode()
+            start = end
+        return document
+
+    def nbytes(self):
+        return self._map.nbytes
+
+
+def open_document_store(directory):
+    """The DocumentStore under `directory`, or None if it hasn't been built"""
+    path = document_store_path(directory)
+    return DocumentStore(path) if os.path.exists(path) else None
+
+
+def attach_documents(store, directory, faq_file=None):
+    """
+    Give a vector store the document store of its corpus (store.documents),
+    building it from `faq_file` first if it is missing. Returns the store.
+
+    Ids are content hashes, so any document store holding an id has its text.
+    A store that can list its ids only gets documents covering all of them;
+    otherwise (e.g. an index written before the document store, with the text
+    in its metadata) documents stay None and the metadata is read instead.
+    """
+    documents = open_document_store(directory)
+    if documents is None and faq_file is not None and os.path.exists(faq_file):
+        documents = build_document_store_from_file(faq_file, directory)
+    ids = store.ids()
+    if documents is not None and ids is not None and not all(doc_id in documents for doc_id in ids):
+        print(f"'{documents.path}' wasn't built for the index in '{store.directory}', reading the text from its metadata")
+        documents = None
+    store.documents = documents
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the memory-mapped FAQ document store")
+    parser.add_argument("--faq-file", default="faq_data_with_ids.json")
+    parser.add_argument("--directory", default=os.getenv("VECTOR_STORE_DIR", "vector_store"))
+    args = parser.parse_args()
+    documents = build_document_store_from_file(args.faq_file, args.directory)
+    print(f"Wrote {len(documents)} documents ({documents.nbytes()} bytes) to {documents.path}")
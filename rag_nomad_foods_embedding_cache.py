@@ -0,0 +1,117 @@
+import fcntl
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+import numpy as np
+from rag_nomad_foods_faq_data import content_hash
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".embedding_cache")
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding store keyed by model name + md5 of the encoded text.
+
+    Vectors live in one append-only float32 file that is read back through a
+    memory map, row order is recorded in keys.json. Only texts whose hash is not
+    in the store yet are sent to model.encode, so a cold start costs as much as
+    the corpus changed since the last run. Several processes can share the
+    directory: appends and keys.json rewrites happen under a file lock, after
+    re-reading what the other processes wrote.
+    """
+
+    def __init__(self, model, model_name, cache_dir=EMBEDDING_CACHE_DIR):
+        self.model = model
+        self.model_name = model_name
+        self.directory = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+        self.vectors_path = os.path.join(self.directory, "vectors.f32")
+        self.keys_path = os.path.join(self.directory, "keys.json")
+        self.dim = None
+        self._rows = {}
+        self._vectors = None
+        self._lock = threading.Lock()
+        self._load()
+
+    @contextmanager
+    def _file_lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _load(self):
+        if not os.path.exists(self.keys_path):
+            return
+        with self._file_lock():
+            self._reload()
+
+    def _reload(self):
+        # Caller holds the file lock
+        if not (os.path.exists(self.keys_path) and os.path.exists(self.vectors_path)):
+            return
+        with open(self.keys_path, "r") as f:
+            meta = json.load(f)
+        keys = meta["keys"]
+        self.dim = meta["dim"]
+        # A crash between appending vectors and rewriting keys.json leaves
+        # unreferenced rows at the end of the file; drop them.
+        expected_size = len(keys) * self.dim * 4
+        if os.path.getsize(self.vectors_path) != expected_size:
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(expected_size)
+        self._rows = {key: row for row, key in enumerate(keys)}
+        self._map()
+
+    def _map(self):
+        if self._rows:
+            self._vectors = np.memmap(
+                self.vectors_path, dtype="float32", mode="r", shape=(len(self._rows), self.dim)
+            )
+
+    def _append(self, keys, vectors):
+        with self._file_lock():
+            # Another process may have appended since we last looked; its rows come first
+            self._reload()
+            fresh = [i for i, key in enumerate(keys) if key not in self._rows]
+            if not fresh:
+                return
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.ascontiguousarray(vectors[fresh], dtype="float32").tobytes())
+            for i in fresh:
+                self._rows[keys[i]] = len(self._rows)
+            ordered_keys = sorted(self._rows, key=self._rows.get)
+            tmp_path = f"{self.keys_path}.tmp-{os.getpid()}"
+            with open(tmp_path, "w") as f:
+                json.dump({"model": self.model_name, "dim": self.dim, "keys": ordered_keys}, f)
+            os.replace(tmp_path, self.keys_path)
+            self._map()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def encode(self, texts, batch_size=32):
+        """Return a (len(texts), dim) float32 matrix, encoding only uncached texts"""
+        texts = list(texts)
+        hashes = [content_hash(text) for text in texts]
+        with self._lock:
+            missing = {}
+            for key, text in zip(hashes, texts):
+                if key not in self._rows and key not in missing:
+                    missing[key] = text
+        # Encode outside the lock so concurrent callers can use the model in parallel
+        if missing:
+            new_vectors = np.asarray(
+                self.model.encode(list(missing.values()), batch_size=batch_size),
+                dtype="float32"
+            )
+        with self._lock:
+            if missing:
+                if self.dim is None:
+                    self.dim = new_vectors.shape[1]
+                self._append(list(missing), new_vectors)
+            if not texts:
+                return np.empty((0, self.dim or 0), dtype="float32")
+            rows = [self._rows[key] for key in hashes]
+            return np.asarray(self._vectors[rows])
@@ -0,0 +1,294 @@
+import argparse
+import inspect
+import json
+import os
+import sys
+import time
+import numpy as np
+
+# Query/document encoders. The default is the full-precision SentenceTransformer;
+# ENCODER_BACKEND=onnx runs an int8-quantized ONNX export of the same model,
+# without torch in the serving process:
+#   python rag_nomad_foods_encoder.py export            # writes ONNX_MODEL_DIR and checks it
+#   python rag_nomad_foods_encoder.py check --backend onnx --dimension 256
+# A backend other than the full-precision model only loads once its top-k
+# agreement with it on the ground-truth questions has been checked.
+
+MODEL_NAME = "all-mpnet-base-v2"
+DIMENSION = 768
+# "sentence-transformers" (fp32, default) or "onnx"
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "sentence-transformers")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "onnx_model")
+# Keep the first EMBEDDING_DIM dimensions (Matryoshka-style truncation); 0 keeps all 768
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "0"))
+ENCODER_THREADS = int(os.getenv("ENCODER_THREADS", "0"))
+ENCODER_AGREEMENT_K = int(os.getenv("ENCODER_AGREEMENT_K", "5"))
+ENCODER_AGREEMENT_FLOOR = float(os.getenv("ENCODER_AGREEMENT_FLOOR", "0.9"))
+ENCODER_AGREEMENT_FILE = os.getenv("ENCODER_AGREEMENT_FILE", "encoder_agreement.json")
+# all-mpnet-base-v2's max_seq_length
+MAX_SEQ_LENGTH = 384
+
+
+class EncoderAgreementError(Exception):
+    pass
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def encoder_name(backend=None, dimension=None):
+    """Model name plus backend and dimension; also keys the embedding cache, so encoders never share vectors"""
+    backend = backend or ENCODER_BACKEND
+    dimension = dimension or EMBEDDING_DIM or DIMENSION
+    name = MODEL_NAME
+    if backend == "onnx":
+        config_path = os.path.join(ONNX_MODEL_DIR, "encoder.json")
+        quantized = True
+        if os.path.exists(config_path):
+            with open(config_path, "r") as f:
+                quantized = json.load(f).get("quantized", True)
+        name = f"{MODEL_NAME}-onnx-int8" if quantized else f"{MODEL_NAME}-onnx"
+    return name if dimension == DIMENSION else f"{name}-{dimension}d"
+
+
+def embedding_dimension():
+    return EMBEDDING_DIM or DIMENSION
+
+
+class OnnxEncoder:
+    """
+    SentenceTransformer-compatible encode() over the ONNX export written by
+    export_onnx_model(): tokenizer, transformer, mean pooling and
+    normalisation, on onnxruntime's CPU provider.
+    """
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, threads=ENCODER_THREADS):
+        import onnxruntime
+        from transformers import AutoTokenizer
+        with open(os.path.join(model_dir, "encoder.json"), "r") as f:
+            self.config = json.load(f)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, self.config["file"]), options, providers=["CPUExecutionProvider"]
+        )
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        vectors = np.empty((len(texts), self.config["dimension"]), dtype="float32")
+        # Batching texts of similar length keeps padding, and wasted compute, low
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            tokens = self.tokenizer(
+                [texts[row] for row in rows], padding=True, truncation=True,
+                max_length=self.config["max_seq_length"], return_tensors="np"
+            )
+            vectors[rows] = self.session.run(None, {
+                "input_ids": tokens["input_ids"].astype("int64"),
+                "attention_mask": tokens["attention_mask"].astype("int64")
+            })[0]
+        return vectors[0] if single else vectors
+
+
+class TruncatedEncoder:
+    """Keeps the first `dimension` dimensions of another encoder's vectors, re-normalised"""
+
+    def __init__(self, encoder, dimension):
+        self.encoder = encoder
+        self.dimension = dimension
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        vectors = np.asarray(self.encoder.encode(texts, batch_size=batch_size, **kwargs), dtype="float32")
+        return normalize(vectors[..., :self.dimension])
+
+
+def export_onnx_model(output_dir=ONNX_MODEL_DIR, model_name=MODEL_NAME, quantize=True):
+    """Export the SentenceTransformer (transformer + mean pooling + normalisation) to ONNX, int8 weights by default"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    class Pooled(torch.nn.Module):
+        def __init__(self, transformer):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, input_ids, attention_mask):
+            tokens = self.transformer(input_ids=input_ids, attention_mask=attention_mask)[0]
+            mask = attention_mask.unsqueeze(-1).to(tokens.dtype)
+            pooled = (tokens * mask).sum(1) / mask.sum(1).clamp(min=1e-9)
+            return torch.nn.functional.normalize(pooled, p=2, dim=1)
+
+    os.makedirs(output_dir, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    model.tokenizer.save_pretrained(output_dir)
+    sample = model.tokenizer(["Where are Nomad Foods products made?"], return_tensors="pt")
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    # The TorchScript exporter; torch >= 2.9 defaults to the dynamo one, which needs onnxscript
+    legacy = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    torch.onnx.export(
+        Pooled(model[0].auto_model).eval(),
+        (sample["input_ids"], sample["attention_mask"]),
+        fp32_path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["sentence_embedding"],
+        dynamic_axes={"input_ids": {0: "batch", 1: "tokens"}, "attention_mask": {0: "batch", 1: "tokens"},
+                      "sentence_embedding": {0: "batch"}},
+        opset_version=14,
+        **legacy
+    )
+    file_name = "model.onnx"
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        file_name = "model_int8.onnx"
+        quantize_dynamic(fp32_path, os.path.join(output_dir, file_name), weight_type=QuantType.QInt8)
+        os.remove(fp32_path)
+    with open(os.path.join(output_dir, "encoder.json"), "w") as f:
+        json.dump({
+            "model": model_name,
+            "file": file_name,
+            "quantized": quantize,
+            "dimension": model.get_sentence_embedding_dimension(),
+            "max_seq_length": min(model.max_seq_length, MAX_SEQ_LENGTH)
+        }, f, indent=2)
+    print(f"Exported {model_name} to {os.path.join(output_dir, file_name)}")
+
+
+def build_encoder(backend=None, dimension=None):
+    """Encoder for `backend` and `dimension`, without the agreement check"""
+    backend = backend or ENCODER_BACKEND
+    dimension = dimension or EMBEDDING_DIM
+    if backend == "sentence-transformers":
+        from sentence_transformers import SentenceTransformer
+        encoder = SentenceTransformer(MODEL_NAME)
+    elif backend == "onnx":
+        encoder = OnnxEncoder()
+    else:
+        raise ValueError(f"Unknown encoder backend '{backend}', expected 'sentence-transformers' or 'onnx'")
+    if dimension and dimension != DIMENSION:
+        encoder = TruncatedEncoder(encoder, dimension)
+    return encoder
+
+
+def load_agreement_records(path=ENCODER_AGREEMENT_FILE):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def load_encoder(backend=None, dimension=None, floor=None):
+    """
+    The configured encoder. Anything but the full-precision, full-dimension
+    model must have a check_agreement() result (recorded in
+    ENCODER_AGREEMENT_FILE) at or above `floor` (ENCODER_AGREEMENT_FLOOR),
+    otherwise EncoderAgreementError is raised. The floor a check was run with
+    is only informative: the configured one applies when the encoder loads.
+    """
+    floor = ENCODER_AGREEMENT_FLOOR if floor is None else floor
+    name = encoder_name(backend, dimension)
+    if name != MODEL_NAME:
+        record = load_agreement_records().get(name)
+        if record is None:
+            raise EncoderAgreementError(
+                f"{name} has not been checked against {MODEL_NAME}; run "
+                f"'python rag_nomad_foods_encoder.py check --backend {backend or ENCODER_BACKEND} "
+                f"--dimension {dimension or embedding_dimension()}'"
+            )
+        if record["agreement"] < floor:
+            raise EncoderAgreementError(
+                f"{name} top-{record['k']} agreement with {MODEL_NAME} is {record['agreement']:.4f}, "
+                f"below the floor of {floor}"
+            )
+    return build_encoder(backend, dimension)
+
+
+def top_k_rows(doc_vectors, query_vectors, k):
+    scores = query_vectors @ doc_vectors.T
+    return np.argsort(-scores, axis=1, kind="stable")[:, :k]
+
+
+def timed_encode(encoder, texts, repeat=20):
+    """Mean single-query encode latency in milliseconds"""
+    encoder.encode(texts[0])
+    start = time.perf_counter()
+    for text in texts[:repeat]:
+        encoder.encode(text)
+    return (time.perf_counter() - start) * 1000 / min(repeat, len(texts))
+
+
+def check_agreement(candidate, reference, faq_file="faq_data_with_ids.json",
+                    ground_truth_file="ground-truth-data.csv", k=None):
+    """
+    Top-k agreement of `candidate` with `reference` on the ground-truth
+    questions: each encoder ranks the FAQ questions it encoded itself, and
+    agreement is the mean overlap of the two top-k lists. Also returns
+    hit-rate@k of both and their single-query latency.
+    """
+    from rag_nomad_foods_evaluation import load_ground_truth, rank_metrics
+    from rag_nomad_foods_faq_data import iter_faq_records, load_faq_data
+    records = list(iter_faq_records(load_faq_data(faq_file)))
+    doc_ids = np.asarray([record["id"] for record in records], dtype=object)
+    documents = [record["question"] for record in records]
+    questions, relevant = load_ground_truth(ground_truth_file)
+    k = min(k or ENCODER_AGREEMENT_K, len(records))
+
+    rows = {}
+    report = {"k": k, "queries": len(questions)}
+    for name, encoder in (("reference", reference), ("candidate", candidate)):
+        doc_vectors = normalize(np.asarray(encoder.encode(documents), dtype="float32"))
+        query_vectors = normalize(np.asarray(encoder.encode(questions), dtype="float32"))
+        rows[name] = top_k_rows(doc_vectors, query_vectors, k)
+        report[f"{name}_hit_rate"] = rank_metrics(doc_ids[rows[name]], relevant)["hit_rate"]
+        report[f"{name}_query_ms"] = timed_encode(encoder, questions)
+        report[f"{name}_dimension"] = int(doc_vectors.shape[1])
+    overlap = [len(set(a) & set(b)) / k for a, b in zip(rows["candidate"], rows["reference"])]
+    report["agreement"] = float(np.mean(overlap)) if overlap else 1.0
+    report["top1_agreement"] = float(np.mean(rows["candidate"][:, 0] == rows["reference"][:, 0]))
+    return report
+
+
+def record_agreement(name, report, floor=None, path=ENCODER_AGREEMENT_FILE):
+    records = load_agreement_records(path)
+    records[name] = {**report, "floor": ENCODER_AGREEMENT_FLOOR if floor is None else floor}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(records, f, indent=2)
+    os.replace(tmp_path, path)
+    return records[name]
+
+
+def run_check(backend, dimension, faq_file, ground_truth_file, floor=None, reference=None):
+    reference = reference or build_encoder("sentence-transformers", DIMENSION)
+    name = encoder_name(backend, dimension)
+    record = record_agreement(name, check_agreement(build_encoder(backend, dimension), reference,
+                                                    faq_file, ground_truth_file), floor)
+    print(f"{name}: top-{record['k']} agreement {record['agreement']:.4f} (floor {record['floor']}), "
+          f"hit_rate {record['candidate_hit_rate']:.4f} vs {record['reference_hit_rate']:.4f}, "
+          f"{record['candidate_query_ms']:.1f} ms vs {record['reference_query_ms']:.1f} ms per query")
+    return record["agreement"] >= record["floor"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export and check the query encoders")
+    parser.add_argument("command", choices=["export", "check"])
+    parser.add_argument("--backend", default="onnx", choices=["sentence-transformers", "onnx"])
+    parser.add_argument("--dimension", type=int, nargs="+", default=sorted({DIMENSION, embedding_dimension()}),
+                        help="Embedding dimensions to check (Matryoshka-style truncation)")
+    parser.add_argument("--no-quantize", action="store_true", help="Export fp32 ONNX weights")
+    parser.add_argument("--faq-file", default="faq_data_with_ids.json")
+    parser.add_argument("--ground-truth", default="ground-truth-data.csv")
+    parser.add_argument("--floor", type=float, default=None)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_onnx_model(quantize=not args.no_quantize)
+    reference = build_encoder("sentence-transformers", DIMENSION)
+    passed = [run_check(args.backend, dimension, args.faq_file, args.ground_truth, args.floor, reference)
+              for dimension in args.dimension]
+    sys.exit(0 if all(passed) else 1)
@@ -0,0 +1,191 @@
+import argparse
+import csv
+import json
+import math
+import time
+from collections import Counter, defaultdict
+import numpy as np
+from rag_nomad_foods_faq_data import iter_faq_records, load_faq_data
+from rag_nomad_foods_hybrid_retriever import tokenize
+
+# Batch retrieval evaluation: every query is encoded in one pass, each backend
+# answers the whole query set with one multi-query search, and hit-rate / MRR
+# are computed on the (n_queries, k) matrix of retrieved ids.
+#   python rag_nomad_foods_evaluation.py --k 5 --vector-backend faiss
+
+
+def load_ground_truth(file_path="ground-truth-data.csv"):
+    """Questions and the id of the FAQ document that answers each of them"""
+    questions, documents = [], []
+    with open(file_path, newline="") as f:
+        for row in csv.DictReader(f):
+            questions.append(row["question"])
+            documents.append(row["document"])
+    return questions, np.asarray(documents, dtype=object)
+
+
+def encode_texts(encoder, texts, batch_size=64):
+    """One batched encode (SentenceTransformer or EmbeddingCache), L2-normalised float32"""
+    vectors = np.asarray(encoder.encode(texts, batch_size=batch_size), dtype="float32")
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class VectorizedBM25:
+    """
+    BM25 with the same tokenizer, k1, b and Lucene-style IDF as the serving
+    BM25Index, precomputed as one weight per (term, document) posting. Scoring
+    a batch of queries is a handful of array additions per query term.
+    """
+
+    def __init__(self, texts, k1=1.5, b=0.75):
+        postings = defaultdict(list)
+        lengths = np.zeros(len(texts), dtype="float32")
+        for doc, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths[doc] = sum(counts.values())
+            for term, tf in counts.items():
+                postings[term].append((doc, tf))
+        n_docs = len(texts)
+        avg_len = lengths.mean() if n_docs else 0.0
+        norm = k1 * (1 - b + b * lengths / avg_len) if avg_len else np.full(n_docs, k1, dtype="float32")
+        self.n_docs = n_docs
+        self.postings = {}
+        for term, entries in postings.items():
+            docs = np.fromiter((doc for doc, _ in entries), dtype=np.int64, count=len(entries))
+            tf = np.fromiter((tf for _, tf in entries), dtype="float32", count=len(entries))
+            idf = math.log(1 + (n_docs - len(entries) + 0.5) / (len(entries) + 0.5))
+            self.postings[term] = (docs, (idf * tf * (k1 + 1) / (tf + norm[docs])).astype("float32"))
+
+    def scores(self, queries):
+        """(n_queries, n_docs) score matrix"""
+        scores = np.zeros((len(queries), self.n_docs), dtype="float32")
+        for row, query in enumerate(queries):
+            for term in set(tokenize(query)):
+                if term in self.postings:
+                    docs, weights = self.postings[term]
+                    scores[row, docs] += weights
+        return scores
+
+    def search_many(self, queries, top_k=5, chunk_size=1024):
+        """(n_queries, top_k) document rows, best first; scored in chunks to bound memory"""
+        top_k = min(top_k, self.n_docs)
+        results = []
+        for start in range(0, len(queries), chunk_size):
+            scores = self.scores(queries[start:start + chunk_size])
+            top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+            order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+            results.append(np.take_along_axis(top, order, axis=1))
+        return np.vstack(results) if results else np.empty((0, top_k), dtype=np.int64)
+
+
+def flat_search_many(doc_vectors, query_vectors, top_k=5):
+    """Exact inner-product search of every query in one faiss call; (n_queries, top_k) document rows"""
+    import faiss
+    index = faiss.IndexFlatIP(doc_vectors.shape[1])
+    index.add(np.ascontiguousarray(doc_vectors, dtype="float32"))
+    _, rows = index.search(np.ascontiguousarray(query_vectors, dtype="float32"), top_k)
+    return rows
+
+
+def vector_store_search_many(store, query_vectors, top_k=5):
+    """(n_queries, top_k) ids from any VectorStore (or Pinecone-like index), padded with None"""
+    if hasattr(store, "query_many"):
+        responses = store.query_many(query_vectors, top_k=top_k)
+    else:
+        responses = [store.query(vector=v.tolist(), top_k=top_k) for v in query_vectors]
+    ids = np.full((len(responses), top_k), None, dtype=object)
+    for row, response in enumerate(responses):
+        for col, match in enumerate(response["matches"][:top_k]):
+            ids[row, col] = match["id"]
+    return ids
+
+
+def rank_metrics(retrieved_ids, relevant_ids):
+    """
+    hit-rate@k and MRR from a (n_queries, k) array of retrieved ids (best
+    first) and the relevant id of each query. Also returns the per-query
+    reciprocal ranks, for slicing by category or diffing two runs.
+    """
+    hits = np.asarray(retrieved_ids, dtype=object) == np.asarray(relevant_ids, dtype=object)[:, None]
+    found = hits.any(axis=1)
+    reciprocal_ranks = np.where(found, 1.0 / (hits.argmax(axis=1) + 1), 0.0)
+    return {
+        "hit_rate": float(found.mean()) if len(found) else 0.0,
+        "mrr": float(reciprocal_ranks.mean()) if len(found) else 0.0,
+        "reciprocal_ranks": reciprocal_ranks
+    }
+
+
+def batch_cosine_similarity(a, b):
+    """Row-wise cosine similarity of two (n, dim) arrays, e.g. LLM answers vs ground-truth answers"""
+    a = np.asarray(a, dtype="float32")
+    b = np.asarray(b, dtype="float32")
+    dots = np.einsum("ij,ij->i", a, b)
+    norms = np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    return dots / np.where(norms == 0, 1, norms)
+
+
+def evaluate_retrieval(encoder, faq_file="faq_data_with_ids.json", ground_truth_file="ground-truth-data.csv",
+                       k=5, stores=None):
+    """
+    Hit-rate@k and MRR for dense (exact, over the FAQ questions), BM25 and
+    every entry of `stores` ({name: VectorStore}). Returns {name: metrics}
+    plus a "timings" entry in seconds.
+    """
+    timings = {}
+    start = time.perf_counter()
+    records = list(iter_faq_records(load_faq_data(faq_file)))
+    doc_ids = np.asarray([record["id"] for record in records], dtype=object)
+    questions, relevant = load_ground_truth(ground_truth_file)
+    timings["load_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    doc_vectors = encode_texts(encoder, [record["question"] for record in records])
+    query_vectors = encode_texts(encoder, questions)
+    timings["encode_s"] = time.perf_counter() - start
+
+    results = {}
+    start = time.perf_counter()
+    results["dense"] = rank_metrics(doc_ids[flat_search_many(doc_vectors, query_vectors, k)], relevant)
+    timings["dense_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bm25 = VectorizedBM25([f"{record['question']} {record['answer']}" for record in records])
+    results["bm25"] = rank_metrics(doc_ids[bm25.search_many(questions, k)], relevant)
+    timings["bm25_s"] = time.perf_counter() - start
+
+    for name, store in (stores or {}).items():
+        start = time.perf_counter()
+        results[name] = rank_metrics(vector_store_search_many(store, query_vectors, k), relevant)
+        timings[f"{name}_s"] = time.perf_counter() - start
+
+    results["timings"] = timings
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch retrieval evaluation (hit-rate@k, MRR)")
+    parser.add_argument("--faq-file", default="faq_data_with_ids.json")
+    parser.add_argument("--ground-truth", default="ground-truth-data.csv")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--vector-backend", help="Also evaluate the serving vector store (pinecone, faiss or numpy)")
+    parser.add_argument("--output", help="Write the metrics as JSON")
+    args = parser.parse_args()
+
+    from rag_nomad_foods_chatbot import ENCODER_NAME, init_vector_store, load_model
+    from rag_nomad_foods_embedding_cache import EmbeddingCache
+    stores = {args.vector_backend: init_vector_store(args.vector_backend)} if args.vector_backend else None
+    metrics = evaluate_retrieval(EmbeddingCache(load_model(), ENCODER_NAME), args.faq_file, args.ground_truth,
+                                 args.k, stores)
+    summary = {
+        name: value if name == "timings" else {"hit_rate": value["hit_rate"], "mrr": value["mrr"]}
+        for name, value in metrics.items()
+    }
+    for name, value in summary.items():
+        if name != "timings":
+            print(f"{name}: hit_rate@{args.k}={value['hit_rate']:.4f} mrr={value['mrr']:.4f}")
+    print("timings:", {name: round(seconds, 3) for name, seconds in summary["timings"].items()})
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
@@ -0,0 +1,38 @@
+import hashlib
+import json
+
+
+def generate_document_id(doc):
+    """Same id scheme as generate_ground_truth_dataset.ipynb (faq_data_with_ids.json)"""
+    combined = f"{doc['category']}-{doc['question']}-{doc['answer'][:10]}"
+    hash_object = hashlib.md5(combined.encode())
+    hash_hex = hash_object.hexdigest()
+    document_id = hash_hex[:8]
+    return document_id
+
+
+def content_hash(text):
+    """md5 of the exact text, used to key cached embeddings"""
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+def load_faq_data(file_path="faq_data.json"):
+    """Load the FAQ JSON file"""
+    with open(file_path, "r") as f:
+        return json.load(f)
+
+
+def iter_faq_records(qa_data):
+    """Yield one flat record per FAQ question: id, category, question and answer"""
+    for category in qa_data.get("faq_data", []):
+        for qa in category.get("questions", []):
+            question = qa.get("question", "")
+            if not question:
+                continue
+            record = {
+                "category": category.get("category", ""),
+                "question": question,
+                "answer": qa.get("answer", "")
+            }
+            record["id"] = qa.get("id") or generate_document_id(record)
+            yield record
@@ -0,0 +1,176 @@
+import argparse
+import csv
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+from rag_nomad_foods_faq_data import iter_faq_records, load_faq_data
+from rag_nomad_foods_llm_client import LLMError, get_llm_client
+
+# Script version of generate_ground_truth_dataset.ipynb:
+#   python rag_nomad_foods_ground_truth.py --concurrency 4 --requests-per-second 1
+# Every finished FAQ record is appended to the checkpoint file, so an interrupted
+# run picks up where it stopped; ground-truth-data.csv is written from the checkpoint.
+
+load_dotenv()
+
+GROUND_TRUTH_MODEL = "mistral-large-latest"
+CHECKPOINT_FILE = "ground_truth_checkpoint.jsonl"
+
+PROMPT_TEMPLATE = """
+You emulate a user who wants to ask question to the NomadFood chatbot about the company.
+Formulate 5 questions this user might ask based on a FAQ record. The record
+should contain the answer to the questions, and the questions should be complete and not too short.
+If possible, use as fewer words as possible from the record.
+
+The record:
+
+
+question: {question}
+answer: {answer}
+
+Provide the output in parsable JSON without using code blocks:
+
+["question1", "question2"]
+""".strip()
+
+
+class RateLimiter:
+    """Spaces calls at least 1 / `rate` seconds apart across all threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def parse_questions(text):
+    """The list of questions in an LLM reply; tolerates code fences, escaped quotes and {"questions": [...]}"""
+    text = re.sub(r"^```(?:json)?|```$", "", text.strip()).strip()
+    try:
+        parsed = json.loads(text)
+    except json.JSONDecodeError:
+        cleaned = re.sub(r'\\"', '"', text)
+        if cleaned.startswith('"') and cleaned.endswith('"'):
+            cleaned = cleaned[1:-1]
+        parsed = json.loads(cleaned)
+    if isinstance(parsed, str):
+        # JSON-encoded twice
+        parsed = json.loads(parsed)
+    if isinstance(parsed, dict) and "questions" in parsed:
+        parsed = parsed["questions"]
+    if not isinstance(parsed, list) or not all(isinstance(q, str) for q in parsed):
+        raise ValueError(f"Expected a JSON list of questions, got {text[:100]!r}")
+    return parsed
+
+
+def load_checkpoint(path=CHECKPOINT_FILE):
+    """ids already done; a torn last line from a crash is ignored (and that record redone)"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["id"])
+            except (json.JSONDecodeError, KeyError):
+                continue
+    return done
+
+
+def last_byte(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1)
+
+
+def generate_questions(client, record, limiter, model=GROUND_TRUTH_MODEL):
+    limiter.wait()
+    reply = client.chat(
+        [{"role": "user", "content": PROMPT_TEMPLATE.format(**record)}],
+        model=model,
+        max_tokens=1000,
+        temperature=0.7
+    )
+    return parse_questions(reply)
+
+
+def generate_ground_truth(faq_file="faq_data_with_ids.json", checkpoint=CHECKPOINT_FILE, concurrency=4,
+                          requests_per_second=1.0, provider="mistral", model=GROUND_TRUTH_MODEL):
+    """Generate questions for every record not in the checkpoint yet; returns counts of generated/skipped/failed"""
+    done = load_checkpoint(checkpoint)
+    pending = [record for record in iter_faq_records(load_faq_data(faq_file)) if record["id"] not in done]
+    print(f"{len(done)} records already in {checkpoint}, {len(pending)} to generate")
+    client = get_llm_client(provider)
+    limiter = RateLimiter(requests_per_second)
+    stats = {"generated": 0, "skipped": len(done), "failed": 0}
+
+    with open(checkpoint, "a") as out, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # Terminate a torn last line so the first new record starts on its own line
+        if out.tell() and last_byte(checkpoint) != b"\n":
+            out.write("\n")
+        futures = {executor.submit(generate_questions, client, record, limiter, model): record for record in pending}
+        for future in as_completed(futures):
+            record = futures[future]
+            try:
+                questions = future.result()
+            except (LLMError, ValueError) as e:
+                # Not checkpointed, so the next run retries it
+                stats["failed"] += 1
+                print(f"Failed on {record['id']}: {e}")
+                continue
+            # Single writer thread; one flushed line per record keeps the file appendable after a crash
+            out.write(json.dumps({"id": record["id"], "questions": questions}) + "\n")
+            out.flush()
+            stats["generated"] += 1
+    print(f"Generated {stats['generated']}, failed {stats['failed']}")
+    return stats
+
+
+def write_ground_truth_csv(checkpoint=CHECKPOINT_FILE, output="ground-truth-data.csv"):
+    """Stream the checkpoint into the question,document CSV used by the evaluation notebooks"""
+    seen = set()
+    rows = 0
+    with open(checkpoint) as f, open(output, "w", newline="") as out:
+        writer = csv.writer(out)
+        writer.writerow(["question", "document"])
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if entry["id"] in seen:
+                continue
+            seen.add(entry["id"])
+            for question in entry["questions"]:
+                writer.writerow([question, entry["id"]])
+                rows += 1
+    print(f"Wrote {rows} questions for {len(seen)} documents to {output}")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate the ground-truth question dataset")
+    parser.add_argument("--faq-file", default="faq_data_with_ids.json")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    parser.add_argument("--output", default="ground-truth-data.csv")
+    parser.add_argument("--concurrency", type=int, default=4, help="LLM requests in flight")
+    parser.add_argument("--requests-per-second", type=float, default=1.0)
+    parser.add_argument("--provider", default="mistral", choices=["mistral", "openrouter"])
+    parser.add_argument("--model", default=GROUND_TRUTH_MODEL)
+    args = parser.parse_args()
+
+    generate_ground_truth(args.faq_file, args.checkpoint, args.concurrency, args.requests_per_second,
+                          args.provider, args.model)
+    write_ground_truth_csv(args.checkpoint, args.output)
@@ -0,0 +1,231 @@
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+from rag_nomad_foods_doc_store import attach_documents, build_document_store
+from rag_nomad_foods_embedding_cache import EmbeddingCache
+from rag_nomad_foods_faq_data import content_hash, iter_faq_records
+from rag_nomad_foods_ingestion import UPSERT_CHUNK_SIZE, batched, ingest_records
+from rag_nomad_foods_vector_store import PineconeVectorStore, local_backend_name, open_local_vector_store
+
+# Seconds between checks of the FAQ source; 0 turns hot reload off
+FAQ_RELOAD_INTERVAL_S = float(os.getenv("FAQ_RELOAD_INTERVAL_S", "30"))
+# Optional version marker written by the ingestion flow once the index is synced;
+# when set it is watched instead of faq_data.json itself
+FAQ_VERSION_FILE = os.getenv("FAQ_VERSION_FILE")
+# Snapshot directories kept on disk (the serving one and its predecessor)
+SNAPSHOTS_KEPT = 2
+
+
+def faq_version(faq_file, version_file=None):
+    """Cheap change marker: the version file's contents, else the FAQ file's mtime and size"""
+    path = version_file or faq_file
+    try:
+        if version_file:
+            with open(version_file, "r") as f:
+                return f.read().strip()
+        stat = os.stat(path)
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+    except FileNotFoundError:
+        return None
+
+
+def read_faq_snapshot(faq_file):
+    """Parsed FAQ data and the md5 of the exact bytes it was parsed from"""
+    with open(faq_file, "rb") as f:
+        raw = f.read()
+    return json.loads(raw), content_hash(raw.decode())
+
+
+def build_local_snapshot(backend, directory, encoder, qa_data, key, guardrail_queries=None):
+    """
+    Build a complete `backend` index and document store for qa_data under
+    directory/snapshots/<key> and open them. The index is written to a temporary directory and renamed into
+    place, and a file lock makes one process per node build it while the others
+    wait and open the published copy (sharing its memory-mapped files). The
+    snapshot is opened and its mtime bumped under that lock, so
+    prune_snapshots() sees it as the newest one and can't remove it half-open.
+    """
+    snapshots = os.path.join(directory, "snapshots")
+    final_path = os.path.join(snapshots, key)
+    os.makedirs(snapshots, exist_ok=True)
+    with open(final_path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not os.path.isdir(final_path):
+            tmp_path = f"{final_path}.tmp-{os.getpid()}"
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            store = open_local_vector_store(backend, tmp_path)
+            if guardrail_queries is not None:
+                store.guardrail_queries = guardrail_queries
+            ingest_records(store, encoder, iter_faq_records(qa_data))
+            build_document_store(iter_faq_records(qa_data), tmp_path)
+            os.rename(tmp_path, final_path)
+        # A reused snapshot (the FAQ went back to earlier content) becomes the newest again
+        os.utime(final_path)
+        return attach_documents(open_local_vector_store(backend, final_path), final_path)
+
+
+def prune_snapshots(directory, keep=SNAPSHOTS_KEPT, current=None):
+    """
+    Remove all but the `keep` most recently used snapshot directories, never the
+    `current` key. Each is removed under its build lock, so no process is opening
+    it at that moment; open memory maps outlive the unlink. The lock files stay:
+    removing one could let two processes lock the same key.
+    """
+    snapshots = os.path.join(directory, "snapshots")
+    if not os.path.isdir(snapshots):
+        return
+    published = sorted(
+        (
+            os.path.join(snapshots, name) for name in os.listdir(snapshots)
+            if ".tmp-" not in name and name != current and os.path.isdir(os.path.join(snapshots, name))
+        ),
+        key=os.path.getmtime, reverse=True
+    )
+    if current is not None:
+        keep -= 1
+    if len(published) <= keep:
+        return
+    # Anything used since the listing is at least as new as this
+    cutoff = os.path.getmtime(published[keep - 1]) if keep > 0 else None
+    for path in published[keep:]:
+        with open(path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if cutoff is not None and os.path.getmtime(path) >= cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def sync_shared_index(store, encoder, records, previous_ids=()):
+    """
+    Bring a shared index (Pinecone) in line with records: upsert what is missing,
+    delete what was removed. Vectors embed the question, which is part of the
+    id, and answers live in the document store, so present ids are up to date.
+    Idempotent, so every pod can run it after the same change; the first one
+    does the writes.
+    """
+    stale = []
+    for batch in batched(records, UPSERT_CHUNK_SIZE):
+        found = store.fetch([record["id"] for record in batch])["vectors"]
+        stale += [record for record in batch if record["id"] not in found]
+    if stale:
+        ingest_records(store, encoder, stale)
+    removed = sorted(set(previous_ids) - {record["id"] for record in records})
+    for chunk in batched(removed, UPSERT_CHUNK_SIZE):
+        store.delete(ids=chunk)
+    return {"upserted": len(stale), "deleted": len(removed)}
+
+
+class IndexReloader:
+    """
+    Keeps a FaqRetriever's index in step with faq_data.json without a restart.
+
+    A daemon thread polls faq_version() every `interval` seconds. On a change
+    the new index is built in the background from the embedding cache (only new
+    or edited questions are encoded) and swapped into the retriever with one
+    attribute assignment: requests already searching keep the snapshot they
+    read, new ones get the new snapshot, and the old one is freed once the last
+    of them finishes. Reloads run one at a time, so at most two index copies
+    are alive. The Pinecone index is shared and updated in place instead.
+    Listeners are called with the new FAQ data after every swap.
+
+    A local root index only reflects the FAQ file it was seeded from, so
+    start() first swaps in the snapshot of the current faq_data.json: the one
+    an earlier process published, or a new one. A restart therefore never
+    falls back to content an earlier reload had replaced.
+    """
+
+    def __init__(self, retriever, encoder_name, faq_file="faq_data.json", directory="vector_store",
+                 interval=FAQ_RELOAD_INTERVAL_S, version_file=FAQ_VERSION_FILE, guardrail_queries=None):
+        self.retriever = retriever
+        self.faq_file = faq_file
+        self.directory = directory
+        self.interval = interval
+        self.version_file = version_file
+        self.guardrail_queries = guardrail_queries
+        self.encoder = EmbeddingCache(retriever.model, encoder_name)
+        self.version = faq_version(faq_file, version_file)
+        self.listeners = []
+        self.counters = {"reloads": 0, "failures": 0, "last_reload_s": None, "snapshot": None}
+        self._ids = {record["id"] for record in iter_faq_records(read_faq_snapshot(faq_file)[0])} \
+            if os.path.exists(faq_file) else set()
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def check(self):
+        """Reload if the FAQ source changed since the last (successful) reload; True if it did"""
+        version = faq_version(self.faq_file, self.version_file)
+        if version is None or version == self.version:
+            return False
+        return self.reload(version)
+
+    def reload(self, version=None):
+        with self._reload_lock:
+            start = time.perf_counter()
+            try:
+                qa_data, key = read_faq_snapshot(self.faq_file)
+                records = list(iter_faq_records(qa_data))
+                index = self.retriever.index
+                if isinstance(index, PineconeVectorStore):
+                    # Documents first, so new ids resolve as soon as they are upserted; removed ids keep
+                    # their text until they are deleted too
+                    previous = index.documents
+                    current_ids = {record["id"] for record in records}
+                    removed = [previous.get(doc_id) for doc_id in self._ids - current_ids] if previous is not None else []
+                    index.documents = build_document_store(records + [doc for doc in removed if doc], self.directory)
+                    print(f"Synced the shared index with {self.faq_file}: "
+                          f"{sync_shared_index(index, self.encoder, records, self._ids)}")
+                    if removed:
+                        index.documents = build_document_store(records, self.directory)
+                else:
+                    backend = local_backend_name(index)
+                    # Keyed on the encoder too, so a snapshot embedded by another encoder is never reused
+                    snapshot_key = f"{self.encoder.model_name}-{key}"
+                    new_index = build_local_snapshot(backend, self.directory, self.encoder, qa_data, snapshot_key,
+                                                     self.guardrail_queries)
+                    # Requests inside search_by_vector() finish on the index they already read
+                    self.retriever.index = new_index
+                    prune_snapshots(self.directory, current=snapshot_key)
+                for listener in self.listeners:
+                    listener(qa_data)
+            except Exception as e:
+                # e.g. the file is being rewritten; keep serving the current snapshot and retry on the next check
+                self.counters["failures"] += 1
+                print(f"Reloading '{self.faq_file}' failed, still serving the previous index: {e!r}")
+                return False
+            self._ids = {record["id"] for record in records}
+            self.version = version or faq_version(self.faq_file, self.version_file)
+            self.counters.update(reloads=self.counters["reloads"] + 1, snapshot=key,
+                                 last_reload_s=time.perf_counter() - start)
+            print(f"Reloaded {len(records)} FAQ entries from '{self.faq_file}' "
+                  f"in {self.counters['last_reload_s']:.2f}s")
+            return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def start(self):
+        if self.interval > 0 and self._thread is None:
+            if not isinstance(self.retriever.index, PineconeVectorStore) and os.path.exists(self.faq_file):
+                if not self.reload():
+                    # Still on the root index: make the next check retry
+                    self.version = None
+            self._thread = threading.Thread(target=self._run, name="faq-reloader", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {**self.counters, "version": self.version, "interval_s": self.interval}
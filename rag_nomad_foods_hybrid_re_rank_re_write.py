@@ -1,64 +1,69 @@
-import json
-import numpy as np
-import faiss
-from sentence_transformers import SentenceTransformer
-from rag_nomad_foods_chatbot import search_similar_question, generate_enhanced_answer
-import mistralai
-from mistralai import Mistral
+import asyncio
+import threading
+from rag_nomad_foods_chatbot import (
+    ENCODER_NAME, NO_MATCH_ANSWER, generate_enhanced_answer, get_index_reloader, get_retriever, FaqRetriever,
+    VECTOR_STORE_DIR
+)
+from rag_nomad_foods_doc_store import attach_documents
+from rag_nomad_foods_faq_data import load_faq_data
+from rag_nomad_foods_hot_reload import IndexReloader
+from rag_nomad_foods_hybrid_retriever import build_hybrid_retriever
+from rag_nomad_foods_async_pipeline import AsyncAnswerPipeline
+from rag_nomad_foods_batching_encoder import get_query_encoder
+from rag_nomad_foods_llm_client import AsyncLLMClient, get_llm_client
+from rag_nomad_foods_reranker import CrossEncoderReranker
+from rag_nomad_foods_tracing import span
+from rag_nomad_foods_vector_store import open_local_vector_store
 import os
 
-# 1. Read Data from JSON File with error handling
-with open('faq_data.json', 'r') as file:
-    qa_data = json.load(file)
-
-# 2. Load the embedding model
-model = SentenceTransformer("all-mpnet-base-v2")
-
-# 3. Create FAISS index
-embedding_dim = 768  # Dimensionality of embeddings from the model
-faiss_index = faiss.IndexFlatL2(embedding_dim)  # L2 distance for similarity search
-
-# Store questions and embeddings
-questions = []
-embeddings = []
-
-# 4. Generate embeddings and add them to the FAISS index
-if 'faq_data' in qa_data:
-    for category in qa_data['faq_data']:
-        if 'questions' in category:
-            for qa in category['questions']:
-                question = qa.get('question', '')
-                answer = qa.get('answer', '')
-
-                if question:  # Ensure question exists
-                    embedding = model.encode(question)  # Generate vector embedding
-                    questions.append({"question": question, "answer": answer})
-                    embeddings.append(embedding)
-
-# Convert embeddings to numpy array and add to FAISS index
-embedding_matrix = np.array(embeddings, dtype="float32")
-faiss_index.add(embedding_matrix)
-
-# 5. Function to search for the most similar question using FAISS (basic method without enhancements)
+# Importing this module loads nothing: the model, the indexes and the re-ranker
+# are built on first use and shared afterwards.
+_components = {}
+# Re-entrant: a component may be built from other components
+_components_lock = threading.RLock()
+
+def _component(name, build):
+    if name not in _components:
+        with _components_lock:
+            if name not in _components:
+                _components[name] = build()
+    return _components[name]
+
+# 1. + 2. The embedding model and the FAISS index persisted on disk (memory-mapped), seeded from faq_data.json on the first run
+# and rebuilt in the background whenever faq_data.json changes
+def get_faiss_retriever():
+    return _component("faiss_retriever", _build_faiss_retriever)
+
+def _build_faiss_retriever():
+    index = attach_documents(open_local_vector_store("faiss", VECTOR_STORE_DIR), VECTOR_STORE_DIR, 'faq_data.json')
+    retriever = FaqRetriever(index=index, model=get_query_encoder())
+    IndexReloader(retriever, ENCODER_NAME, directory=VECTOR_STORE_DIR).start()
+    return retriever
+
+# 3. Function to search for the most similar question using FAISS (basic method without enhancements)
 def basic_faiss_search(prompt):
-    query_vector = model.encode(prompt)  # Convert user prompt to vector
-    query_vector = np.array([query_vector]).astype('float32')
-
-    # Search in FAISS
-    _, indices = faiss_index.search(query_vector, 1)  # Get top 1 closest match
-    result_index = indices[0][0]  # Get the index of the best match
-    
-    # Return the question and answer corresponding to the matched index
-    return questions[result_index]
+    matches = get_faiss_retriever().search(prompt, top_k=1)  # Get top 1 closest match
+    if not matches:
+        return {"question": None, "answer": NO_MATCH_ANSWER}
+    return {"question": matches[0]["question"], "answer": matches[0]["answer"]}
+
+# BM25 over question + answer text fused with dense search on the production vector store
+# Its dense side follows the index swaps of get_index_reloader(); the BM25 side is rebuilt after each one
+def get_hybrid_retriever():
+    return _component("hybrid_retriever", _build_hybrid_retriever)
+
+def _build_hybrid_retriever():
+    get_index_reloader().add_listener(
+        lambda qa_data: _components.__setitem__("hybrid_retriever", build_hybrid_retriever(get_retriever(), qa_data))
+    )
+    return build_hybrid_retriever(get_retriever(), load_faq_data('faq_data.json'))
 
-# 6. Enhanced response generation with Mistral AI
+# 4. Enhanced response generation with Mistral AI
 api_key = os.getenv('MISTRAL_API_KEY')
 
-def generate_enhanced_answer(prompt, context, api_key):
-    client = Mistral(api_key=api_key)
-    
+def build_messages(prompt, context, company_name="NomadFoods"):
     # System prompt for conversational response
-    system_prompt = """You are a friendly and helpful customer service representative at NomadFoods company. 
+    system_prompt = """You are a friendly and helpful customer service representative at {company_name}. 
     Your responses should be warm, natural, and conversational while being informative.
     Use the following context to answer the question.
 
@@ -74,65 +79,79 @@ def generate_enhanced_answer(prompt, context, api_key):
     4. End with an offer to help further if needed.
     """
     
-    response = client.chat.complete(
-        model="mistral-large-latest",
-        messages=[
-            {"role": "system", "content": system_prompt.format(context=context)},
-            {"role": "user", "content": enhanced_user_prompt}
-        ],
-        max_tokens=500,
-        temperature=0.7  
-    )
-    
-    return response.choices[0].message.content.strip()
+    return [
+        {"role": "system", "content": system_prompt.format(context=context, company_name=company_name)},
+        {"role": "user", "content": enhanced_user_prompt}
+    ]
 
-# 7. Re-ranking Function with Mistral AI
-def re_rank_results(query, results, api_key):
-    client = Mistral(api_key=api_key)
-    
-    ranking_prompt = f"""Rank the following answers based on relevance to this query: '{query}'. 
-    Provide a sorted list, with the most relevant answer first:
-    {results}"""
-    
-    response = client.chat.complete(
-        model="mistral-large-latest",
-        messages=[{"role": "user", "content": ranking_prompt}],
-        max_tokens=150,
-        temperature=0.5
+def generate_enhanced_answer(prompt, context, api_key):
+    client = get_llm_client("mistral", api_key)
+    with span("llm", model="mistral-large-latest") as llm_span:
+        usage = {}
+        answer = client.chat(build_messages(prompt, context), model="mistral-large-latest", max_tokens=500, temperature=0.7, usage=usage)
+        llm_span.set(**usage)
+    return answer
+
+def stream_enhanced_answer(prompt, context, api_key):
+    # Yields text deltas from the Mistral streaming API as they arrive
+    client = get_llm_client("mistral", api_key)
+    yield from client.stream_chat(build_messages(prompt, context), model="mistral-large-latest", max_tokens=500, temperature=0.7)
+
+# 5. Re-ranking with a local cross-encoder (one batched CPU forward pass, cached per query and document)
+def get_reranker():
+    return _component("reranker", lambda: CrossEncoderReranker(top_k=5, time_budget_ms=150))
+
+# 6. Hybrid search with re-ranking
+def hybrid_search(prompt):
+    with span("request", pipeline="hybrid"):
+        return _hybrid_search(prompt)
+
+def _hybrid_search(prompt):
+    # Step 1: Run BM25 and dense search together and fuse the rankings
+    candidates = get_hybrid_retriever().search(prompt, top_k=5)
+    if not candidates:
+        return NO_MATCH_ANSWER
+
+    # Step 2: Re-rank the fused candidates and keep the most relevant one as context
+    best_match = get_reranker().rerank(prompt, candidates)[0]
+
+    # Step 3: Generate enhanced answer with Mistral AI
+    return generate_enhanced_answer(prompt, best_match['answer'], api_key)
+
+# Async version of the same pipeline: dense and BM25 retrieval run concurrently, the LLM call doesn't block a thread
+async def hybrid_retrieve(prompt, tenant=None):
+    # BM25 and the re-ranker only cover the default FAQ
+    if tenant is not None:
+        raise ValueError("The hybrid pipeline only answers from the default index, not per tenant")
+    candidates = await get_hybrid_retriever().asearch(prompt, top_k=5)
+    if not candidates:
+        return None
+    reranked = await asyncio.to_thread(get_reranker().rerank, prompt, candidates)
+    return reranked[0]
+
+# Not shared: its HTTP client is bound to the event loop it is created on, so build one per asyncio.run()
+def create_hybrid_pipeline():
+    return AsyncAnswerPipeline(
+        hybrid_retrieve, build_messages, AsyncLLMClient("mistral", api_key=api_key), "mistral-large-latest"
     )
-    
-    # Check if re-ranking output is in the expected list format
-    re_ranked_output = response.choices[0].message.content.strip()
-    return re_ranked_output if isinstance(re_ranked_output, list) else []
 
-# 8. Hybrid search with re-ranking
-def hybrid_search(prompt):
-    # Step 1: Perform FAISS search for initial similarity match
-    initial_match = search_similar_question(prompt)
-    initial_context = initial_match['answer']  
-    
-    # Step 2: Generate enhanced answer with Mistral AI
-    enhanced_answer = generate_enhanced_answer(prompt, initial_context, api_key)
-    
-    # Step 3: Perform re-ranking based on multiple results
-    re_ranked_results = re_rank_results(prompt, [initial_match], api_key)
-    if re_ranked_results:
-        return re_ranked_results[0]["answer"]
-    else:
-        return enhanced_answer
-
-# 9. Comparison Function
-def compare_hybrid_and_basic_faiss_vector_search(prompt):
-    # Get basic FAISS result
-    basic_result = basic_faiss_search(prompt)
-    
-    # Get hybrid search result
-    hybrid_result = hybrid_search(prompt)
+# 7. Comparison Function
+async def compare_hybrid_and_basic_faiss_vector_search_async(prompt):
+    # Both paths are independent, run them at the same time
+    async with create_hybrid_pipeline() as hybrid_pipeline:
+        basic_result, hybrid_result = await asyncio.gather(
+            asyncio.to_thread(basic_faiss_search, prompt),
+            hybrid_pipeline.answer(prompt)
+        )
     
     # Print both results for comparison
     print("Basic FAISS Search Result:", basic_result['answer'] , "\n")
-    print("Hybrid Search Result:", hybrid_result)
+    print("Hybrid Search Result:", hybrid_result['answer'])
+
+def compare_hybrid_and_basic_faiss_vector_search(prompt):
+    asyncio.run(compare_hybrid_and_basic_faiss_vector_search_async(prompt))
 
 # Usage Evaluation
-user_query = "How does NomadFoods handle refunds?"
-compare_hybrid_and_basic_faiss_vector_search(user_query)
+if __name__ == "__main__":
+    user_query = "How does NomadFoods handle refunds?"
+    compare_hybrid_and_basic_faiss_vector_search(user_query)
@@ -0,0 +1,177 @@
+import asyncio
+import contextvars
+import heapq
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from rag_nomad_foods_faq_data import iter_faq_records
+from rag_nomad_foods_tracing import span
+
+TOKEN_PATTERN = re.compile(r"\w+")
+# Rank constant from the original reciprocal rank fusion paper
+RRF_K = 60
+
+# Dense lookups run here while the calling thread scores BM25
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hybrid-dense")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Okapi BM25 over an inverted index (term -> {doc_id: term frequency}).
+
+    IDF and the per-document length normalisation are cached and only
+    recomputed after the corpus changes. add() and remove() touch just the
+    postings of that document, so new FAQs are indexed incrementally.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = defaultdict(dict)
+        self._doc_terms = {}
+        self._doc_len = {}
+        self._total_len = 0
+        self._idf = {}
+        self._norm = {}
+        self._stale = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._doc_len)
+
+    def add(self, doc_id, text):
+        """Index a document, replacing any previous version with the same id"""
+        term_counts = Counter(tokenize(text))
+        with self._lock:
+            self._remove(doc_id)
+            for term, count in term_counts.items():
+                self._postings[term][doc_id] = count
+            self._doc_terms[doc_id] = list(term_counts)
+            self._doc_len[doc_id] = sum(term_counts.values())
+            self._total_len += self._doc_len[doc_id]
+            self._stale = True
+
+    def remove(self, doc_id):
+        with self._lock:
+            self._remove(doc_id)
+            self._stale = True
+
+    def _remove(self, doc_id):
+        if doc_id not in self._doc_len:
+            return
+        for term in self._doc_terms.pop(doc_id):
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+        self._total_len -= self._doc_len.pop(doc_id)
+
+    def _refresh(self):
+        n_docs = len(self._doc_len)
+        avg_len = self._total_len / n_docs if n_docs else 0.0
+        # Lucene-style IDF, always positive even for terms in most documents
+        self._idf = {
+            term: math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+        self._norm = {
+            doc_id: self.k1 * (1 - self.b + self.b * length / avg_len) if avg_len else self.k1
+            for doc_id, length in self._doc_len.items()
+        }
+        self._stale = False
+
+    def search(self, query, top_k=10):
+        """Return [(doc_id, score)] for the best `top_k` documents"""
+        with self._lock:
+            if self._stale:
+                self._refresh()
+            scores = defaultdict(float)
+            for term in set(tokenize(query)):
+                idf = self._idf.get(term)
+                if idf is None:
+                    continue
+                for doc_id, tf in self._postings[term].items():
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + self._norm[doc_id])
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+
+def reciprocal_rank_fusion(ranked_lists, k=RRF_K):
+    """Merge ranked id lists: score(d) = sum over lists of 1 / (k + rank)"""
+    scores = defaultdict(float)
+    for ranked in ranked_lists:
+        for rank, doc_id in enumerate(ranked, 1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class HybridRetriever:
+    """
+    BM25 over question + answer text plus dense search through `dense`
+    (anything with search(query, top_k) returning dicts with an "id", e.g.
+    FaqRetriever). Both run concurrently and are merged with reciprocal rank
+    fusion.
+    """
+
+    def __init__(self, dense, records=(), rrf_k=RRF_K):
+        self.dense = dense
+        self.rrf_k = rrf_k
+        self.bm25 = BM25Index()
+        self.documents = {}
+        self.add_documents(records)
+
+    def add_documents(self, records):
+        for record in records:
+            self.documents[record["id"]] = record
+            self.bm25.add(record["id"], f"{record['question']} {record['answer']}")
+
+    def remove_documents(self, doc_ids):
+        for doc_id in doc_ids:
+            self.documents.pop(doc_id, None)
+            self.bm25.remove(doc_id)
+
+    def search(self, query, top_k=5, candidates=20):
+        with span("hybrid_search"):
+            # Run the dense lookup in the current trace context so its spans nest under this one
+            dense_future = _executor.submit(contextvars.copy_context().run, self.dense.search, query, candidates)
+            with span("bm25"):
+                sparse = self.bm25.search(query, candidates)
+            return self._fuse(dense_future.result(), sparse, top_k)
+
+    async def asearch(self, query, top_k=5, candidates=20):
+        """search() for asyncio callers: dense and sparse run concurrently off the event loop"""
+        with span("hybrid_search"):
+            dense, sparse = await asyncio.gather(
+                asyncio.to_thread(self.dense.search, query, candidates),
+                asyncio.to_thread(self.bm25.search, query, candidates)
+            )
+            return self._fuse(dense, sparse, top_k)
+
+    def _fuse(self, dense, sparse, top_k):
+        dense_by_id = {match["id"]: match for match in dense}
+        fused = reciprocal_rank_fusion(
+            [[match["id"] for match in dense], [doc_id for doc_id, _ in sparse]],
+            k=self.rrf_k
+        )
+        results = []
+        for doc_id, score in fused:
+            document = self.documents.get(doc_id) or dense_by_id[doc_id]
+            results.append({
+                "id": doc_id,
+                "score": score,
+                "question": document["question"],
+                "answer": document["answer"]
+            })
+            if len(results) == top_k:
+                break
+        return results
+
+
+def build_hybrid_retriever(dense, qa_data):
+    """HybridRetriever over every record of a loaded FAQ file"""
+    return HybridRetriever(dense, iter_faq_records(qa_data))
@@ -0,0 +1,184 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import numpy as np
+from rag_nomad_foods_faq_data import iter_faq_records, load_faq_data
+from rag_nomad_foods_tracing import span
+
+# Pinecone recommends upserting in batches of ~100 vectors (2MB request limit)
+UPSERT_CHUNK_SIZE = 100
+MAX_IN_FLIGHT_UPSERTS = 4
+UPSERT_RETRIES = 3
+# Records handed to a single encode() call, sized so every core gets work
+ENCODE_BATCH_SIZE = 16 * (os.cpu_count() or 1)
+
+
+def stream_faq_records(file_path="faq_data.json"):
+    """Yield FAQ records one at a time; nothing downstream holds the whole corpus"""
+    yield from iter_faq_records(load_faq_data(file_path))
+
+
+def batched(iterable, size):
+    """Split an iterable into lists of at most `size` items"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def upsert_with_retry(index, vectors, namespace=None, retries=UPSERT_RETRIES, backoff=0.5):
+    """Upsert one chunk, retrying with exponential backoff on failure"""
+    for attempt in range(retries + 1):
+        try:
+            if namespace is None:
+                return index.upsert(vectors=vectors)
+            return index.upsert(vectors=vectors, namespace=namespace)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = backoff * (2 ** attempt)
+            print(f"Upsert of {len(vectors)} vectors failed ({e}), retrying in {delay:.1f}s...")
+            time.sleep(delay)
+
+
+def build_vectors(records, embeddings):
+    """Pinecone upsert payload for a batch of FAQ records: ids only, the text is in the document store"""
+    return [
+        {
+            "id": record["id"],
+            "values": embedding.tolist()
+        }
+        for record, embedding in zip(records, embeddings)
+    ]
+
+
+def ingest_records(index, encoder, records, namespace=None, encode_batch_size=ENCODE_BATCH_SIZE,
+                   chunk_size=UPSERT_CHUNK_SIZE, max_in_flight=MAX_IN_FLIGHT_UPSERTS):
+    """
+    Encode records in batches and upsert them in chunks.
+
+    Upserts run on a thread pool while the next batch is being encoded; at most
+    `max_in_flight` chunks are pending at any time. `encoder` is anything with
+    an encode(texts, batch_size=...) method (SentenceTransformer, EmbeddingCache).
+    Returns the number of vectors, elapsed seconds and vectors/s.
+    """
+    start = time.perf_counter()
+    # Recorded with the vectors (EmbeddingCache knows its encoder's name), see check_index_encoder()
+    if getattr(encoder, "model_name", None):
+        index.encoder = encoder.model_name
+    in_flight = threading.BoundedSemaphore(max_in_flight)
+    futures = []
+    total = 0
+
+    def upsert_chunk(chunk, submitted):
+        try:
+            with span("ingest_upsert", vectors=len(chunk), queue_ms=(time.perf_counter() - submitted) * 1000):
+                upsert_with_retry(index, chunk, namespace=namespace)
+        finally:
+            in_flight.release()
+
+    with span("ingest") as ingest_span, ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for batch in batched(records, encode_batch_size):
+            with span("ingest_embed", records=len(batch)):
+                embeddings = np.asarray(encoder.encode([r["question"] for r in batch], batch_size=32))
+            for chunk in batched(build_vectors(batch, embeddings), chunk_size):
+                in_flight.acquire()
+                futures.append(executor.submit(contextvars.copy_context().run, upsert_chunk, chunk, time.perf_counter()))
+                total += len(chunk)
+        for future in futures:
+            future.result()
+        # Local vector stores persist their writes in one go
+        if hasattr(index, "flush"):
+            with span("ingest_flush"):
+                index.flush()
+        ingest_span.set(vectors=total)
+
+    seconds = time.perf_counter() - start
+    stats = {
+        "vectors": total,
+        "seconds": seconds,
+        "vectors_per_second": total / seconds if seconds > 0 else 0.0
+    }
+    print(f"Upserted {total} vectors in {seconds:.2f}s ({stats['vectors_per_second']:.1f} vectors/s)")
+    return stats
+
+
+def ingest_faq(index, encoder, file_path="faq_data.json", **kwargs):
+    """Stream faq_data.json into the vector index"""
+    return ingest_records(index, encoder, stream_faq_records(file_path), **kwargs)
+
+
+class InMemoryIndex:
+    """
+    Local stand-in for a Pinecone Index (cosine metric) so ingestion and
+    retrieval can run offline. Supports the calls this project makes:
+    upsert, query, fetch, delete and describe_index_stats.
+    """
+
+    def __init__(self):
+        self._namespaces = {}
+        self._lock = threading.Lock()
+        self.upsert_calls = 0
+
+    def _namespace(self, namespace):
+        return self._namespaces.setdefault(namespace or "", {})
+
+    def upsert(self, vectors, namespace=None):
+        with self._lock:
+            self.upsert_calls += 1
+            store = self._namespace(namespace)
+            for vector in vectors:
+                values = np.asarray(vector["values"], dtype="float32")
+                norm = np.linalg.norm(values)
+                store[vector["id"]] = (values / norm if norm else values, vector.get("metadata", {}))
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids=None, delete_all=False, namespace=None):
+        with self._lock:
+            store = self._namespace(namespace)
+            if delete_all:
+                store.clear()
+            for vec_id in ids or []:
+                store.pop(vec_id, None)
+        return {}
+
+    def fetch(self, ids, namespace=None):
+        with self._lock:
+            store = self._namespace(namespace)
+            return {
+                "vectors": {
+                    vec_id: {"id": vec_id, "values": store[vec_id][0].tolist(), "metadata": store[vec_id][1]}
+                    for vec_id in ids if vec_id in store
+                }
+            }
+
+    def query(self, vector, top_k=1, include_metadata=False, namespace=None, **kwargs):
+        with self._lock:
+            items = list(self._namespace(namespace).items())
+        if not items:
+            return {"matches": []}
+        matrix = np.stack([values for _, (values, _) in items])
+        query = np.asarray(vector, dtype="float32")
+        norm = np.linalg.norm(query)
+        scores = matrix @ (query / norm if norm else query)
+        top = np.argsort(-scores)[:top_k]
+        matches = []
+        for i in top:
+            match = {"id": items[i][0], "score": float(scores[i])}
+            if include_metadata:
+                match["metadata"] = items[i][1][1]
+            matches.append(match)
+        return {"matches": matches}
+
+    def describe_index_stats(self):
+        with self._lock:
+            namespaces = {name: {"vector_count": len(store)} for name, store in self._namespaces.items()}
+        return {
+            "namespaces": namespaces,
+            "total_vector_count": sum(ns["vector_count"] for ns in namespaces.values())
+        }
@@ -0,0 +1,242 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+# Both providers expose an OpenAI-compatible chat-completions endpoint
+PROVIDERS = {
+    "openrouter": {
+        "base_url": os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"),
+        "api_key_env": "OPENROUTER_API_KEY",
+        "fallback_model": os.getenv("OPENROUTER_FALLBACK_MODEL"),
+        "headers": {
+            "HTTP-Referer": "https://github.com/ZiedTrikiDataScience/Nomad_Foods_RAG_LLM",
+            "X-Title": "NomadFoods FAQ Assistant"
+        }
+    },
+    "mistral": {
+        "base_url": os.getenv("MISTRAL_BASE_URL", "https://api.mistral.ai/v1"),
+        "api_key_env": "MISTRAL_API_KEY",
+        "fallback_model": os.getenv("MISTRAL_FALLBACK_MODEL"),
+        "headers": {}
+    }
+}
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "3.05"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "16"))
+# Send the same request to the fallback model if the primary hasn't answered after this many seconds
+LLM_HEDGE_AFTER_SECONDS = float(os.getenv("LLM_HEDGE_AFTER_SECONDS", "0")) or None
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+
+
+def _record_usage(usage, body):
+    # Token counts reported by the provider, for tracing
+    if usage is not None and body.get("usage"):
+        usage["tokens_in"] = body["usage"].get("prompt_tokens")
+        usage["tokens_out"] = body["usage"].get("completion_tokens")
+
+
+class LLMError(Exception):
+    def __init__(self, status_code, body):
+        super().__init__(f"{status_code}: {body}")
+        self.status_code = status_code
+        self.body = body
+
+
+def _provider_settings(provider, api_key=None, base_url=None, fallback_model=None):
+    config = PROVIDERS[provider]
+    url = f"{(base_url or config['base_url']).rstrip('/')}/chat/completions"
+    headers = {"Authorization": f"Bearer {api_key or os.getenv(config['api_key_env'], '')}", **config["headers"]}
+    return url, headers, fallback_model or config["fallback_model"]
+
+
+def _retry_delay(backoff, attempt, retry_after=None):
+    delay = backoff * (2 ** attempt)
+    if retry_after and retry_after.replace(".", "", 1).isdigit():
+        delay = max(delay, float(retry_after))
+    return delay
+
+
+class LLMClient:
+    """
+    Chat-completions client shared across calls: keep-alive connection pool,
+    connect/read timeouts, exponential-backoff retries on 429/5xx and
+    connection errors (honouring Retry-After), and an optional hedged request
+    to `fallback_model` once `hedge_after` seconds pass without an answer.
+    """
+
+    def __init__(self, provider, api_key=None, base_url=None, fallback_model=None,
+                 hedge_after=LLM_HEDGE_AFTER_SECONDS, connect_timeout=LLM_CONNECT_TIMEOUT,
+                 read_timeout=LLM_READ_TIMEOUT, max_retries=LLM_MAX_RETRIES, backoff=0.5,
+                 pool_size=LLM_POOL_SIZE):
+        self.url, headers, self.fallback_model = _provider_settings(provider, api_key, base_url, fallback_model)
+        self.provider = provider
+        self.hedge_after = hedge_after
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self.session.headers.update(headers)
+
+    def _post(self, payload, stream=False):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(self.url, json=payload, timeout=self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise LLMError(None, str(e)) from e
+                time.sleep(self.backoff * (2 ** attempt))
+                continue
+            if response.status_code == 200:
+                return response
+            if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                raise LLMError(response.status_code, response.text)
+            response.close()
+            time.sleep(_retry_delay(self.backoff, attempt, response.headers.get("Retry-After")))
+
+    def _complete(self, payload, usage=None):
+        body = self._post(payload).json()
+        _record_usage(usage, body)
+        return body["choices"][0]["message"]["content"].strip()
+
+    def chat(self, messages, model, max_tokens=500, temperature=0.7, usage=None):
+        """`usage`, if given, is a dict that receives tokens_in / tokens_out"""
+        payload = {"model": model, "messages": messages, "max_tokens": max_tokens, "temperature": temperature}
+        if not (self.hedge_after and self.fallback_model):
+            return self._complete(payload, usage)
+
+        primary = _hedge_executor.submit(self._complete, payload, usage)
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done and primary.exception() is None:
+            return primary.result()
+        # Primary is slow (or already failed): race it against the fallback model
+        pending = {primary, _hedge_executor.submit(self._complete, {**payload, "model": self.fallback_model}, usage)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stream_chat(self, messages, model, max_tokens=500, temperature=0.7, usage=None):
+        """Yield text deltas from the SSE stream; `usage` as in chat()"""
+        payload = {
+            "model": model, "messages": messages, "max_tokens": max_tokens,
+            "temperature": temperature, "stream": True
+        }
+        with self._post(payload, stream=True) as response:
+            for line in response.iter_lines(decode_unicode=True):
+                # Skip keep-alive comments (": OPENROUTER PROCESSING") and blank separators
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    return
+                chunk = json.loads(data)
+                if "error" in chunk:
+                    raise LLMError(None, chunk["error"].get("message", chunk["error"]))
+                # Providers that report usage send it with the last chunk
+                _record_usage(usage, chunk)
+                if not chunk.get("choices"):
+                    continue
+                delta = chunk["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+
+
+class AsyncLLMClient:
+    """
+    asyncio counterpart of LLMClient on a pooled httpx.AsyncClient, so one
+    event loop can keep many completions in flight. Same timeouts, retries
+    and hedging. Bound to the event loop it is first used on, so create and
+    close it inside that loop (`async with AsyncLLMClient(...) as llm:`).
+    """
+
+    def __init__(self, provider, api_key=None, base_url=None, fallback_model=None,
+                 hedge_after=LLM_HEDGE_AFTER_SECONDS, connect_timeout=LLM_CONNECT_TIMEOUT,
+                 read_timeout=LLM_READ_TIMEOUT, max_retries=LLM_MAX_RETRIES, backoff=0.5,
+                 pool_size=LLM_POOL_SIZE):
+        self.url, headers, self.fallback_model = _provider_settings(provider, api_key, base_url, fallback_model)
+        self.provider = provider
+        self.hedge_after = hedge_after
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.client = httpx.AsyncClient(
+            headers=headers,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+
+    async def _complete(self, payload, usage=None):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.client.post(self.url, json=payload)
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise LLMError(None, str(e)) from e
+                await asyncio.sleep(self.backoff * (2 ** attempt))
+                continue
+            if response.status_code == 200:
+                body = response.json()
+                _record_usage(usage, body)
+                return body["choices"][0]["message"]["content"].strip()
+            if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                raise LLMError(response.status_code, response.text)
+            await asyncio.sleep(_retry_delay(self.backoff, attempt, response.headers.get("Retry-After")))
+
+    async def chat(self, messages, model, max_tokens=500, temperature=0.7, usage=None):
+        payload = {"model": model, "messages": messages, "max_tokens": max_tokens, "temperature": temperature}
+        if not (self.hedge_after and self.fallback_model):
+            return await self._complete(payload, usage)
+
+        primary = asyncio.ensure_future(self._complete(payload, usage))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done and primary.exception() is None:
+            return primary.result()
+        pending = {primary, asyncio.ensure_future(self._complete({**payload, "model": self.fallback_model}, usage))}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_llm_client(provider, api_key=None):
+    """One pooled client per provider and API key for the whole process"""
+    key = (provider, api_key)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = LLMClient(provider, api_key=api_key)
+        return _clients[key]
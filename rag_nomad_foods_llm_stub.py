@@ -0,0 +1,102 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the OpenRouter / Mistral chat-completions endpoint, for
+# running the app, the benchmarks or the LLM client without network access:
+#   python rag_nomad_foods_llm_stub.py --port 8089
+#   OPENROUTER_BASE_URL=http://127.0.0.1:8089/v1 streamlit run streamlit_chatbot_rag_nomad_foods.py
+
+STUB_ANSWER = "Hello! Thanks for reaching out to NomadFoods. This is a stubbed answer. Anything else I can help with?"
+
+
+class StubChatHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        with server.lock:
+            server.requests_seen += 1
+            fail = server.requests_seen <= server.fail_first
+        if fail:
+            self._send_json(server.fail_status, {"error": {"message": "stubbed failure"}})
+            return
+        time.sleep(server.delays.get(payload.get("model"), server.delay))
+
+        if not payload.get("stream"):
+            self._send_json(200, {
+                "id": f"stub-{server.requests_seen}",
+                "model": payload.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": server.answer}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(server.answer.split())}
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        events = [": OPENROUTER PROCESSING"]
+        for word in server.answer.split(" "):
+            events.append("data: " + json.dumps({"choices": [{"index": 0, "delta": {"content": word + " "}}]}))
+        events.append("data: [DONE]")
+        for event in events:
+            data = (event + "\n\n").encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+            time.sleep(server.token_delay)
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def start_stub_server(host="127.0.0.1", port=0, answer=STUB_ANSWER, delay=0.0, token_delay=0.0,
+                      fail_first=0, fail_status=503, delays=None):
+    """
+    Start the stub on a background thread and return the server
+    (server.server_port, server.requests_seen; call server.shutdown() to stop).
+    The first `fail_first` requests get `fail_status`; `delays` maps a model
+    name to its response delay in seconds (default `delay`).
+    """
+    server = ThreadingHTTPServer((host, port), StubChatHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests_seen = 0
+    server.answer = answer
+    server.delay = delay
+    server.delays = delays or {}
+    server.token_delay = token_delay
+    server.fail_first = fail_first
+    server.fail_status = fail_status
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenRouter/Mistral chat-completions stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds before the response starts")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between streamed tokens")
+    args = parser.parse_args()
+    stub = start_stub_server(args.host, args.port, delay=args.delay, token_delay=args.token_delay)
+    print(f"Stub chat-completions endpoint on http://{args.host}:{stub.server_port}/v1/chat/completions")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stub.shutdown()
@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from rag_nomad_foods_faq_data import content_hash
+from rag_nomad_foods_tracing import set_attributes, span
+
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+
+
+class CrossEncoderReranker:
+    """
+    Re-ranks retrieval candidates with a CPU cross-encoder in one batched
+    forward pass.
+
+    Only the first `top_k` candidates are scored. Scores are kept in an LRU
+    cache of `cache_size` entries, keyed on the query, the doc id and a hash of
+    the document text, so an edited answer is scored again. The measured cost
+    per pair caps how many uncached candidates get scored, so a call stays
+    within `time_budget_ms`. Candidates that are not scored keep their retrieval order
+    after the scored ones.
+    """
+
+    def __init__(self, model=None, top_k=5, time_budget_ms=150, cache_size=4096):
+        if model is None:
+            from sentence_transformers import CrossEncoder
+            model = CrossEncoder(RERANKER_MODEL, device="cpu")
+        self.model = model
+        self.top_k = top_k
+        self.time_budget_ms = time_budget_ms
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._seconds_per_pair = None
+
+    @staticmethod
+    def _cache_key(query, candidate):
+        return query, candidate["id"], content_hash(f"{candidate['question']} {candidate['answer']}")
+
+    def _cached_score(self, key):
+        with self._lock:
+            if key not in self._cache:
+                return None
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+    def _store_scores(self, items):
+        with self._lock:
+            for key, score in items:
+                self._cache[key] = score
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def rerank(self, query, candidates):
+        with span("rerank", candidates=len(candidates)):
+            return self._rerank(query, candidates)
+
+    def _rerank(self, query, candidates):
+        head, tail = list(candidates[:self.top_k]), list(candidates[self.top_k:])
+        scores = {}
+        uncached = []
+        for candidate in head:
+            score = self._cached_score(self._cache_key(query, candidate))
+            if score is None:
+                uncached.append(candidate)
+            else:
+                scores[candidate["id"]] = score
+
+        set_attributes(cache_hit=not uncached, scored=len(uncached))
+        if uncached:
+            if self._seconds_per_pair:
+                max_pairs = max(1, int(self.time_budget_ms / 1000 / self._seconds_per_pair))
+                uncached = uncached[:max_pairs]
+            start = time.perf_counter()
+            predicted = self.model.predict(
+                [(query, f"{c['question']} {c['answer']}") for c in uncached],
+                batch_size=len(uncached),
+                show_progress_bar=False
+            )
+            per_pair = (time.perf_counter() - start) / len(uncached)
+            # Exponential moving average so one slow call doesn't shrink the batch for good
+            self._seconds_per_pair = per_pair if self._seconds_per_pair is None else (
+                0.8 * self._seconds_per_pair + 0.2 * per_pair
+            )
+            new_scores = [(c, float(score)) for c, score in zip(uncached, predicted)]
+            scores.update((c["id"], score) for c, score in new_scores)
+            self._store_scores((self._cache_key(query, c), score) for c, score in new_scores)
+
+        scored = sorted(
+            ({**c, "rerank_score": scores[c["id"]]} for c in head if c["id"] in scores),
+            key=lambda c: c["rerank_score"],
+            reverse=True
+        )
+        unscored = [c for c in head if c["id"] not in scores]
+        return scored + unscored + tail
@@ -0,0 +1,298 @@
+import argparse
+import contextvars
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+from rag_nomad_foods_chatbot import (
+    generate_cached_answer, get_answer_cache, get_index_reloader, get_retriever, retrieve_faq, stream_cached_answer,
+    warm_up
+)
+from rag_nomad_foods_tenants import UnknownTenantError, validate_tenant
+from rag_nomad_foods_tracing import span
+
+load_dotenv()
+
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", str(4 * (os.cpu_count() or 1))))
+# Queries accepted (running + waiting) before new requests get 503 + Retry-After
+SERVICE_QUEUE_LIMIT = int(os.getenv("SERVICE_QUEUE_LIMIT", "64"))
+SERVICE_MAX_BATCH = int(os.getenv("SERVICE_MAX_BATCH", "32"))
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class BadRequestError(Exception):
+    """The request body is invalid; raised before any work is dispatched, answered with 400"""
+
+
+def parse_query(body, key="query"):
+    query = body.get(key)
+    if not isinstance(query, str) or not query.strip():
+        raise BadRequestError(f"'{key}' must be a non-empty string")
+    return query
+
+
+def parse_queries(body):
+    queries = body.get("queries")
+    if not isinstance(queries, list) or not queries or not all(isinstance(q, str) and q.strip() for q in queries):
+        raise BadRequestError("'queries' must be a non-empty list of non-empty strings")
+    if len(queries) > SERVICE_MAX_BATCH:
+        raise BadRequestError(f"At most {SERVICE_MAX_BATCH} queries per batch")
+    return queries
+
+
+def parse_tenant(body):
+    tenant = body.get("tenant")
+    if tenant is None:
+        return None
+    try:
+        return validate_tenant(tenant)
+    except ValueError as e:
+        raise BadRequestError(str(e))
+
+
+def parse_top_k(body):
+    top_k = body.get("top_k", 5)
+    if isinstance(top_k, bool) or not isinstance(top_k, int) or top_k < 1:
+        raise BadRequestError("'top_k' must be a positive integer")
+    return top_k
+
+
+class WorkerPool:
+    """Thread pool with a hard cap on accepted work, so overload turns into fast 503s instead of a growing queue"""
+
+    def __init__(self, workers=SERVICE_WORKERS, queue_limit=SERVICE_QUEUE_LIMIT):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rag-worker")
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.accepted = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, n=1):
+        with self._lock:
+            if self.accepted + n > self.queue_limit:
+                self.rejected += 1
+                raise QueueFullError(f"{self.accepted} queries already accepted (limit {self.queue_limit})")
+            self.accepted += n
+
+    def release(self, n=1):
+        with self._lock:
+            self.accepted -= n
+
+    def submit(self, fn, item):
+        """Run fn(item) on a worker, in the caller's trace context, recording how long it waited for one"""
+        submitted = time.perf_counter()
+
+        def run():
+            with span("worker", queue_ms=(time.perf_counter() - submitted) * 1000):
+                return fn(item)
+
+        return self.executor.submit(contextvars.copy_context().run, run)
+
+    def map(self, fn, items):
+        """Run fn over items on the pool; the caller must have reserved len(items) slots"""
+        futures = [self.submit(fn, item) for item in items]
+        try:
+            return [future.result() for future in futures]
+        finally:
+            self.release(len(items))
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue_limit,
+            "accepted": self.accepted,
+            "rejected": self.rejected
+        }
+
+
+class AnswerService:
+    def __init__(self, pool=None, api_key=None):
+        self.pool = pool or WorkerPool()
+        self.api_key = api_key or os.getenv("OPENROUTER_API_KEY")
+        self.ready = threading.Event()
+        self.warmup_error = None
+
+    def warm_up(self):
+        # Load the model, open the index and create the answer cache before taking traffic
+        try:
+            warm_up()
+            self.ready.set()
+        except Exception as e:
+            self.warmup_error = repr(e)
+            raise
+
+    def search(self, query, top_k=5, tenant=None):
+        return [
+            {key: match[key] for key in ("id", "score", "question", "answer")}
+            for match in get_retriever().search(query, top_k=top_k, tenant=tenant)
+        ]
+
+    def answer(self, query, tenant=None):
+        faq = retrieve_faq(query, tenant)
+        return {
+            "query": query,
+            "answer": generate_cached_answer(query, faq, self.api_key),
+            "faq": {"id": faq["id"], "question": faq["question"], "score": faq["score"]} if faq else None
+        }
+
+    def stream_answer(self, query, tenant=None):
+        # Retrieval happens here, on the worker; the returned generator streams the LLM answer
+        faq = retrieve_faq(query, tenant)
+        return stream_cached_answer(query, faq, self.api_key)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    service = None
+    # Set once a chunked response has started, when an error can no longer change the status
+    _streaming = False
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except ValueError as e:
+            raise BadRequestError(f"Invalid JSON: {e}")
+        if not isinstance(body, dict):
+            raise BadRequestError("The body must be a JSON object")
+        return body
+
+    def do_GET(self):
+        if self.path == "/healthz":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/readyz":
+            if self.service.ready.is_set():
+                self._send_json(200, {"status": "ready"})
+            else:
+                self._send_json(503, {"status": "warming up", "error": self.service.warmup_error})
+        elif self.path == "/stats":
+            self._send_json(200, {"pool": self.service.pool.stats(), "answer_cache": get_answer_cache().stats(),
+                                  "index_reload": get_index_reloader().stats() if self.service.ready.is_set() else {}})
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        routes = {
+            "/search": self._search,
+            "/answer": self._answer,
+            "/answer/batch": self._answer_batch,
+            "/answer/stream": self._answer_stream
+        }
+        route = routes.get(self.path)
+        if route is None:
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        if not self.service.ready.is_set():
+            self._send_json(503, {"error": "Service is warming up"}, {"Retry-After": "5"})
+            return
+        try:
+            body = self._read_json()
+            route(body)
+        except QueueFullError as e:
+            self._send_json(503, {"error": str(e)}, {"Retry-After": "1"})
+        except UnknownTenantError as e:
+            self._send_json(404, {"error": f"Unknown tenant {e}"})
+        except BadRequestError as e:
+            self._send_json(400, {"error": f"Bad request: {e}"})
+        except Exception as e:
+            print(f"{self.path} failed: {e!r}")
+            if self._streaming:
+                # The 200 headers are out; dropping the connection is the only way left to signal the failure
+                self.close_connection = True
+            else:
+                self._send_json(500, {"error": f"Internal error: {e!r}"})
+        finally:
+            self._streaming = False
+
+    def _run(self, fn, *items):
+        with span("request", endpoint=self.path, queries=len(items)):
+            self.service.pool.reserve(len(items))
+            return self.service.pool.map(fn, items)
+
+    # Each route validates the whole body before dispatching anything, so only a BadRequestError becomes a 400
+    def _search(self, body):
+        query, top_k, tenant = parse_query(body), parse_top_k(body), parse_tenant(body)
+        matches, = self._run(lambda query: self.service.search(query, top_k, tenant), query)
+        self._send_json(200, {"query": query, "matches": matches})
+
+    def _answer(self, body):
+        query, tenant = parse_query(body), parse_tenant(body)
+        result, = self._run(lambda query: self.service.answer(query, tenant), query)
+        self._send_json(200, result)
+
+    def _answer_batch(self, body):
+        # One tenant per batch
+        queries, tenant = parse_queries(body), parse_tenant(body)
+
+        def answer(query):
+            # A failing query gets an error entry instead of failing the whole batch
+            try:
+                return self.service.answer(query, tenant)
+            except UnknownTenantError:
+                raise
+            except Exception as e:
+                print(f"{self.path} failed on {query!r}: {e!r}")
+                return {"query": query, "answer": None, "error": repr(e)}
+
+        self._send_json(200, {"results": self._run(answer, *queries)})
+
+    def _answer_stream(self, body):
+        # Streams plain-text deltas with chunked transfer encoding; the work still holds a pool slot
+        query, tenant = parse_query(body), parse_tenant(body)
+        with span("request", endpoint=self.path, queries=1):
+            self.service.pool.reserve()
+            try:
+                stream = self.service.pool.submit(lambda query: self.service.stream_answer(query, tenant), query)
+                self._stream(stream.result())
+            finally:
+                self.service.pool.release()
+
+    def _stream(self, stream):
+        self._streaming = True
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for delta in stream:
+            data = delta.encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def serve(host="0.0.0.0", port=8000, service=None):
+    service = service or AnswerService()
+    handler = type("BoundServiceHandler", (ServiceHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=service.warm_up, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Nomad Foods RAG answer service")
+    parser.add_argument("--host", default=os.getenv("SERVICE_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("SERVICE_PORT", "8000")))
+    args = parser.parse_args()
+    server = serve(args.host, args.port)
+    print(f"Serving /answer, /answer/batch, /answer/stream and /search on http://{args.host}:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,60 @@
+import os
+import requests
+
+# Thin client for rag_nomad_foods_service.py; it doesn't load the model or the index
+RAG_SERVICE_URL = os.getenv("RAG_SERVICE_URL")
+RAG_SERVICE_TIMEOUT = (3.05, float(os.getenv("RAG_SERVICE_TIMEOUT", "90")))
+
+_session = requests.Session()
+
+
+def _url(path, base_url=None):
+    return f"{(base_url or RAG_SERVICE_URL).rstrip('/')}{path}"
+
+
+def _body(tenant, **fields):
+    # Without a tenant the service answers from the default index
+    return {**fields, "tenant": tenant} if tenant else fields
+
+
+def search(query, top_k=5, base_url=None, tenant=None):
+    response = _session.post(_url("/search", base_url), json=_body(tenant, query=query, top_k=top_k), timeout=RAG_SERVICE_TIMEOUT)
+    response.raise_for_status()
+    return response.json()["matches"]
+
+
+def answer(query, base_url=None, tenant=None):
+    response = _session.post(_url("/answer", base_url), json=_body(tenant, query=query), timeout=RAG_SERVICE_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+
+def answer_batch(queries, base_url=None, tenant=None):
+    response = _session.post(_url("/answer/batch", base_url), json=_body(tenant, queries=list(queries)), timeout=RAG_SERVICE_TIMEOUT)
+    response.raise_for_status()
+    return response.json()["results"]
+
+
+def stream_answer(query, base_url=None, tenant=None):
+    """Yield answer text deltas as the service streams them"""
+    with _session.post(_url("/answer/stream", base_url), json=_body(tenant, query=query),
+                       timeout=RAG_SERVICE_TIMEOUT, stream=True) as response:
+        response.raise_for_status()
+        response.encoding = "utf-8"
+        for delta in response.iter_content(chunk_size=None, decode_unicode=True):
+            if delta:
+                yield delta
+
+
+def is_ready(base_url=None):
+    """True once the service has loaded the model and the index (its /readyz)"""
+    try:
+        return _session.get(_url("/readyz", base_url), timeout=RAG_SERVICE_TIMEOUT[0]).status_code == 200
+    except requests.RequestException:
+        return False
+
+
+def service_stats(base_url=None):
+    response = _session.get(_url("/stats", base_url), timeout=RAG_SERVICE_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
@@ -0,0 +1,67 @@
+import time
+import uuid
+
+# Per-session request state for the Streamlit apps. Streamlit re-runs the whole
+# script on every widget interaction, so the pipeline must only run for a newly
+# submitted query: submit_query() creates a "pending" request once per distinct
+# submission, the app runs the pipeline for it and marks it "done" (or "failed"),
+# and later reruns - feedback clicks, sliders - only read the stored result.
+# A failed request doesn't count as answered: the next rerun with the same
+# query submits it again, so the user can retry.
+
+
+def init_request_state(state):
+    if "requests" not in state:
+        state["requests"] = {}
+    if "last_submitted" not in state:
+        state["last_submitted"] = ""
+    if "last_query_id" not in state:
+        state["last_query_id"] = None
+
+
+def submit_query(state, query):
+    """
+    Create a pending request unless `query` is the one already submitted and
+    that request didn't fail; returns its query_id or None
+    """
+    query = (query or "").strip()
+    if not query:
+        return None
+    if query == state["last_submitted"]:
+        last = state["requests"].get(state["last_query_id"])
+        if last is None or last["status"] != "failed":
+            return None
+    state["last_submitted"] = query
+    query_id = state["last_query_id"] = uuid.uuid4().hex
+    state["requests"][query_id] = {
+        "query_id": query_id, "query": query, "status": "pending", "submitted_at": time.time(), "feedback": None
+    }
+    return query_id
+
+
+def next_pending(state):
+    for query_id, request in state["requests"].items():
+        if request["status"] == "pending":
+            return query_id
+    return None
+
+
+def complete_request(state, query_id, **result):
+    state["requests"][query_id].update(result, status="done")
+
+
+def fail_request(state, query_id, error):
+    state["requests"][query_id].update(status="failed", error=str(error))
+
+
+def completed_requests(state):
+    return [request for request in state["requests"].values() if request["status"] == "done"]
+
+
+def record_feedback(state, query_id, feedback):
+    """Attach feedback to a finished request; False if it already has some"""
+    request = state["requests"][query_id]
+    if request["feedback"] is not None:
+        return False
+    request["feedback"] = feedback
+    return True
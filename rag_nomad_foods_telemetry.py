@@ -0,0 +1,228 @@
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# Same variables as monitoring/init_db.py; the apps usually run on the host, next to the docker-compose port mapping
+db_params = {
+    'dbname': os.getenv('POSTGRES_DB', 'monitoring_db'),
+    'user': os.getenv('POSTGRES_USER', 'postgres'),
+    'password': os.getenv('POSTGRES_PASSWORD', 'example'),
+    'host': os.getenv('POSTGRES_HOST', 'localhost'),
+    'port': os.getenv('POSTGRES_PORT', '5432')
+}
+
+# "postgres" or "sqlite"
+MONITORING_BACKEND = os.getenv('MONITORING_BACKEND', 'postgres')
+MONITORING_SQLITE_PATH = os.getenv('MONITORING_SQLITE_PATH', 'monitoring.sqlite')
+TELEMETRY_QUEUE_SIZE = int(os.getenv('TELEMETRY_QUEUE_SIZE', '10000'))
+TELEMETRY_BATCH_SIZE = int(os.getenv('TELEMETRY_BATCH_SIZE', '100'))
+TELEMETRY_FLUSH_SECONDS = float(os.getenv('TELEMETRY_FLUSH_SECONDS', '2'))
+
+# Columns written per table and the SQLite DDL; the Postgres tables are created by monitoring/init_db.py
+TABLES = {
+    'feedback': (
+        ('user_query', 'thumbs_up', 'thumbs_down', 'relevant', 'model_used', 'response_time'),
+        """
+        CREATE TABLE IF NOT EXISTS feedback (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_query TEXT NOT NULL,
+            thumbs_up BOOLEAN,
+            thumbs_down BOOLEAN,
+            relevant BOOLEAN,
+            model_used TEXT,
+            response_time FLOAT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    ),
+    'request_spans': (
+        ('trace_id', 'span_id', 'parent_id', 'stage', 'started_at', 'duration_ms', 'queue_ms',
+         'tokens_in', 'tokens_out', 'cache_hit', 'status', 'attributes'),
+        """
+        CREATE TABLE IF NOT EXISTS request_spans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            trace_id TEXT NOT NULL,
+            span_id TEXT NOT NULL,
+            parent_id TEXT,
+            stage TEXT NOT NULL,
+            started_at TIMESTAMP NOT NULL,
+            duration_ms FLOAT NOT NULL,
+            queue_ms FLOAT,
+            tokens_in INTEGER,
+            tokens_out INTEGER,
+            cache_hit BOOLEAN,
+            status TEXT,
+            attributes TEXT
+        )
+        """
+    )
+}
+
+
+class PostgresSink:
+    """Writes batches with one multi-row INSERT on a pooled connection"""
+
+    def __init__(self, table, params=None, min_connections=1, max_connections=4):
+        import psycopg2.extras
+        import psycopg2.pool
+        self._execute_values = psycopg2.extras.execute_values
+        self.sql = f"INSERT INTO {table} ({', '.join(TABLES[table][0])}) VALUES %s"
+        self.pool = psycopg2.pool.ThreadedConnectionPool(min_connections, max_connections, **(params or db_params))
+
+    def write_batch(self, rows):
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor() as cursor:
+                self._execute_values(cursor, self.sql, rows)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn)
+
+    def close(self):
+        self.pool.closeall()
+
+
+class SQLiteSink:
+    """Same tables in a local SQLite file, for running and testing without Postgres"""
+
+    def __init__(self, table, path=MONITORING_SQLITE_PATH):
+        columns, ddl = TABLES[table]
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(ddl)
+        self.sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        self.lock = threading.Lock()
+
+    def write_batch(self, rows):
+        with self.lock, self.conn:
+            self.conn.executemany(self.sql, rows)
+
+    def close(self):
+        self.conn.close()
+
+
+class BatchWriter:
+    """
+    Buffers rows in a bounded in-memory queue and writes them from a
+    background thread, in batches of up to `batch_size` rows or every
+    `flush_interval` seconds. submit() never blocks the caller: when the queue
+    is full the row is dropped and counted.
+    """
+
+    def __init__(self, sink, max_queue=TELEMETRY_QUEUE_SIZE, batch_size=TELEMETRY_BATCH_SIZE,
+                 flush_interval=TELEMETRY_FLUSH_SECONDS, name='telemetry-writer'):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.counters = {'submitted': 0, 'written': 0, 'dropped': 0, 'failed': 0, 'batches': 0}
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def submit(self, row):
+        """Queue one row (a tuple in the table's column order); returns False if it was dropped"""
+        if self._closed:
+            self._count('dropped')
+            return False
+        try:
+            self.queue.put_nowait(tuple(row))
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('submitted')
+        return True
+
+    def _run(self):
+        batch, markers = [], []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if isinstance(item, threading.Event):
+                markers.append(item)
+            elif item is not None:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            # Flush when the batch is full, the time trigger fired, or flush()/close() asked for it
+            if batch and (len(batch) >= self.batch_size or item is None or markers):
+                self._write(batch)
+                batch, deadline = [], None
+            elif not batch:
+                deadline = None
+            for marker in markers:
+                marker.set()
+            if markers and self._closed:
+                return
+            markers = []
+
+    def _write(self, batch):
+        try:
+            self.sink.write_batch(batch)
+            self._count('written', len(batch))
+            self._count('batches')
+        except Exception as e:
+            self._count('failed', len(batch))
+            print(f"Failed to write {len(batch)} telemetry rows: {e!r}")
+
+    def flush(self, timeout=10.0):
+        """Block until everything submitted so far has been written (or dropped as failed); False on timeout"""
+        marker = threading.Event()
+        deadline = time.monotonic() + timeout
+        try:
+            self.queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return False
+        return marker.wait(max(0.0, deadline - time.monotonic()))
+
+    def close(self, timeout=10.0):
+        if self._closed:
+            return
+        self._closed = True
+        if not self.flush(timeout):
+            # The writer thread may still be using the sink; leave both to the interpreter exit
+            print(f"Telemetry writer did not drain within {timeout}s, {self.queue.qsize()} rows not written")
+            return
+        self._thread.join(timeout)
+        self.sink.close()
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, 'queued': self.queue.qsize()}
+
+
+def create_sink(table, backend=None):
+    backend = backend or MONITORING_BACKEND
+    if backend == 'sqlite':
+        return SQLiteSink(table)
+    if backend == 'postgres':
+        return PostgresSink(table)
+    raise ValueError(f"Unknown monitoring backend {backend!r}, expected 'postgres' or 'sqlite'")
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_telemetry_writer(table, backend=None):
+    """One writer (and connection pool) per table and backend for the whole process, flushed on exit"""
+    key = (table, backend or MONITORING_BACKEND)
+    with _writers_lock:
+        if key not in _writers:
+            _writers[key] = BatchWriter(create_sink(table, key[1]), name=f'{table}-writer')
+            atexit.register(_writers[key].close)
+        return _writers[key]
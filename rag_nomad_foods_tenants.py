@@ -0,0 +1,201 @@
+import argparse
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from rag_nomad_foods_doc_store import attach_documents, document_store_path
+from rag_nomad_foods_vector_store import (
+    PineconeVectorStore, check_index_encoder, local_backend_name, open_local_vector_store
+)
+
+# Several brands / locales served from one deployment. A tenant's vectors live in
+# their own Pinecone namespace, or in their own local index under
+# VECTOR_STORE_DIR/tenants/<tenant>/, next to its documents.bin. Requests without a tenant use the default
+# (un-namespaced) index, as before.
+#   python rag_nomad_foods_tenants.py ingest --faq-file birds_eye_uk.json --locale en-gb
+
+# Budget for the local tenant indexes kept open per process; least recently used ones are closed first
+TENANT_CACHE_MB = float(os.getenv("TENANT_CACHE_MB", "512"))
+
+TENANT_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+# Written next to a tenant's documents when it is indexed: its brand, which the prompt speaks for
+TENANT_INFO_FILE = "tenant.json"
+
+
+class UnknownTenantError(KeyError):
+    pass
+
+
+def validate_tenant(tenant):
+    """Tenant ids end up in paths and namespaces, so only lowercase slugs are accepted"""
+    if not isinstance(tenant, str) or not TENANT_PATTERN.match(tenant):
+        raise ValueError(f"Invalid tenant {tenant!r}, expected a lowercase slug ({TENANT_PATTERN.pattern})")
+    return tenant
+
+
+def tenant_id(qa_data, locale=None):
+    """Tenant of a FAQ file: its company_name (and locale, if any) as a slug, e.g. "nomadfoods-inc-en-gb" """
+    name = " ".join(part for part in (qa_data.get("company_name", ""), locale or qa_data.get("locale", "")) if part)
+    slug = re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")[:64]
+    return validate_tenant(slug)
+
+
+def tenant_directory(directory, tenant):
+    return os.path.join(directory, "tenants", validate_tenant(tenant))
+
+
+def save_tenant_info(directory, tenant, qa_data):
+    """Record the company name of a tenant's FAQ file (directory/tenants/<tenant>/tenant.json)"""
+    path = os.path.join(tenant_directory(directory, tenant), TENANT_INFO_FILE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump({"company_name": qa_data.get("company_name")}, f)
+    os.replace(tmp_path, path)
+
+
+def tenant_company_name(directory, tenant):
+    """The company name recorded for a tenant, or None if it was indexed without one"""
+    try:
+        with open(os.path.join(tenant_directory(directory, tenant), TENANT_INFO_FILE), "r") as f:
+            return json.load(f).get("company_name")
+    except FileNotFoundError:
+        return None
+
+
+def store_bytes(store):
+    """Approximate memory of a local store: the size of its files (vectors, index, metadata)"""
+    if not os.path.isdir(store.directory):
+        return 0
+    return sum(entry.stat().st_size for entry in os.scandir(store.directory) if entry.is_file())
+
+
+class TenantNamespaces:
+    """
+    Tenants of a Pinecone index: one namespace each; only their document stores
+    are mapped locally, and reopened when another process rewrites them.
+    """
+
+    def __init__(self, store, directory):
+        self.store = store
+        self.directory = directory
+        # tenant -> (store, documents.bin mtime)
+        self._stores = {}
+
+    def get(self, tenant):
+        directory = tenant_directory(self.directory, tenant)
+        path = document_store_path(directory)
+        version = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+        entry = self._stores.get(tenant)
+        if entry is None or entry[1] != version:
+            store = PineconeVectorStore(self.store.index, namespace=tenant)
+            entry = self._stores[tenant] = (attach_documents(store, directory), version)
+        return entry[0]
+
+    def stats(self):
+        return {"backend": "pinecone", "tenants": len(self._stores)}
+
+
+class LocalTenantIndexes:
+    """
+    Per-tenant local indexes (directory/tenants/<tenant>/<backend>) opened on
+    demand and kept in an LRU capped at `max_bytes`. Evicting a tenant only
+    drops the reference: queries still using it finish, then its memory maps
+    are released. A tenant re-ingested by another process (its metadata.json
+    or documents.bin changed) is reopened on the next request. With `encoder`
+    and `dimension` set, a tenant indexed by another encoder is refused
+    (EncoderMismatchError).
+    """
+
+    def __init__(self, backend, directory, max_bytes=TENANT_CACHE_MB * 1024 * 1024, encoder=None, dimension=None):
+        self.backend = backend
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.encoder = encoder
+        self.dimension = dimension
+        # tenant -> (store, bytes, version)
+        self._stores = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _version(self, store):
+        # Changes when the tenant's vectors or documents are rewritten
+        return tuple(
+            os.stat(path).st_mtime_ns if os.path.exists(path) else None
+            for path in (store.metadata_path, document_store_path(os.path.dirname(store.directory)))
+        )
+
+    def get(self, tenant):
+        path = os.path.join(tenant_directory(self.directory, tenant), self.backend)
+        with self._lock:
+            entry = self._stores.get(tenant)
+            if entry is not None and entry[2] == self._version(entry[0]):
+                self._stores.move_to_end(tenant)
+                self.counters["hits"] += 1
+                return entry[0]
+        if not os.path.isdir(path):
+            raise UnknownTenantError(tenant)
+        # Opened outside the lock so a slow tenant doesn't hold up the others
+        directory = tenant_directory(self.directory, tenant)
+        store = attach_documents(open_local_vector_store(self.backend, directory), directory)
+        if self.encoder is not None:
+            check_index_encoder(store, self.encoder, self.dimension)
+        size = store_bytes(store) + (store.documents.nbytes() if store.documents is not None else 0)
+        with self._lock:
+            self.counters["misses"] += 1
+            previous = self._stores.pop(tenant, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._stores[tenant] = (store, size, self._version(store))
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._stores) > 1:
+                _, (_, evicted_size, _) = self._stores.popitem(last=False)
+                self._bytes -= evicted_size
+                self.counters["evictions"] += 1
+        return store
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "loaded": len(self._stores),
+                "loaded_mb": self._bytes / 1024 / 1024,
+                "max_mb": self.max_bytes / 1024 / 1024,
+                **self.counters
+            }
+
+
+def open_tenant_indexes(store, directory, encoder=None, dimension=None):
+    """Tenant routing next to the default store: Pinecone namespaces (same index, same encoder), or per-tenant local indexes"""
+    if isinstance(store, PineconeVectorStore):
+        return TenantNamespaces(store, directory)
+    return LocalTenantIndexes(local_backend_name(store), directory, encoder=encoder, dimension=dimension)
+
+
+if __name__ == "__main__":
+    from rag_nomad_foods_chatbot import ENCODER_NAME, VECTOR_STORE_DIR, init_vector_store, load_model
+    from rag_nomad_foods_doc_store import build_document_store_from_file
+    from rag_nomad_foods_embedding_cache import EmbeddingCache
+    from rag_nomad_foods_faq_data import load_faq_data
+    from rag_nomad_foods_ingestion import ingest_faq
+
+    parser = argparse.ArgumentParser(description="Index a tenant's FAQ file into its own namespace / local index")
+    parser.add_argument("command", choices=["ingest"])
+    parser.add_argument("--faq-file", required=True)
+    parser.add_argument("--tenant", help="Defaults to the file's company_name (+ locale)")
+    parser.add_argument("--locale")
+    parser.add_argument("--backend", choices=["pinecone", "faiss", "numpy"])
+    args = parser.parse_args()
+
+    tenant = validate_tenant(args.tenant) if args.tenant else tenant_id(load_faq_data(args.faq_file), args.locale)
+    # Re-indexed from scratch below, so an index from another encoder is fine here
+    store = init_vector_store(args.backend, tenant, check_encoder=False)
+    if store.describe_index_stats()["total_vector_count"]:
+        store.delete(delete_all=True)
+    # Documents first: until the new vectors are flushed, ids they don't know are only skipped
+    build_document_store_from_file(args.faq_file, tenant_directory(VECTOR_STORE_DIR, tenant))
+    save_tenant_info(VECTOR_STORE_DIR, tenant, load_faq_data(args.faq_file))
+    ingest_faq(store, EmbeddingCache(load_model(), ENCODER_NAME), args.faq_file)
+    print(f"Indexed '{args.faq_file}' as tenant '{tenant}': {store.describe_index_stats()}")
@@ -0,0 +1,116 @@
+import contextvars
+import datetime
+import json
+import os
+import random
+import time
+import uuid
+from contextlib import contextmanager
+
+# Spans are only exported when TRACE_BACKEND is "postgres" or "sqlite" (see rag_nomad_foods_telemetry.py)
+TRACE_BACKEND = os.getenv("TRACE_BACKEND", "")
+# Fraction of traces (requests, ingestion runs) that are recorded; a trace is kept or dropped as a whole
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+
+# Dedicated columns of the request_spans table; any other attribute goes to the JSON "attributes" column
+SPAN_COLUMNS = ("queue_ms", "tokens_in", "tokens_out", "cache_hit", "status")
+
+_current_span = contextvars.ContextVar("rag_current_span", default=None)
+_backend = TRACE_BACKEND
+
+
+class Span:
+    def __init__(self, stage, parent=None, sample_rate=None, **attributes):
+        if parent is None:
+            self.trace_id = uuid.uuid4().hex
+            self.sampled = random.random() < (TRACE_SAMPLE_RATE if sample_rate is None else sample_rate)
+        else:
+            self.trace_id = parent.trace_id
+            self.sampled = parent.sampled
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.stage = stage
+        self.attributes = {"status": "ok", **attributes}
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration_ms = None
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self._start) * 1000
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def finish(self):
+        if self.duration_ms is None:
+            self.duration_ms = self.elapsed_ms()
+            if self.sampled:
+                _export(self)
+        return self
+
+    def row(self):
+        """Values in the column order of the request_spans table"""
+        extra = {k: v for k, v in self.attributes.items() if k not in SPAN_COLUMNS}
+        return (
+            self.trace_id, self.span_id, self.parent_id, self.stage,
+            datetime.datetime.fromtimestamp(self.started_at, datetime.timezone.utc).isoformat(),
+            self.duration_ms,
+            *(self.attributes.get(column) for column in SPAN_COLUMNS),
+            json.dumps(extra, default=str) if extra else None
+        )
+
+
+def start_span(stage, **attributes):
+    """
+    Child of the current span (or the root of a new trace) that is not made
+    current; call finish() on it. For work that outlives the current frame,
+    such as a streamed answer, or that runs on another thread.
+    """
+    return Span(stage, parent=_current_span.get(), **attributes)
+
+
+@contextmanager
+def span(stage, **attributes):
+    """Time the block as `stage`; spans opened inside it become its children"""
+    current = start_span(stage, **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set(status="error", error=repr(e))
+        raise
+    finally:
+        _current_span.reset(token)
+        current.finish()
+
+
+def current_span():
+    return _current_span.get()
+
+
+def set_attributes(**attributes):
+    """Attach attributes (tokens_in, cache_hit, ...) to the current span, if any"""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+def enable_span_export(backend):
+    """Export finished spans to the request_spans table of `backend` ("postgres" or "sqlite"); None disables it"""
+    global _backend
+    _backend = backend or ""
+
+
+def _export(finished):
+    global _backend
+    if not _backend:
+        return
+    # Imported here so tracing stays free of database dependencies when export is off
+    from rag_nomad_foods_telemetry import get_telemetry_writer
+    try:
+        get_telemetry_writer("request_spans", _backend).submit(finished.row())
+    except Exception as e:
+        # Typically the database is unreachable; stop trying instead of failing every request
+        print(f"Disabling span export, could not write to {_backend}: {e!r}")
+        _backend = ""
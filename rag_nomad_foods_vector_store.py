@@ -0,0 +1,376 @@
+import json
+import os
+import threading
+import numpy as np
+import faiss
+from rag_nomad_foods_ann_index import (FAISS_INDEX_TYPE, RecallBelowFloorError, build_checked_index, build_index,
+                                       sample_queries, search, set_search_params)
+from rag_nomad_foods_encoder import MODEL_NAME
+
+
+class VectorStore:
+    """
+    Interface shared by every vector backend. It mirrors the subset of the
+    Pinecone Index API this project uses, so ingestion and retrieval code works
+    unchanged against Pinecone, FAISS or plain NumPy.
+    """
+
+    # DocumentStore with the text of the ids this store returns (see rag_nomad_foods_doc_store.py)
+    documents = None
+    # Name of the encoder that wrote the vectors (encoder_name()), None if it wasn't recorded
+    encoder = None
+
+    def upsert(self, vectors, namespace=None):
+        raise NotImplementedError
+
+    def query(self, vector, top_k=1, include_metadata=False, namespace=None, **kwargs):
+        raise NotImplementedError
+
+    def query_many(self, vectors, top_k=1, include_metadata=False, namespace=None):
+        """query() for a batch of vectors; local backends answer the whole batch in one search"""
+        return [self.query(vector=list(vector), top_k=top_k, include_metadata=include_metadata, namespace=namespace)
+                for vector in vectors]
+
+    def fetch(self, ids, namespace=None):
+        raise NotImplementedError
+
+    def ids(self):
+        """Every id in the store, or None where listing them isn't cheap (Pinecone)"""
+        return None
+
+    def delete(self, ids=None, delete_all=False, namespace=None):
+        raise NotImplementedError
+
+    def describe_index_stats(self):
+        raise NotImplementedError
+
+    def flush(self):
+        """Persist pending writes (no-op for remote backends)"""
+
+
+class PineconeVectorStore(VectorStore):
+    """Thin wrapper around a pinecone.Index; `namespace` is used when a call doesn't pass one (one per tenant)"""
+
+    def __init__(self, index, namespace=None):
+        self.index = index
+        self.namespace = namespace
+
+    def _namespace(self, namespace):
+        namespace = namespace if namespace is not None else self.namespace
+        return {"namespace": namespace} if namespace is not None else {}
+
+    def upsert(self, vectors, namespace=None):
+        return self.index.upsert(vectors=vectors, **self._namespace(namespace))
+
+    def query(self, vector, top_k=1, include_metadata=False, namespace=None, **kwargs):
+        kwargs.update(self._namespace(namespace))
+        return self.index.query(vector=vector, top_k=top_k, include_metadata=include_metadata, **kwargs)
+
+    def fetch(self, ids, namespace=None):
+        return self.index.fetch(ids=ids, **self._namespace(namespace))
+
+    def delete(self, ids=None, delete_all=False, namespace=None):
+        kwargs = self._namespace(namespace)
+        if delete_all:
+            return self.index.delete(delete_all=True, **kwargs)
+        return self.index.delete(ids=ids, **kwargs)
+
+    def describe_index_stats(self):
+        stats = self.index.describe_index_stats()
+        if self.namespace is None:
+            return stats
+        # Scoped to this store's namespace, so "is it populated" checks work per tenant
+        vector_count = stats.get("namespaces", {}).get(self.namespace, {}).get("vector_count", 0)
+        return {**stats, "total_vector_count": vector_count}
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Local cosine-similarity store persisted under `directory`.
+
+    vectors.npy holds the L2-normalised float32 matrix and metadata.json the ids
+    and metadata in row order. Once written, the matrix is reopened with
+    mmap_mode="r", so every worker process on the node shares the same page
+    cache copy. Writes stay in RAM until flush() replaces the files atomically;
+    readers holding the previous snapshot keep working.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, "vectors.npy")
+        self.metadata_path = os.path.join(directory, "metadata.json")
+        self._lock = threading.Lock()
+        self._dirty = False
+        # (ids, metadata, vectors, search index) swapped as one tuple so a query never
+        # sees a half-applied write
+        self._state = ([], [], None, None)
+        self._load()
+
+    def _load(self):
+        if not (os.path.exists(self.vectors_path) and os.path.exists(self.metadata_path)):
+            return
+        with open(self.metadata_path, "r") as f:
+            meta = json.load(f)
+        vectors = np.load(self.vectors_path, mmap_mode="r")
+        self._state = (meta["ids"], meta["metadata"], vectors, self._open_search_index(vectors))
+        self.encoder = meta.get("encoder")
+
+    def _open_search_index(self, vectors):
+        return None
+
+    def _build_search_index(self, vectors):
+        return None
+
+    def _build_deployed_index(self, vectors):
+        # The index written by flush(); _build_search_index() serves unflushed writes
+        return self._build_search_index(vectors)
+
+    def _save_search_index(self, search_index):
+        pass
+
+    def _search(self, vectors, search_index, queries, top_k):
+        # queries is (n, dim); returns (n, top_k) scores and rows
+        scores = np.asarray(queries @ np.asarray(vectors).T)
+        top_k = min(top_k, scores.shape[1])
+        top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        return np.take_along_axis(top_scores, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+    def upsert(self, vectors, namespace=None):
+        with self._lock:
+            ids, metadata, matrix, _ = self._state
+            ids, metadata = list(ids), list(metadata)
+            positions = {vec_id: row for row, vec_id in enumerate(ids)}
+            new_values = np.asarray([vector["values"] for vector in vectors], dtype="float32")
+            norms = np.linalg.norm(new_values, axis=1, keepdims=True)
+            new_values = new_values / np.where(norms == 0, 1, norms)
+            matrix = np.array(matrix) if matrix is not None else np.empty((0, new_values.shape[1]), dtype="float32")
+            appended = []
+            for vector, values in zip(vectors, new_values):
+                row = positions.get(vector["id"])
+                if row is None:
+                    positions[vector["id"]] = len(ids)
+                    ids.append(vector["id"])
+                    metadata.append(vector.get("metadata", {}))
+                    appended.append(values)
+                elif row < len(matrix):
+                    matrix[row] = values
+                    metadata[row] = vector.get("metadata", {})
+                else:
+                    appended[row - len(matrix)] = values
+                    metadata[row] = vector.get("metadata", {})
+            if appended:
+                matrix = np.vstack([matrix, np.asarray(appended, dtype="float32")])
+            self._state = (ids, metadata, matrix, None)
+            self._dirty = True
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids=None, delete_all=False, namespace=None):
+        with self._lock:
+            current_ids, metadata, matrix, search_index = self._state
+            if delete_all:
+                self._state = ([], [], None, None)
+            else:
+                drop = set(ids or [])
+                keep = [row for row, vec_id in enumerate(current_ids) if vec_id not in drop]
+                if len(keep) == len(current_ids):
+                    return {}
+                self._state = (
+                    [current_ids[row] for row in keep],
+                    [metadata[row] for row in keep],
+                    np.asarray(matrix)[keep],
+                    None
+                )
+            self._dirty = True
+        return {}
+
+    def fetch(self, ids, namespace=None):
+        current_ids, metadata, matrix, _ = self._state
+        positions = {vec_id: row for row, vec_id in enumerate(current_ids)}
+        return {
+            "vectors": {
+                vec_id: {
+                    "id": vec_id,
+                    "values": np.asarray(matrix[positions[vec_id]]).tolist(),
+                    "metadata": metadata[positions[vec_id]]
+                }
+                for vec_id in ids if vec_id in positions
+            }
+        }
+
+    def ids(self):
+        return list(self._state[0])
+
+    def query(self, vector, top_k=1, include_metadata=False, namespace=None, **kwargs):
+        return self.query_many([vector], top_k=top_k, include_metadata=include_metadata)[0]
+
+    def query_many(self, vectors, top_k=1, include_metadata=False, namespace=None):
+        ids, metadata, matrix, search_index = self._state
+        if not ids:
+            return [{"matches": []} for _ in vectors]
+        if search_index is None:
+            search_index = self._build_search_index(matrix)
+            with self._lock:
+                if self._state[2] is matrix:
+                    self._state = (ids, metadata, matrix, search_index)
+        queries = np.asarray(vectors, dtype="float32").reshape(len(vectors), -1)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        scores, rows = self._search(matrix, search_index, queries / np.where(norms == 0, 1, norms), top_k)
+        results = []
+        for query_scores, query_rows in zip(scores, rows):
+            matches = []
+            for score, row in zip(query_scores, query_rows):
+                if row < 0:
+                    continue
+                match = {"id": ids[row], "score": float(score)}
+                if include_metadata:
+                    match["metadata"] = metadata[row]
+                matches.append(match)
+            results.append({"matches": matches})
+        return results
+
+    def describe_index_stats(self):
+        ids, _, matrix, _ = self._state
+        return {
+            "dimension": int(matrix.shape[1]) if matrix is not None else 0,
+            "total_vector_count": len(ids)
+        }
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            ids, metadata, matrix, _ = self._state
+            os.makedirs(self.directory, exist_ok=True)
+            if matrix is None:
+                matrix = np.empty((0, 0), dtype="float32")
+            tmp_path = self.vectors_path + ".tmp.npy"
+            np.save(tmp_path, np.ascontiguousarray(matrix, dtype="float32"))
+            os.replace(tmp_path, self.vectors_path)
+            tmp_path = self.metadata_path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"ids": ids, "metadata": metadata, "encoder": self.encoder}, f)
+            os.replace(tmp_path, self.metadata_path)
+            if ids:
+                self._save_search_index(self._build_deployed_index(matrix))
+            self._dirty = False
+            self._load()
+
+
+class FaissVectorStore(NumpyVectorStore):
+    """
+    Same storage as NumpyVectorStore plus a serialized FAISS inner-product index
+    (index.faiss) that is reopened memory-mapped and read-only.
+
+    flush() writes an `index_type` index ("flat", "hnsw" or "ivfpq", see
+    rag_nomad_foods_ann_index.py). An approximate one is only written if its
+    recall@k against the exact index on `guardrail_queries` (a sample of the
+    stored vectors by default) reaches the floor; otherwise the exact index is
+    kept. The outcome is recorded in index_report.json.
+    """
+
+    def __init__(self, directory, index_type=None, guardrail_queries=None):
+        self.index_path = os.path.join(directory, "index.faiss")
+        self.report_path = os.path.join(directory, "index_report.json")
+        self.index_type = index_type or FAISS_INDEX_TYPE
+        self.guardrail_queries = guardrail_queries
+        super().__init__(directory)
+
+    def _open_search_index(self, vectors):
+        if not os.path.exists(self.index_path) or not len(vectors):
+            return None
+        # IO_FLAG_MMAP_IFC maps flat codes too (faiss >= 1.10); older builds only map IVF lists
+        mmap_flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+        return set_search_params(faiss.read_index(self.index_path, mmap_flag | faiss.IO_FLAG_READ_ONLY))
+
+    def _build_search_index(self, vectors):
+        return build_index(vectors, "flat")
+
+    def _build_deployed_index(self, vectors):
+        flat_index = self._build_search_index(vectors)
+        if self.index_type == "flat":
+            self._save_report({"index_type": "flat", "vectors": len(vectors)})
+            return flat_index
+        queries = self.guardrail_queries if self.guardrail_queries is not None else sample_queries(vectors)
+        try:
+            search_index, report = build_checked_index(vectors, queries, self.index_type, flat_index=flat_index)
+        except RecallBelowFloorError as e:
+            print(f"Not deploying the {self.index_type} index, keeping the exact one: {e}")
+            search_index, report = flat_index, {**e.report, "index_type": "flat", "refused": self.index_type}
+        except ValueError as e:
+            # e.g. too few vectors to train IVF-PQ
+            print(f"Could not build the {self.index_type} index, keeping the exact one: {e}")
+            search_index, report = flat_index, {"index_type": "flat", "refused": self.index_type, "reason": str(e)}
+        self._save_report(report)
+        return search_index
+
+    def _save_report(self, report):
+        tmp_path = self.report_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(report, f, indent=2)
+        os.replace(tmp_path, self.report_path)
+
+    def index_report(self):
+        """What the last flush() deployed: index type, recall@k, size in bytes, refused type if any"""
+        if not os.path.exists(self.report_path):
+            return {}
+        with open(self.report_path, "r") as f:
+            return json.load(f)
+
+    def rebuild_index(self):
+        """Rebuild and redeploy index.faiss from the stored vectors, e.g. after changing index_type"""
+        with self._lock:
+            self._dirty = True
+        self.flush()
+        return self.index_report()
+
+    def _save_search_index(self, search_index):
+        tmp_path = self.index_path + ".tmp"
+        faiss.write_index(search_index, tmp_path)
+        os.replace(tmp_path, self.index_path)
+
+    def _search(self, vectors, search_index, queries, top_k):
+        return search(search_index, queries, top_k, vectors)
+
+
+LOCAL_VECTOR_STORES = {
+    "numpy": NumpyVectorStore,
+    "faiss": FaissVectorStore
+}
+
+
+class EncoderMismatchError(Exception):
+    pass
+
+
+def check_index_encoder(store, name, dimension):
+    """
+    Raise EncoderMismatchError unless the store's vectors were written by
+    encoder `name` at `dimension`: queries from another encoder (int8 vs fp32,
+    a truncated dimension) would be compared with vectors from a different
+    embedding space. Stores from before the encoder was recorded were written by
+    the full-precision model; an empty store matches any encoder.
+    """
+    stats = store.describe_index_stats()
+    if not stats["total_vector_count"]:
+        return
+    written_by = store.encoder or MODEL_NAME
+    stored_dimension = stats.get("dimension") or dimension
+    if written_by != name or stored_dimension != dimension:
+        raise EncoderMismatchError(
+            f"The index holds {stored_dimension}-d vectors from {written_by}, but queries are encoded "
+            f"with {name} ({dimension}-d); re-index it with the configured encoder"
+        )
+
+
+def local_backend_name(store):
+    """"numpy" or "faiss" for a local store"""
+    return next(name for name, cls in LOCAL_VECTOR_STORES.items() if type(store) is cls)
+
+
+def open_local_vector_store(backend, directory):
+    """Open (or create) a local vector store of the given backend under `directory`"""
+    if backend not in LOCAL_VECTOR_STORES:
+        raise ValueError(f"Unknown vector backend '{backend}', expected one of {sorted(LOCAL_VECTOR_STORES)} or 'pinecone'")
+    return LOCAL_VECTOR_STORES[backend](os.path.join(directory, backend))
@@ -1,6 +1,7 @@
 # ─── streamlit_chatbot_rag_nomad_foods.py ────────────────────────────────────
 
 import os
+import requests
 import streamlit as st
 # ─── 0. Page config MUST be before any other st.* call ───────────────────────
 st.set_page_config(
@@ -9,25 +10,105 @@ st.set_page_config(
     layout="wide"
 )
 from dotenv import load_dotenv
-from rag_nomad_foods_chatbot import search_similar_question, generate_enhanced_answer
 from PIL import Image
+import threading
 import time
+from rag_nomad_foods_tracing import span
+from rag_nomad_foods_session import (
+    init_request_state, submit_query, next_pending, complete_request, fail_request,
+    completed_requests, record_feedback
+)
 
 
 
 # ─── 1. Load .env ───────────────────────────────────────────────────────────
 load_dotenv()
+# With RAG_SERVICE_URL set the UI is a thin client of rag_nomad_foods_service.py
+RAG_SERVICE_URL = os.getenv("RAG_SERVICE_URL")
+# Tenant used when the URL doesn't name one
+DEFAULT_TENANT = os.getenv("DEFAULT_TENANT") or None
+if RAG_SERVICE_URL:
+    import rag_nomad_foods_service_client as service_client
+else:
+    # Cheap to import: the model, the index and pinecone are only loaded by warm_up() or the first query
+    from rag_nomad_foods_chatbot import retrieve_faq, stream_cached_answer, get_answer_cache, is_ready, warm_up
 
 # ─── 2. Helper functions ────────────────────────────────────────────────────
+def current_tenant():
+    # ?tenant=<slug> in the page URL selects a brand / locale; without it the default index answers
+    return st.query_params.get("tenant") or DEFAULT_TENANT
+
 def chatbot(prompt):
-    api_key = os.environ["OPENROUTER_API_KEY"]
-    with st.spinner("🔍 Searching for relevant information..."):
-        faq = search_similar_question(prompt)
-        time.sleep(0.4)
-    with st.spinner("🤔 Generating enhanced response..."):
-        ans = generate_enhanced_answer(prompt, faq["answer"], api_key)
-        time.sleep(0.4)
-    return ans
+    with span("request", app="streamlit"):
+        return answer_with_stream(prompt, current_tenant())
+
+def answer_with_stream(prompt, tenant=None):
+    stream_timings = {}
+    start = time.perf_counter()
+    if RAG_SERVICE_URL:
+        # Retrieval and generation both happen in the service
+        token_stream = service_client.stream_answer(prompt, tenant=tenant)
+    else:
+        with st.spinner("🔍 Searching for relevant information..."):
+            faq = retrieve_faq(prompt, tenant)
+        token_stream = stream_cached_answer(prompt, faq, os.environ["OPENROUTER_API_KEY"])
+    # Render tokens as they arrive; the finished answer is shown in the history below
+    placeholder = st.empty()
+    with placeholder.container():
+        ans = st.write_stream(timed_stream(token_stream, start, stream_timings))
+    placeholder.empty()
+    timings = {
+        "time_to_first_token_s": stream_timings.get("first_token_s", 0.0),
+        "total_s": time.perf_counter() - start
+    }
+    return ans, timings
+
+def timed_stream(token_stream, start, timings):
+    for delta in token_stream:
+        timings.setdefault("first_token_s", time.perf_counter() - start)
+        yield delta
+
+# Seconds before a failed warm-up is tried again (on the next page render)
+WARM_UP_RETRY_SECONDS = 30
+
+@st.cache_resource(show_spinner=False)
+def warm_up_state():
+    # Shared by every session of this process
+    return {"lock": threading.Lock(), "thread": None, "error": None, "failed_at": None}
+
+def run_warm_up(state):
+    try:
+        warm_up()
+        state["error"] = None
+    except Exception as e:
+        state["error"], state["failed_at"] = repr(e), time.monotonic()
+        print(f"Warm-up failed, retrying in {WARM_UP_RETRY_SECONDS}s: {e!r}")
+
+def start_warm_up():
+    # Load the model and open the index in the background while the page renders: once per process,
+    # and again after a failed attempt
+    state = warm_up_state()
+    with state["lock"]:
+        thread = state["thread"]
+        if thread is not None and (thread.is_alive() or state["error"] is None):
+            return state
+        if state["error"] is not None and time.monotonic() - state["failed_at"] < WARM_UP_RETRY_SECONDS:
+            return state
+        state["thread"] = threading.Thread(target=run_warm_up, args=(state,), daemon=True)
+        state["thread"].start()
+    return state
+
+def backend_ready():
+    return service_client.is_ready() if RAG_SERVICE_URL else is_ready()
+
+def answer_cache_hit_rate():
+    # None when the service can't be reached; the metric is hidden then
+    if RAG_SERVICE_URL:
+        try:
+            return service_client.service_stats()["answer_cache"]["hit_rate"]
+        except requests.RequestException:
+            return None
+    return get_answer_cache().stats()["hit_rate"]
 
 def load_assets():
     try:
@@ -37,10 +118,7 @@ def load_assets():
         return None
 
 def initialize_session_state():
-    if "history" not in st.session_state:
-        st.session_state.history = []
-    if "feedback" not in st.session_state:
-        st.session_state.feedback = {}
+    init_request_state(st.session_state)
     if "user_query" not in st.session_state:
         st.session_state.user_query = ""
 
@@ -48,6 +126,8 @@ def initialize_session_state():
 def app():
 
     initialize_session_state()
+    if not RAG_SERVICE_URL:
+        start_warm_up()
     
     # Custom CSS
     st.markdown("""
@@ -87,7 +167,22 @@ def app():
         
         st.sidebar.markdown("---")
         st.sidebar.header("📊 Statistics")
-        st.sidebar.metric("Questions Asked", len(st.session_state.history))
+        warm_up_error = None if RAG_SERVICE_URL else warm_up_state()["error"]
+        if backend_ready():
+            st.sidebar.caption("🟢 Ready")
+        elif warm_up_error:
+            st.sidebar.error(f"Loading the model and the FAQ index failed, retrying: {warm_up_error}")
+        else:
+            st.sidebar.caption("⏳ Loading the model and the FAQ index...")
+        history = completed_requests(st.session_state)
+        st.sidebar.metric("Questions Asked", len(history))
+        hit_rate = answer_cache_hit_rate()
+        if hit_rate is not None:
+            st.sidebar.metric("Answer Cache Hit Rate", f"{hit_rate:.0%}")
+        if history:
+            last = history[-1]
+            st.sidebar.metric("Time to First Token", f"{last['time_to_first_token_s']:.2f}s")
+            st.sidebar.metric("Total Response Time", f"{last['total_s']:.2f}s")
         
         st.sidebar.markdown("---")
         st.sidebar.header("ℹ️ About")
@@ -127,14 +222,23 @@ def app():
         # Update text input value based on the selected sample question
         user_query = st.text_input("", placeholder="Type your question here please...", value=st.session_state.user_query, key="user_input")
 
-        if user_query:
-            response = chatbot(user_query)
-            st.session_state.history.append({"query": user_query, "response": response})
+        # Only a newly submitted query runs the pipeline; other reruns reuse the stored results
+        submit_query(st.session_state, user_query)
+        query_id = next_pending(st.session_state)
+        if query_id:
+            try:
+                response, timings = chatbot(st.session_state.requests[query_id]["query"])
+                complete_request(st.session_state, query_id, response=response, **timings)
+            except Exception as e:
+                fail_request(st.session_state, query_id, e)
+                st.error(f"Sorry, something went wrong while answering: {e}. Press Enter to try again.")
 
         # Display conversation history
-        if st.session_state.history:
+        history = completed_requests(st.session_state)
+        if history:
             st.markdown("### 💬 Conversation History")
-            for i, interaction in enumerate(reversed(st.session_state.history), 1):
+            for interaction in reversed(history):
+                query_id = interaction['query_id']
                 # User message
                 st.markdown(f"""
                     <div class='chat-message user-message'>
@@ -154,14 +258,13 @@ def app():
                 # Feedback buttons
                 col1, col2 = st.columns([1, 5])
                 with col1:
-                    if f"thumbs_up_{i}" not in st.session_state.feedback:
-                        if st.button("👍", key=f"up_{i}"):
-                            st.session_state.feedback[f"thumbs_up_{i}"] = True
+                    if interaction['feedback'] is None:
+                        if st.button("👍", key=f"up_{query_id}"):
+                            record_feedback(st.session_state, query_id, "up")
                             st.success("Thanks for your feedback!")
-                    
-                    if f"thumbs_down_{i}" not in st.session_state.feedback:
-                        if st.button("👎", key=f"down_{i}"):
-                            st.session_state.feedback[f"thumbs_down_{i}"] = True
+
+                        if st.button("👎", key=f"down_{query_id}"):
+                            record_feedback(st.session_state, query_id, "down")
                             st.error("Sorry for the inconvenience. We'll improve!")
 
         # Footer
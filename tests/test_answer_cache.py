@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from rag_nomad_foods_answer_cache import InProcessAnswerStore, SQLiteAnswerStore, SemanticAnswerCache, cache_key
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def cache(request, tmp_path):
+    store = InProcessAnswerStore() if request.param == "memory" else SQLiteAnswerStore(str(tmp_path / "cache.sqlite"))
+    return SemanticAnswerCache(store, threshold=0.9, ttl_seconds=3600, max_entries=3)
+
+
+def vector(*values):
+    return np.array(values, dtype="float32")
+
+
+def test_a_close_paraphrase_hits(cache):
+    cache.store_answer("doc", vector(1, 0), "context", "answer")
+    assert cache.lookup("doc", vector(1, 0.1), "context") == "answer"
+    assert cache.lookup("doc", vector(0, 1), "context") is None
+    assert cache.lookup("other", vector(1, 0), "context") is None
+
+
+def test_an_edited_faq_answer_drops_the_entry(cache):
+    cache.store_answer("doc", vector(1, 0), "old context", "answer")
+    assert cache.lookup("doc", vector(1, 0), "new context") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_invalidate_only_drops_that_document(cache):
+    cache.store_answer("doc", vector(1, 0), "context", "a")
+    cache.store_answer("doc", vector(0, 1), "context", "b")
+    cache.store_answer("other", vector(1, 0), "context", "c")
+    cache.invalidate("doc")
+    assert cache.lookup("doc", vector(1, 0), "context") is None
+    assert cache.lookup("other", vector(1, 0), "context") == "c"
+
+
+def test_the_least_recently_used_entries_are_evicted(cache):
+    for i, doc_id in enumerate(["a", "b", "c"]):
+        cache.store.put(doc_id, vector(1, 0), doc_id, "f4d4", 100 + i)
+    cache.store.touch(cache.store.entries("a")[0][0], 200)
+    cache.store.put("d", vector(1, 0), "d", "f4d4", 300)
+    cache.store.evict_least_recently_used(cache.store.count() - cache.max_entries)
+    assert [doc_id for doc_id in "abcd" if cache.store.entries(doc_id)] == ["a", "c", "d"]
+
+
+def test_tenants_have_their_own_entries(cache):
+    cache.store_answer(cache_key("doc", "birds-eye"), vector(1, 0), "context", "tenant answer")
+    assert cache.lookup(cache_key("doc"), vector(1, 0), "context") is None
+    assert cache.lookup(cache_key("doc", "birds-eye"), vector(1, 0), "context") == "tenant answer"
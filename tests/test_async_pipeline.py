@@ -0,0 +1,61 @@
+import asyncio
+import numpy as np
+from rag_nomad_foods_answer_cache import SemanticAnswerCache
+from rag_nomad_foods_async_pipeline import AsyncAnswerPipeline
+from rag_nomad_foods_chatbot import NO_MATCH_ANSWER
+
+
+class FakeLLM:
+    def __init__(self):
+        self.messages = []
+
+    async def chat(self, messages, model, max_tokens, temperature, usage=None):
+        self.messages.append(messages)
+        if "fail" in messages[1]:
+            raise RuntimeError("provider error")
+        return f"answer from {messages[0]}"
+
+    async def aclose(self):
+        pass
+
+
+async def retrieve(query, tenant=None):
+    if query == "nothing":
+        return None
+    return {"id": "doc", "answer": "faq answer", "query_vector": np.ones(4, dtype="float32"), "tenant": tenant}
+
+
+def build_messages(query, context, company_name):
+    return [company_name, query]
+
+
+def pipeline(llm, cache=None):
+    return AsyncAnswerPipeline(retrieve, build_messages, llm, "model", answer_cache=cache,
+                               company_name_for=lambda tenant: f"brand of {tenant}" if tenant else "NomadFoods")
+
+
+def test_the_tenant_reaches_retrieval_and_the_prompt():
+    llm = FakeLLM()
+    result = asyncio.run(pipeline(llm).answer("q", tenant="birds-eye"))
+    assert result["answer"] == "answer from brand of birds-eye"
+    assert llm.messages == [["brand of birds-eye", "q"]]
+
+
+def test_cached_answers_are_kept_per_tenant():
+    cache = SemanticAnswerCache()
+    llm = FakeLLM()
+
+    async def run():
+        answer = pipeline(llm, cache).answer
+        return [await answer("q"), await answer("q", tenant="birds-eye"), await answer("q", tenant="birds-eye")]
+
+    default, tenant, tenant_again = asyncio.run(run())
+    assert not default["cached"] and not tenant["cached"] and tenant_again["cached"]
+    assert tenant_again["answer"] == "answer from brand of birds-eye"
+
+
+def test_no_match_and_failures_are_reported_per_query():
+    results = asyncio.run(pipeline(FakeLLM()).answer_many(["q", "nothing", "fail"], tenant="birds-eye"))
+    assert results[0]["answer"] == "answer from brand of birds-eye"
+    assert results[1]["answer"] == NO_MATCH_ANSWER
+    assert results[2]["answer"] is None and "provider error" in results[2]["error"]
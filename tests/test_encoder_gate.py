@@ -0,0 +1,41 @@
+import json
+import pytest
+import rag_nomad_foods_encoder as encoder
+
+NAME = encoder.encoder_name("sentence-transformers", 256)
+
+
+@pytest.fixture
+def agreement_file(tmp_path, monkeypatch):
+    # ENCODER_AGREEMENT_FILE is relative; build_encoder would load the real model
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(encoder, "build_encoder", lambda backend, dimension: "encoder")
+
+    def write(agreement, floor):
+        with open(encoder.ENCODER_AGREEMENT_FILE, "w") as f:
+            json.dump({NAME: {"k": 5, "agreement": agreement, "floor": floor}}, f)
+
+    return write
+
+
+def test_the_reference_encoder_needs_no_check(agreement_file):
+    assert encoder.load_encoder("sentence-transformers", encoder.DIMENSION) == "encoder"
+
+
+def test_an_unchecked_encoder_is_refused(agreement_file):
+    with pytest.raises(encoder.EncoderAgreementError, match="has not been checked"):
+        encoder.load_encoder("sentence-transformers", 256)
+
+
+def test_agreement_at_the_floor_passes(agreement_file):
+    agreement_file(0.9, 0.9)
+    assert encoder.load_encoder("sentence-transformers", 256, floor=0.9) == "encoder"
+
+
+def test_the_configured_floor_applies_not_the_one_the_check_ran_with(agreement_file, monkeypatch):
+    # A check run with --floor 0 doesn't disable the gate
+    agreement_file(0.5, 0.0)
+    monkeypatch.setattr(encoder, "ENCODER_AGREEMENT_FLOOR", 0.9)
+    with pytest.raises(encoder.EncoderAgreementError, match="below the floor of 0.9"):
+        encoder.load_encoder("sentence-transformers", 256)
+    assert encoder.load_encoder("sentence-transformers", 256, floor=0.4) == "encoder"
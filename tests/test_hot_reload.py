@@ -0,0 +1,75 @@
+import json
+import os
+import numpy as np
+import pytest
+from rag_nomad_foods_embedding_cache import EmbeddingCache
+from rag_nomad_foods_hot_reload import build_local_snapshot, prune_snapshots
+
+
+def make_snapshots(directory, names_by_age):
+    """Snapshot directories, the first one the oldest"""
+    snapshots = directory / "snapshots"
+    for age, name in enumerate(names_by_age):
+        (snapshots / name).mkdir(parents=True)
+        os.utime(snapshots / name, (1000 + age, 1000 + age))
+    return snapshots
+
+
+def remaining(snapshots):
+    return sorted(name for name in os.listdir(snapshots) if not name.endswith(".lock"))
+
+
+def test_prune_keeps_the_newest(tmp_path):
+    snapshots = make_snapshots(tmp_path, ["a", "b", "c", "d"])
+    prune_snapshots(tmp_path, keep=2)
+    assert remaining(snapshots) == ["c", "d"]
+
+
+def test_prune_never_removes_the_current_snapshot(tmp_path):
+    snapshots = make_snapshots(tmp_path, ["current", "b", "c", "d"])
+    prune_snapshots(tmp_path, keep=2, current="current")
+    assert remaining(snapshots) == ["current", "d"]
+
+
+def test_prune_skips_temporary_build_directories(tmp_path):
+    snapshots = make_snapshots(tmp_path, ["a.tmp-123", "b", "c", "d"])
+    prune_snapshots(tmp_path, keep=1)
+    assert remaining(snapshots) == ["a.tmp-123", "d"]
+
+
+class FakeModel:
+    def encode(self, texts, batch_size=32, **kwargs):
+        return np.array([[len(text), 1.0, 0.0, 0.0] for text in texts], dtype="float32")
+
+
+def faq(answer):
+    return {"faq_data": [{"category": "c", "questions": [{"question": "q", "answer": answer}]}]}
+
+
+@pytest.fixture
+def encoder(tmp_path):
+    return EmbeddingCache(FakeModel(), "fake", cache_dir=str(tmp_path / "cache"))
+
+
+def test_a_reused_snapshot_becomes_the_newest(tmp_path, encoder):
+    # v1 -> v2 -> back to v1: v1's directory is reused and must survive the next prune
+    build_local_snapshot("numpy", tmp_path, encoder, faq("v1"), "v1")
+    build_local_snapshot("numpy", tmp_path, encoder, faq("v2"), "v2")
+    snapshots = tmp_path / "snapshots"
+    os.utime(snapshots / "v1", (1000, 1000))
+    os.utime(snapshots / "v2", (2000, 2000))
+    store = build_local_snapshot("numpy", tmp_path, encoder, faq("v1"), "v1")
+    build_local_snapshot("numpy", tmp_path, encoder, faq("v3"), "v3")
+    os.utime(snapshots / "v3", (1500, 1500))
+    # No `current`: v1 has to be kept on its mtime alone
+    prune_snapshots(tmp_path, keep=2)
+    assert remaining(snapshots) == ["v1", "v2"]
+    document = store.documents.get(store.ids()[0])
+    assert document["answer"] == "v1"
+
+
+def test_the_snapshot_is_complete_when_opened(tmp_path, encoder):
+    store = build_local_snapshot("numpy", tmp_path, encoder, faq("v1"), "v1")
+    assert store.describe_index_stats()["total_vector_count"] == 1
+    with open(tmp_path / "snapshots" / "v1" / "numpy" / "metadata.json") as f:
+        assert len(json.load(f)["ids"]) == 1
@@ -0,0 +1,90 @@
+import http.client
+import json
+import threading
+import pytest
+import rag_nomad_foods_service as service
+
+
+class FakeAnswerService:
+    """Stands in for AnswerService: no model, no index; "boom" fails inside the pipeline"""
+
+    def __init__(self):
+        self.pool = service.WorkerPool(workers=2, queue_limit=8)
+        self.ready = threading.Event()
+        self.ready.set()
+        self.warmup_error = None
+
+    def warm_up(self):
+        pass
+
+    def search(self, query, top_k=5, tenant=None):
+        return [{"id": "1", "score": 1.0, "question": query, "answer": "a"}][:top_k]
+
+    def answer(self, query, tenant=None):
+        if query == "boom":
+            # e.g. a provider response without "choices"
+            raise KeyError("choices")
+        return {"query": query, "answer": f"answer to {query}", "faq": None}
+
+
+@pytest.fixture
+def server():
+    server = service.serve("127.0.0.1", 0, FakeAnswerService())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(server, path, body):
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+    data = body if isinstance(body, bytes) else json.dumps(body).encode()
+    connection.request("POST", path, data, {"Content-Type": "application/json"})
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+@pytest.mark.parametrize("path, body", [
+    ("/answer", {}),
+    ("/answer", {"query": 3}),
+    ("/answer", {"query": "   "}),
+    ("/answer", {"query": "hi", "tenant": "Not A Slug"}),
+    ("/answer", [1, 2]),
+    ("/answer", b"{not json"),
+    ("/search", {"query": "hi", "top_k": "5"}),
+    ("/search", {"query": "hi", "top_k": 0}),
+    ("/answer/batch", {"queries": "abc"}),
+    ("/answer/batch", {"queries": []}),
+    ("/answer/batch", {"queries": ["ok", 1]}),
+    ("/answer/batch", {"queries": ["q"] * (service.SERVICE_MAX_BATCH + 1)}),
+])
+def test_invalid_requests_get_400(server, path, body):
+    status, response = post(server, path, body)
+    assert status == 400
+    assert response["error"].startswith("Bad request")
+
+
+def test_pipeline_errors_get_500_even_when_they_are_key_errors(server):
+    status, response = post(server, "/answer", {"query": "boom"})
+    assert status == 500
+    assert "choices" in response["error"]
+
+
+def test_answer(server):
+    status, response = post(server, "/answer", {"query": "hi"})
+    assert status == 200
+    assert response["answer"] == "answer to hi"
+
+
+def test_batch_reports_failures_per_query(server):
+    status, response = post(server, "/answer/batch", {"queries": ["a", "boom", "b"]})
+    assert status == 200
+    first, failed, last = response["results"]
+    assert first["answer"] == "answer to a"
+    assert failed["query"] == "boom" and failed["answer"] is None and "choices" in failed["error"]
+    assert last["answer"] == "answer to b"
+
+
+def test_batch_releases_its_pool_slots(server):
+    post(server, "/answer/batch", {"queries": ["a", "boom"]})
+    assert server.RequestHandlerClass.service.pool.accepted == 0
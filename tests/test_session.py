@@ -0,0 +1,65 @@
+import pytest
+from rag_nomad_foods_session import (
+    complete_request, completed_requests, fail_request, init_request_state, next_pending, record_feedback,
+    submit_query
+)
+
+
+@pytest.fixture
+def state():
+    state = {}
+    init_request_state(state)
+    return state
+
+
+def test_a_query_runs_once_across_reruns(state):
+    query_id = submit_query(state, "  Do you ship abroad? ")
+    assert state["requests"][query_id]["query"] == "Do you ship abroad?"
+    assert next_pending(state) == query_id
+    complete_request(state, query_id, response="Yes")
+    # Reruns with the same text input value (feedback clicks, ...) don't submit it again
+    assert submit_query(state, "Do you ship abroad?") is None
+    assert next_pending(state) is None
+    assert [r["response"] for r in completed_requests(state)] == ["Yes"]
+
+
+def test_empty_queries_are_ignored(state):
+    assert submit_query(state, "") is None
+    assert submit_query(state, "   ") is None
+    assert submit_query(state, None) is None
+    assert state["requests"] == {}
+
+
+def test_a_pending_query_is_not_submitted_twice(state):
+    query_id = submit_query(state, "q")
+    assert submit_query(state, "q") is None
+    assert next_pending(state) == query_id
+
+
+def test_a_failed_query_can_be_resubmitted(state):
+    failed_id = submit_query(state, "q")
+    fail_request(state, failed_id, RuntimeError("LLM down"))
+    assert state["requests"][failed_id]["status"] == "failed"
+    assert state["requests"][failed_id]["error"] == "LLM down"
+    assert completed_requests(state) == []
+
+    retry_id = submit_query(state, "q")
+    assert retry_id not in (None, failed_id)
+    assert next_pending(state) == retry_id
+    complete_request(state, retry_id, response="answer")
+    assert submit_query(state, "q") is None
+    assert [r["query_id"] for r in completed_requests(state)] == [retry_id]
+
+
+def test_a_new_query_after_a_failure(state):
+    fail_request(state, submit_query(state, "q1"), "boom")
+    assert submit_query(state, "q2") is not None
+    assert submit_query(state, "q1") is not None
+
+
+def test_feedback_is_recorded_once(state):
+    query_id = submit_query(state, "q")
+    complete_request(state, query_id, response="a")
+    assert record_feedback(state, query_id, "up")
+    assert not record_feedback(state, query_id, "down")
+    assert state["requests"][query_id]["feedback"] == "up"
@@ -0,0 +1,59 @@
+import os
+import pytest
+from rag_nomad_foods_doc_store import build_document_store
+from rag_nomad_foods_tenants import (
+    LocalTenantIndexes, UnknownTenantError, tenant_directory, tenant_id, validate_tenant
+)
+from rag_nomad_foods_vector_store import open_local_vector_store
+
+
+def ingest(directory, tenant, answer, rows=1):
+    path = tenant_directory(str(directory), tenant)
+    store = open_local_vector_store("numpy", path)
+    store.upsert([{"id": f"{tenant}-{i}", "values": [1.0, float(i), 0.0, 0.0]} for i in range(rows)])
+    store.flush()
+    build_document_store(
+        [{"id": f"{tenant}-{i}", "category": "c", "question": "q", "answer": answer} for i in range(rows)], path
+    )
+
+
+def test_tenant_ids_are_slugs():
+    assert tenant_id({"company_name": "Birds Eye Ltd."}, "en-GB") == "birds-eye-ltd-en-gb"
+    with pytest.raises(ValueError):
+        validate_tenant("../default")
+
+
+def test_unknown_tenants_are_refused(tmp_path):
+    with pytest.raises(UnknownTenantError):
+        LocalTenantIndexes("numpy", str(tmp_path)).get("nobody")
+
+
+def test_least_recently_used_tenants_are_closed_first(tmp_path):
+    for tenant in ("a", "b", "c"):
+        ingest(tmp_path, tenant, tenant)
+    probe = LocalTenantIndexes("numpy", str(tmp_path))
+    probe.get("a")
+    # Room for two tenants
+    tenants = LocalTenantIndexes("numpy", str(tmp_path), max_bytes=2 * probe.stats()["loaded_mb"] * 1024 * 1024)
+    a = tenants.get("a")
+    tenants.get("b")
+    assert tenants.get("a") is a
+    # b is now the least recently used one
+    tenants.get("c")
+    assert tenants.stats()["evictions"] == 1
+    assert tenants.get("a") is a
+    assert tenants.stats()["misses"] == 3
+    tenants.get("b")
+    assert tenants.stats()["misses"] == 4
+    assert tenants.stats()["loaded"] == 2
+
+
+def test_a_reingested_tenant_is_reopened(tmp_path):
+    ingest(tmp_path, "a", "old")
+    tenants = LocalTenantIndexes("numpy", str(tmp_path))
+    store = tenants.get("a")
+    assert store.documents.get("a-0")["answer"] == "old"
+    ingest(tmp_path, "a", "new")
+    documents = os.path.join(tenant_directory(str(tmp_path), "a"), "documents.bin")
+    os.utime(documents, ns=(os.stat(documents).st_mtime_ns + 1, os.stat(documents).st_mtime_ns + 1))
+    assert tenants.get("a").documents.get("a-0")["answer"] == "new"